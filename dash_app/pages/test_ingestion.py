@@ -6,9 +6,9 @@ from dash import html, dcc, callback, Input, Output, State, MATCH
 from dash.exceptions import PreventUpdate
 
 from dash_app.utils.ingestion_request import ingestion_request
-from dash_app.utils.merge_tree_deltas import merge_tree_deltas
 from dash_app.utils.render_tree import render_tree, render_tree_keys
 from dash_app.utils.result_query import result_query
+from utils.merge_tree_deltas import merge_tree_deltas
 
 dash.register_page(__name__, path="/test")
 
@@ -119,8 +119,8 @@ def return_query(_, task_id, index, tree):
     if not task_id:
         raise PreventUpdate
 
-    # Get new data and update meta information
-    request = result_query(task_id)
+    # Get deltas added since the last poll and update meta information
+    request = result_query(task_id, since=index)
     status = request.get("status")
     
     continue_polling = False
@@ -134,11 +134,10 @@ def return_query(_, task_id, index, tree):
 
         return [f"Error in fetching data: {error}"], polling_disabled, index, tree
 
-    deltas = request["data"]
+    deltas = request.get("data", [])
     if deltas:
-        new_deltas = deltas[index:]
-        new_index = len(deltas)
-        new_tree = merge_tree_deltas(tree, new_deltas)
+        new_index = request.get("next_cursor", index + len(deltas))
+        new_tree = merge_tree_deltas(tree, deltas)
         html_tree = render_tree_keys(new_tree)
 
         if status == "in_progress":
@@ -147,5 +146,9 @@ def return_query(_, task_id, index, tree):
         if status == "success":
             return html_tree, polling_disabled, new_index, new_tree
 
+    # Finished with every delta already merged by earlier polls
+    if status == "success":
+        return render_tree_keys(tree), polling_disabled, index, tree
+
     return [f"Status: {status}"], continue_polling, index, tree
 """
\ No newline at end of file
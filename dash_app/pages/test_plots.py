@@ -7,9 +7,10 @@ from dash.exceptions import PreventUpdate
 
 from dash_app.utils.build_figures import build_market_figure
 from dash_app.utils.ingestion_request import ingestion_request
-from dash_app.utils.merge_tree_deltas import merge_tree_deltas
 from dash_app.utils.render_tree import render_tree_keys
-from dash_app.utils.result_query import result_query
+from dash_app.utils.result_query import result_tree
+from dash_app.utils.task_stream import drain_task_stream
+from utils.merge_tree_deltas import merge_tree_deltas
 
 dash.register_page(__name__, path="/test-plots")
 
@@ -134,9 +135,8 @@ def return_query(_, task_id, index, tree):
     if not task_id:
         raise PreventUpdate
 
-    # Get new data and update meta information
-    request = result_query(task_id)
-    status = request.get("status")
+    # Deltas pushed by the task's event stream past the ones already merged, read from memory rather than the api
+    status, deltas, error = drain_task_stream(task_id, index)
     
     continue_polling = False
     polling_disabled = True
@@ -145,28 +145,26 @@ def return_query(_, task_id, index, tree):
         return dash.no_update, continue_polling, index, tree
 
     if status == "failure":
-        error = request.get("error", "Unknown error")
+        return [f"Error in fetching data: {error or 'Unknown error'}"], polling_disabled, index, tree
 
-        return [f"Error in fetching data: {error}"], polling_disabled, index, tree
+    if status == "success":
+        # The tree the api materialized on completion replaces the one merged so far, no final merge here
+        result = result_tree(task_id)
+        if result["status"] == "success":
+            return ["Completed Successfully"], polling_disabled, index + len(deltas), result["data"]
 
-    if status == "complete":
-        error = request.get("error", "Unknown error")
+        # Finished without a single delta
+        if not index and not deltas:
+            return [f"Search complete, no markets available for this keyword"], polling_disabled, index, tree
 
-        return [f"Search complete, no markets available for this keyword"], polling_disabled, index, tree
+        return ["Completed Successfully"], polling_disabled, index + len(deltas), merge_tree_deltas(tree, deltas)
 
-    deltas = request["data"]
-    
     if deltas:
-        new_deltas = deltas[index:]
-        new_index = len(deltas)
-        new_tree = merge_tree_deltas(tree, new_deltas)
-        
+        new_index = index + len(deltas)
+        new_tree = merge_tree_deltas(tree, deltas)
 
         if status == "in_progress":
             return ["New Data Added"], continue_polling, new_index, new_tree
-        
-        if status == "success":
-            return ["Completed Successfully"], polling_disabled, new_index, new_tree
 
     return [f"Status: {status}"], continue_polling, index, tree
 
@@ -1,7 +1,7 @@
-from datetime import datetime
-
 import plotly.graph_objects as go
 
+from utils.history_codec import unpack_history
+
 
 def build_market_figure(market_data):
     fig = go.Figure()#config={"displayModeBar":False})
@@ -13,19 +13,24 @@ def build_market_figure(market_data):
         no_history = no_data.get("history",[])
         if no_history:
             
-            no_price = [price*100 for price in no_history["p"]]
-            no_dates = [datetime.fromtimestamp(ts) for ts in no_history["t"]]
+            no_ts, no_p = unpack_history(no_history)
+            no_price = no_p * 100
+            no_dates = no_ts.astype("datetime64[s]")
+
+            # Series derived as 1 - Yes are drawn dotted
+            no_dash = "dot" if no_data.get("derived") else "solid"
 
             fig.add_trace(
-                go.Scatter(x=no_dates,y=no_price,name="No",mode="lines",line_color="firebrick")
+                go.Scatter(x=no_dates,y=no_price,name="No",mode="lines",line_color="firebrick",line_dash=no_dash)
             )
 
     if yes_data:
         yes_history = yes_data.get("history",[])
         if yes_history:
 
-            yes_price = [price*100 for price in yes_history["p"]]
-            yes_dates = [datetime.fromtimestamp(ts) for ts in yes_history["t"]]
+            yes_ts, yes_p = unpack_history(yes_history)
+            yes_price = yes_p * 100
+            yes_dates = yes_ts.astype("datetime64[s]")
 
             fig.add_trace(
                 go.Scatter(x=yes_dates,y=yes_price,name="Yes",mode="lines",line_color="darkgreen")#, template="simple_white")
@@ -3,12 +3,23 @@ from typing import Dict, Tuple
 
 from utils.config import FASTAPI_BASE_URL
 
-def result_query(task_id: str) -> Dict:
+def result_query(task_id: str, since: int = 0) -> Dict:
     
-    results = requests.get(f"{FASTAPI_BASE_URL}/ingestion/{task_id}")
+    # Only deltas from index since on are returned, the response's next_cursor is the since of the next poll
+    results = requests.get(f"{FASTAPI_BASE_URL}/ingestion/{task_id}", params={"since": since})
     
     results.raise_for_status()
 
     results = results.json()
     
     return results
+
+def result_tree(task_id: str) -> Dict:
+
+    # The tree materialized when the task completed, a 404 body carries the status of a task that has not
+    results = requests.get(f"{FASTAPI_BASE_URL}/ingestion/{task_id}/tree")
+
+    if results.status_code != 404:
+        results.raise_for_status()
+
+    return results.json()
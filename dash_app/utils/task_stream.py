@@ -0,0 +1,133 @@
+"""
+Follow an ingestion task's event stream in a background thread. Page callbacks read the deltas received so far from
+memory instead of polling the api, and a dropped connection resumes after the last event received.
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+from utils.config import FASTAPI_BASE_URL
+
+FINAL_STATUSES = ("success", "failure")
+
+# A stream no callback has read for this long belongs to a closed page and is dropped
+TASK_STREAM_IDLE_SECONDS = float(os.getenv("TASK_STREAM_IDLE_SECONDS", 300))
+# Streams of tasks still not finished after this long are reported as failed
+TASK_STREAM_MAX_SECONDS = float(os.getenv("TASK_STREAM_MAX_SECONDS", 3600))
+
+def parse_sse(lines):
+    """
+    Yield (id, event, data) for each server-sent event in an iterable of lines
+    """
+
+    event_id, event, data = None, "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event_id, event, "\n".join(data)
+            event, data = "message", []
+            continue
+        if line.startswith(":"):
+            continue
+
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "id":
+            event_id = value
+        elif field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+
+class TaskStream:
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.last_event_id = "0"
+        self.status = "pending"
+        self.error = None
+
+        self._deltas = []
+        self._started = time.monotonic()
+        self._last_read = self._started
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def read(self, since: int = 0) -> tuple[str, list, str | None]:
+        """
+        Return the status, the deltas received from index since on and the error if the task failed. Reads do not
+        consume deltas, deduplicated requests share one task between callbacks
+        """
+        with self._lock:
+            self._last_read = time.monotonic()
+            return self.status, self._deltas[since:], self.error
+
+    def idle(self) -> bool:
+        return time.monotonic() - self._last_read > TASK_STREAM_IDLE_SECONDS
+
+    def _expired(self) -> bool:
+        return self.idle() or time.monotonic() - self._started > TASK_STREAM_MAX_SECONDS
+
+    def _lines(self, response):
+        # Keepalives arrive as lines too, so an expired stream stops within one keepalive interval
+        for line in response.iter_lines(decode_unicode=True):
+            if self._expired():
+                return
+            yield line
+
+    def _run(self):
+        url = f"{FASTAPI_BASE_URL}/ingestion/{self.task_id}/stream"
+        while self.status not in FINAL_STATUSES and not self._expired():
+            try:
+                # Read timeout well above the server's keepalive interval
+                with requests.get(url, params={"last_event_id": self.last_event_id}, stream=True, timeout=(5, 60)) as response:
+                    response.raise_for_status()
+                    for event_id, event, data in parse_sse(self._lines(response)):
+                        self._handle(event_id, event, json.loads(data))
+            except requests.RequestException:
+                time.sleep(1)
+
+        # An idle stream is simply dropped, one that ran out of time reports it to the page still reading it
+        if self.status not in FINAL_STATUSES and not self.idle():
+            with self._lock:
+                self.status = "failure"
+                self.error = f"Task {self.task_id} did not finish within {TASK_STREAM_MAX_SECONDS:.0f} seconds"
+
+    def _handle(self, event_id: str | None, event: str, data: dict):
+        with self._lock:
+            if event == "delta":
+                self._deltas.append(data)
+            elif event == "status":
+                self.status = data["status"]
+                self.error = data.get("error")
+            if event_id is not None:
+                self.last_event_id = event_id
+
+_streams: dict[str, TaskStream] = {}
+_streams_lock = threading.Lock()
+
+def get_task_stream(task_id: str) -> TaskStream:
+    with _streams_lock:
+        # Streams whose thread has ended and that nobody read since, including finished ones never drained
+        for stale_id in [t for t, stream in _streams.items() if stream.idle() and not stream._thread.is_alive()]:
+            del _streams[stale_id]
+
+        if task_id not in _streams:
+            _streams[task_id] = TaskStream(task_id)
+        return _streams[task_id]
+
+def drain_task_stream(task_id: str, since: int = 0) -> tuple[str, list, str | None]:
+    """
+    Read a task's stream from delta index since on, starting it on first use and forgetting it once the task has
+    finished. A forgotten stream is replayed from the start when read again
+    """
+
+    status, deltas, error = get_task_stream(task_id).read(since)
+    if status in FINAL_STATUSES:
+        with _streams_lock:
+            _streams.pop(task_id, None)
+    return status, deltas, error
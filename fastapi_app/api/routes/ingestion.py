@@ -1,15 +1,26 @@
 import json
+import uuid
 import zlib
+from typing import Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from celery.result import AsyncResult
 
 from fastapi_app.core.celery_app import celery_app
+from fastapi_app.core.response_cache import response_cache
 from fastapi_app.repositories.async_repository import AsyncIngestionRepository
-from fastapi_app.tasks.ingestion import start_ingestion
-from fastapi_app.schemas.ingestion import IngestionRequest
+from fastapi_app.repositories.job_repository import AsyncJobRepository
+from fastapi_app.tasks.ingestion import fetch_deferred_histories, start_ingestion
+from fastapi_app.schemas.ingestion import BatchStatusRequest, DeferredHistoryRequest, IngestionRequest
+from fastapi_app.services.job_runner import INGESTION_EXECUTOR, deferred_job, ingestion_job
+from fastapi_app.services.request_dedup import submit_deduplicated
+from fastapi_app.services.task_stream import STATUS_NAMES, stream_repository, stream_subscribers, task_events
+from utils.codecs import negotiate_wire_encoding
+from utils.history_codec import history_to_lists, map_histories
 
 redis_repository = AsyncIngestionRepository()
+job_repository = AsyncJobRepository(redis_repository.redis)
 
 router = APIRouter(
     prefix="/ingestion",
@@ -20,45 +31,235 @@ router = APIRouter(
 @router.post("/")
 async def ingestor(req : IngestionRequest):
     # Serialize req model and send to ingestion task, mode=json to handle nested classes
-    task = start_ingestion.delay(req.model_dump(mode="json")) # type: ignore[attr-defined]
-    return {"status": "queued", "task_id": task.id}
+    payload = req.model_dump(mode="json")
 
-# Check ingestion task
+    async def enqueue(task_id: str):
+        if INGESTION_EXECUTOR == "stream":
+            await job_repository.enqueue(ingestion_job(task_id, payload))
+        else:
+            start_ingestion.apply_async(args=[payload], task_id=task_id) # type: ignore[attr-defined]
+
+    # An identical request submitted within the dedup window gets its task back instead of a new fan-out
+    task_id, deduplicated = await submit_deduplicated(redis_repository, payload, enqueue)
+    return {"status": "queued", "task_id": task_id, "deduplicated": deduplicated}
+
+# Fetch histories a keyword search returned metadata only, polled like any other ingestion task
+@router.post("/{task_id}/deferred")
+async def fetch_deferred(task_id: str, req: DeferredHistoryRequest):
+    deferred_task_id = str(uuid.uuid4())
+    await redis_repository.set_celery_state(deferred_task_id, "QUEUED", only_new=True)
+
+    if INGESTION_EXECUTOR == "stream":
+        await job_repository.enqueue(deferred_job(deferred_task_id, task_id, req.token_ids))
+    else:
+        fetch_deferred_histories.apply_async(args=[task_id, req.token_ids], task_id=deferred_task_id) # type: ignore[attr-defined]
+    return {"status": "queued", "task_id": deferred_task_id}
+
+async def present_deltas(data: list, history: str) -> list:
+    data = await redis_repository.resolve_histories(data)
+    if history == "json":
+        data = map_histories(data, history_to_lists)
+    return data
+
+# Celery states mirrored by the api and worker, as reported to clients
+CELERY_STATE_NAMES = {"QUEUED": "pending", "STARTED": "started", "SUCCESS": "success", "FAILURE": "failure"}
+
+def status_response(load_status: str, celery_state: str | None, error: str | None, data: list, since: int) -> dict | None:
+    """
+    Response to a status poll, None when neither a loading status nor a mirrored celery state is known
+    """
+
+    if load_status == "IN_PROGRESS":
+        return {"status": "in_progress", "data": data, "next_cursor": since + len(data)}
+    elif load_status == "COMPLETE":
+        # A client past the first delta already has markets, nothing new is still a success
+        if data or since:
+            return {"status": "success", "data": data, "next_cursor": since + len(data)}
+        return {"status": "complete", "error": "No markets for this search"}
+    elif load_status == "FAILED":
+        return {"status": "failure", "error": error or "Unknown error"}
+    elif load_status != "PENDING":
+        return {"status": "failure", "error": f"Unknown loading status: {load_status}"}
+
+    # Loading has not started, report the celery state the worker mirrored
+    if celery_state == "FAILURE":
+        return {"status": "failure", "error": error or "Unknown error"}
+    elif celery_state is not None:
+        return {"status": CELERY_STATE_NAMES.get(celery_state, celery_state.lower())}
+    return None
+
+def wire_response(body: bytes, encoding: str, headers: dict | None = None) -> Response:
+    # Compressed json stored by the worker, sent without being decoded
+    return Response(body, media_type="application/json", headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding", **(headers or {})})
+
+def cached_response(key: tuple) -> Response | None:
+    cached = response_cache.get(key)
+    if cached is None:
+        return None
+    body, headers = cached
+    return Response(body, media_type="application/json", headers=headers)
+
+def cache_response(key: tuple, response: Response) -> Response:
+    # Responses of completed tasks never change, keep their encoded bytes
+    headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+    response_cache.set(key, bytes(response.body), headers)
+    return response
+
+# Check ingestion task. Returns the deltas from index since on, next_cursor is the since of the next poll.
+# Histories are served in the columnar encoding, history=json expands them to lists
 @router.get("/{task_id}")
-async def check_request(task_id: str):
+async def check_request(
+    task_id: str,
+    since: int = Query(0, ge=0),
+    history: Literal["columnar", "json"] = "columnar",
+):
 
-    result = AsyncResult(task_id, app=celery_app)
+    # Completed tasks are answered from this process' cache without reading redis
+    cache_key = (task_id, "deltas", since, history)
+    cached = cached_response(cache_key)
+    if cached is not None:
+        return cached
 
+    # One round trip for status, error, deltas and the mirrored celery state
+    load_status, celery_state, error, data = await redis_repository.lookup_task(task_id, since)
+
+    response = status_response(load_status, celery_state, error, await present_deltas(data, history), since)
+    if response is not None:
+        if load_status == "COMPLETE":
+            return cache_response(cache_key, JSONResponse(response))
+        return response
+
+    # Tasks queued before their state was mirrored, or whose mirror write failed, fall back to the celery backend
+    result = AsyncResult(task_id, app=celery_app)
     celery_status = result.state
-    load_status = await redis_repository.get_status(task_id)
-    
-    # Check load status
-    if load_status is not "PENDING":
-
-        if load_status == "IN_PROGRESS":
-            data = await redis_repository.load_tree_deltas(task_id)
-
-            if data:
-                return {"status":"in_progress","data":data}
-            else:
-                return {"status":"in_progress","data":[]}
-        elif load_status == "COMPLETE":
-            data = await redis_repository.load_tree_deltas(task_id)
-
-            if data:
-                return {"status": "success", "data":data}
-            else:
-                return {"status": "complete", "error": "No markets for this search"}
-        elif load_status == "FAILED":
-            query_error = await redis_repository.get_error(task_id)
-            return {"status": "failure", "error": query_error}
-        else:
-            return {"status":"failure", "error": f"Unknown loading status: {load_status}"}    
-    
-    # If there is no load status check celery task health
     if celery_status == "PENDING":
         return {"status": "pending"}
     elif celery_status == "FAILURE":
         return {"status": "failure", "error": str(result.result)}
     else:
         return {"status": celery_status.lower()}
+
+# Statuses and new deltas of many tasks in one redis round trip, plus one for their histories. Answers like
+# GET /ingestion/{task_id} per task without the celery fallback, a task with no state yet is pending
+@router.post("/status:batch")
+async def check_requests(req: BatchStatusRequest, history: Literal["columnar", "json"] = "columnar"):
+    cursors = [(task.task_id, task.since) for task in req.tasks]
+    results = await redis_repository.batch_status(cursors)
+
+    deltas = await present_deltas([data for *_, data in results], history)
+
+    tasks = {}
+    for (task_id, since), (load_status, celery_state, error, _), data in zip(cursors, results, deltas):
+        tasks[task_id] = status_response(load_status, celery_state, error, data, since) or {"status": "pending"}
+
+    return {"tasks": tasks}
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+# The tree compacted from every delta when the task completed, one read instead of merging the deltas.
+# Clients revalidate with If-None-Match, a matching etag is answered 304 without reading the tree
+@router.get("/{task_id}/tree")
+async def result_tree(
+    task_id: str,
+    history: Literal["columnar", "json"] = "columnar",
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    accept_encoding: str | None = Header(None, alias="Accept-Encoding"),
+):
+    # The bytes differ per history encoding and content-coding, so does the strong etag of each representation
+    def quoted(etag: str, coding: str | None = None) -> str:
+        suffix = "" if history == "columnar" else "-json"
+        if coding is not None:
+            suffix += f"-{coding}"
+        return f'"{etag}{suffix}"'
+
+    encoding = negotiate_wire_encoding(accept_encoding)
+
+    cache_key = (task_id, "tree", history, encoding)
+    cached = cached_response(cache_key)
+    if cached is not None:
+        if etag_matches(if_none_match, cached.headers["etag"]):
+            return Response(status_code=304, headers={"ETag": cached.headers["etag"]})
+        return cached
+
+    if if_none_match:
+        etag = await redis_repository.get_result_etag(task_id)
+        if etag is not None:
+            # Either the identity or the negotiated coding of the same tree is still current
+            tags = [quoted(etag)] if encoding is None else [quoted(etag, encoding), quoted(etag)]
+            matched = next((tag for tag in tags if etag_matches(if_none_match, tag)), None)
+            if matched is not None:
+                await redis_repository.touch_finished_task(task_id)
+                return Response(status_code=304, headers={"ETag": matched})
+
+    if encoding and history == "columnar":
+        wire = await redis_repository.load_wire_payload(task_id, "tree", encoding)
+        if wire is not None:
+            await redis_repository.touch_finished_task(task_id)
+            etag, body = wire
+            return cache_response(cache_key, wire_response(body, encoding, {"ETag": quoted(etag, encoding), "Cache-Control": "no-cache"}))
+
+    result = await redis_repository.load_result_tree(task_id)
+    if result is None:
+        load_status = await redis_repository.get_status(task_id)
+        if load_status == "COMPLETE":
+            return {"status": "complete", "error": "No markets for this search"}
+        return JSONResponse(
+            status_code=404,
+            content={"status": STATUS_NAMES.get(load_status, "pending"), "error": "The tree is materialized when the task completes"},
+        )
+
+    await redis_repository.touch_finished_task(task_id)
+    etag, tree = result
+    tree = await redis_repository.resolve_histories(tree)
+    if history == "json":
+        tree = map_histories(tree, history_to_lists)
+
+    return cache_response(cache_key, JSONResponse({"status": "success", "data": tree}, headers={"ETag": quoted(etag), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}))
+
+# Push deltas and status changes as server-sent events. Resumes after the Last-Event-ID header or last_event_id,
+# with follow=false the response ends once it has caught up instead of waiting for the task to finish
+@router.get("/{task_id}/stream")
+async def stream_task(
+    task_id: str,
+    request: Request,
+    last_event_id: str = Query("0"),
+    history: Literal["columnar", "json"] = "columnar",
+    follow: bool = True,
+    last_event_id_header: str | None = Header(None, alias="Last-Event-ID"),
+):
+    if stream_subscribers.locked():
+        return JSONResponse(status_code=503, content={"error": "Too many open task streams"}, headers={"Retry-After": "5"})
+
+    async def events():
+        async with stream_subscribers:
+            async for event in task_events(stream_repository, task_id, last_event_id_header or last_event_id, history, follow):
+                if await request.is_disconnected():
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Same events over a websocket, one json message {id, event, data} each
+@router.websocket("/{task_id}/stream")
+async def stream_task_websocket(websocket: WebSocket, task_id: str, last_event_id: str = "0", history: Literal["columnar", "json"] = "columnar"):
+    await websocket.accept()
+    if stream_subscribers.locked():
+        # Try again later
+        await websocket.close(code=1013)
+        return
+
+    try:
+        async with stream_subscribers:
+            async for event in task_events(stream_repository, task_id, last_event_id, history):
+                if event is not None:
+                    await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.core.metrics import load_published_metrics, metrics
+from fastapi_app.core.rate_limiter import build_clob_limiter, build_gamma_limiter
+from fastapi_app.core.response_cache import response_cache
+from fastapi_app.repositories.retention_repository import AsyncRetentionRepository
+from fastapi_app.services.retention import storage_stats
+
+redis_client = build_async_client()
+
+# Read only handles on the buckets the workers share
+rate_limiters = [build_gamma_limiter(redis_client), build_clob_limiter(redis_client)]
+
+retention_repository = AsyncRetentionRepository(redis_client)
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"]
+)
+
+# Current adaptive rate and queue depth of each upstream bucket
+@router.get("/rate-limits")
+async def rate_limits():
+    return {"limiters": [await limiter.stats() for limiter in rate_limiters]}
+
+# Request, retry and circuit breaker counters summed over all workers
+@router.get("/polymarket")
+async def polymarket_metrics():
+    return {"workers": await load_published_metrics(redis_client), "api": metrics.snapshot()}
+
+# Redis bytes per key family and per ingestion task, scans the whole keyspace
+@router.get("/storage")
+async def storage(top: int = 50):
+    return await storage_stats(retention_repository, top_tasks=top)
+
+# Hit rate and memory of this api process' response cache
+@router.get("/response-cache")
+async def response_cache_stats():
+    return response_cache.stats()
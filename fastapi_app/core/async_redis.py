@@ -1,12 +1,28 @@
 import os
-from redis.asyncio import Redis
+from redis.asyncio import BlockingConnectionPool, Redis
 
-def build_async_client() -> Redis:
+# Seconds a call on a blocking pool waits for a free connection before raising
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 20))
+
+def build_async_client(max_connections: int | None = None, blocking: bool = False) -> Redis:
     REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/2")
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+
+    if blocking:
+        # Calls wait for a connection once every one is busy instead of failing with MaxConnectionsError
+        pool = BlockingConnectionPool.from_url(
+            REDIS_URL,
+            max_connections=max_connections or REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            health_check_interval=30,
+        )
+        return Redis(connection_pool=pool)
 
     async_redis = Redis.from_url(
         REDIS_URL,
         decode_responses=False,
+        max_connections=max_connections or REDIS_MAX_CONNECTIONS,
+        health_check_interval=30,
     )
 
     return async_redis
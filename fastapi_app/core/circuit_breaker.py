@@ -0,0 +1,75 @@
+"""
+This module creates per-endpoint circuit breakers for upstream calls. After enough consecutive failures the breaker
+opens and requests fail immediately instead of holding a worker slot, after a recovery timeout a single trial request
+is let through and its result closes or reopens the breaker.
+"""
+
+import os
+import time
+
+from fastapi_app.core.metrics import metrics
+from fastapi_app.core.polymarket_client import PolymarketCircuitOpen
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started_at = 0.0
+
+    def before_request(self):
+        # Raise instead of calling upstream while the breaker is open
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                metrics.incr(f"breaker_rejected:{self.name}")
+                raise PolymarketCircuitOpen(f"Circuit open for {self.name}")
+            self._set_state(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            # A trial that never reported back (e.g. cancelled) stops blocking after the recovery timeout
+            trial_pending = time.monotonic() - self.trial_started_at < self.recovery_timeout
+            if self.trial_in_flight and trial_pending:
+                metrics.incr(f"breaker_rejected:{self.name}")
+                raise PolymarketCircuitOpen(f"Circuit half open for {self.name}, trial request in flight")
+            self.trial_in_flight = True
+            self.trial_started_at = time.monotonic()
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_in_flight = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.incr(f"breaker_transitions:{self.name}:{state}")
+        metrics.set_gauge(f"breaker_state:{self.name}", STATE_GAUGE[state])
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv("POLYMARKET_BREAKER_FAILURES", 5)),
+            recovery_timeout=float(os.getenv("POLYMARKET_BREAKER_RECOVERY_SECONDS", 30)),
+        )
+    return _breakers[name]
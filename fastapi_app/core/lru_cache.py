@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+class LRUCache:
+    """
+    In-process least recently used cache bounded by total weight, every entry weighs 1 unless a weigher is given
+    """
+
+    def __init__(self, max_weight: int, weigher: Callable[[Any], int] | None = None):
+        self.max_weight = max_weight
+        self.weigher = weigher or (lambda value: 1)
+        self.weight = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._entries:
+            return default
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def set(self, key: Hashable, value: Any):
+        weight = self.weigher(value)
+        self.pop(key)
+
+        # Entries heavier than the whole cache are not stored
+        if weight > self.max_weight:
+            return
+
+        self._entries[key] = (value, weight)
+        self.weight += weight
+
+        while self.weight > self.max_weight:
+            _, (_, evicted_weight) = self._entries.popitem(last=False)
+            self.weight -= evicted_weight
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._entries:
+            return default
+        value, weight = self._entries.pop(key)
+        self.weight -= weight
+        return value
+
+    def keys(self) -> list:
+        # Least recently used first
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.weight = 0
@@ -0,0 +1,45 @@
+"""
+This module creates a two tier cache for Gamma metadata payloads: an in-process LRU in front of redis. Entries keep the
+upstream ETag and Last-Modified validators so that once they go stale they can be revalidated with a conditional
+request instead of being downloaded again.
+"""
+
+import os
+import time
+
+from fastapi_app.core.lru_cache import LRUCache
+from fastapi_app.repositories.polymarket_cache_repository import AsyncPolymarketCacheRepository
+
+METADATA_LRU_ENTRIES = int(os.getenv("POLYMARKET_METADATA_LRU_ENTRIES", 256))
+METADATA_STALE_TTL = int(os.getenv("POLYMARKET_METADATA_STALE_TTL", 24 * 60 * 60))
+
+class MetadataCache:
+    def __init__(self, repo: AsyncPolymarketCacheRepository | None = None, max_entries: int = METADATA_LRU_ENTRIES):
+        self.repo = repo
+        self.lru = LRUCache(max_entries)
+
+    async def get(self, key: str) -> tuple[dict | None, str]:
+        """
+        Return the cached entry and the tier it came from, "lru", "redis" or "miss"
+        """
+
+        entry = self.lru.get(key)
+        if entry is not None:
+            return entry, "lru"
+
+        if self.repo is not None:
+            entry = await self.repo.load_metadata(key)
+            if entry is not None:
+                self.lru.set(key, entry)
+                return entry, "redis"
+
+        return None, "miss"
+
+    async def put(self, key: str, entry: dict):
+        self.lru.set(key, entry)
+        if self.repo is not None:
+            # Kept past freshness so the validators remain available for revalidation
+            await self.repo.save_metadata(key, entry, ttl=METADATA_STALE_TTL)
+
+def is_fresh(entry: dict) -> bool:
+    return entry["expires_at"] > time.time()
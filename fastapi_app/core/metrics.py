@@ -0,0 +1,58 @@
+"""
+This module keeps simple in-process counters and gauges. Celery workers publish their snapshot to a redis hash
+after each task so the API can report totals across every worker process.
+"""
+
+import os
+import socket
+from collections import Counter
+
+from redis.asyncio import Redis
+
+METRICS_KEY_PREFIX = "metrics:"
+METRICS_TTL = int(os.getenv("METRICS_TTL", 600))
+
+class Metrics:
+    def __init__(self):
+        self.counters: Counter = Counter()
+        self.gauges: dict[str, float] = {}
+
+    def incr(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def snapshot(self) -> dict:
+        return {**self.counters, **self.gauges}
+
+    def _process_key(self) -> str:
+        return f"{METRICS_KEY_PREFIX}{socket.gethostname()}:{os.getpid()}"
+
+    async def publish(self, redis: Redis):
+        # Overwrite this process' hash, expires if the process dies
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+
+        key = self._process_key()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=snapshot)
+            pipe.expire(key, METRICS_TTL)
+            await pipe.execute()
+
+async def load_published_metrics(redis: Redis) -> dict:
+    """
+    Return counters summed over every process that published recently
+    """
+
+    totals: Counter = Counter()
+    async for key in redis.scan_iter(match=f"{METRICS_KEY_PREFIX}*"):
+        values = await redis.hgetall(key) #type: ignore
+        for name, value in values.items():
+            totals[name.decode("utf-8")] += float(value)
+
+    return dict(totals)
+
+# One registry per process
+metrics = Metrics()
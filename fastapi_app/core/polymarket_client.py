@@ -1,30 +1,70 @@
+import importlib.util
+import os
+
 import httpx
+from redis.asyncio import Redis
+
+from fastapi_app.core.metadata_cache import MetadataCache
+from fastapi_app.core.single_flight import SingleFlight
+from fastapi_app.core.rate_limiter import AdaptiveRateLimiter, build_clob_limiter, build_gamma_limiter
+from fastapi_app.repositories.polymarket_cache_repository import AsyncPolymarketCacheRepository
 
 GAMMA_BASE_URL = "https://gamma-api.polymarket.com"
 CLOB_BASE_URL = "https://clob.polymarket.com"
 
+# HTTP/2 needs the optional h2 package, fall back to HTTP/1.1 keep-alive without it
+HTTP2_SUPPORTED = importlib.util.find_spec("h2") is not None
+
+# Gamma serves a handful of metadata calls per task, CLOB serves the price history fan-out
+GAMMA_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("POLYMARKET_GAMMA_MAX_CONNECTIONS", 20)),
+    max_keepalive_connections=int(os.getenv("POLYMARKET_GAMMA_MAX_KEEPALIVE", 10)),
+    keepalive_expiry=float(os.getenv("POLYMARKET_GAMMA_KEEPALIVE_EXPIRY", 120.0)),
+)
+CLOB_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("POLYMARKET_CLOB_MAX_CONNECTIONS", 50)),
+    max_keepalive_connections=int(os.getenv("POLYMARKET_CLOB_MAX_KEEPALIVE", 50)),
+    keepalive_expiry=float(os.getenv("POLYMARKET_CLOB_KEEPALIVE_EXPIRY", 120.0)),
+)
+
 class PolymarketClient:
-    def __init__(self):
+    def __init__(self, redis: Redis | None = None):
         self.gamma = httpx.AsyncClient(
             base_url=GAMMA_BASE_URL,
             timeout=10.0,
-            limits=httpx.Limits(
-                max_connections=20,
-                max_keepalive_connections=10
-            )
+            http2=HTTP2_SUPPORTED,
+            limits=GAMMA_LIMITS
         )
         self.clob = httpx.AsyncClient(
             base_url=CLOB_BASE_URL,
-            timeout=10.0
+            timeout=10.0,
+            http2=HTTP2_SUPPORTED,
+            limits=CLOB_LIMITS
         )
 
+        # Cluster wide rate limits need the shared redis, without it only the handler semaphore applies
+        self.gamma_limiter: AdaptiveRateLimiter | None = build_gamma_limiter(redis) if redis is not None else None
+        self.clob_limiter: AdaptiveRateLimiter | None = build_clob_limiter(redis) if redis is not None else None
+
+        # Price histories cached across tasks so repeat tokenIds only fetch their new tail
+        self.cache: AsyncPolymarketCacheRepository | None = AsyncPolymarketCacheRepository(redis) if redis is not None else None
+
+        # Gamma event and search payloads, the in-process tier works without redis
+        self.metadata_cache = MetadataCache(self.cache)
+
+        # Identical fetches in flight at the same time share one upstream request
+        self.single_flight = SingleFlight(redis)
+
     async def close(self):
         await self.gamma.aclose()
         await self.clob.aclose()
 
 class PolymarketError(Exception):
     """Base class for Polymarket ingestion exceptions."""
-    pass
+    def __init__(self, *args, retry_after: float | None = None):
+        super().__init__(*args)
+        # Seconds upstream asked us to wait before retrying, if it said so
+        self.retry_after = retry_after
 
 class PolymarketRateLimit(PolymarketError):
     """Raised when Polymarket API returns 429 Too Many Requests."""
@@ -32,4 +72,8 @@ class PolymarketRateLimit(PolymarketError):
 
 class PolymarketUnavailable(PolymarketError):
     """Raised when Polymarket API is unavailable or times out."""
-    pass
\ No newline at end of file
+    pass
+
+class PolymarketCircuitOpen(PolymarketUnavailable):
+    """Raised without calling Polymarket while the endpoint's circuit breaker is open."""
+    pass
@@ -0,0 +1,182 @@
+"""
+This module creates a redis backed token bucket shared by every celery worker, one bucket per upstream host.
+Callers reserve a slot in the bucket and sleep until it comes up, so the aggregate request rate across all
+processes stays at the bucket rate. The rate itself adapts with AIMD: it grows linearly over time while requests
+succeed and is cut multiplicatively when upstream answers 429.
+"""
+
+import asyncio
+import os
+
+from redis.asyncio import Redis
+
+# Reserve one token. Tokens may go negative, the deficit is the queue of callers waiting for their slot
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local increase = tonumber(ARGV[4])
+local ttl = tonumber(ARGV[5])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local rate = tonumber(state[3]) or max_rate
+
+local elapsed = math.max(0, now - ts)
+rate = math.min(max_rate, math.max(min_rate, rate + increase * elapsed))
+tokens = math.min(burst, tokens + elapsed * rate) - 1
+
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], ttl)
+return tostring(wait)
+"""
+
+# Multiplicative decrease, at most once per cooldown so a burst of 429s from many workers counts once.
+# Tokens are settled at the old rate first so the refill already earned is not recomputed at the new one
+BACKOFF_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local increase = tonumber(ARGV[4])
+local factor = tonumber(ARGV[5])
+local cooldown = tonumber(ARGV[6])
+local ttl = tonumber(ARGV[7])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'last_backoff')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local rate = tonumber(state[3]) or max_rate
+local last_backoff = tonumber(state[4]) or 0
+
+if now - last_backoff >= cooldown then
+    local elapsed = math.max(0, now - ts)
+    rate = math.min(max_rate, math.max(min_rate, rate + increase * elapsed))
+    tokens = math.min(burst, tokens + elapsed * rate)
+    rate = math.max(min_rate, rate * factor)
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate, 'last_backoff', now)
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+return tostring(rate)
+"""
+
+STATS_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local increase = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local rate = tonumber(state[3]) or max_rate
+
+local elapsed = math.max(0, now - ts)
+rate = math.min(max_rate, math.max(min_rate, rate + increase * elapsed))
+tokens = math.min(burst, tokens + elapsed * rate)
+return {tostring(rate), tostring(tokens)}
+"""
+
+class AdaptiveRateLimiter:
+    def __init__(
+        self,
+        redis: Redis,
+        name: str,
+        max_rate: float,
+        min_rate: float = 1.0,
+        burst: float | None = None,
+        increase_per_second: float = 1.0,
+        decrease_factor: float = 0.5,
+        backoff_cooldown: float = 1.0,
+    ):
+        """
+        redis: shared async redis client
+        name: bucket name, one per upstream host
+        max_rate: requests per second the bucket never exceeds, i.e. the documented upstream limit
+        min_rate: floor the rate is never cut below
+        burst: bucket capacity, defaults to one second of max_rate
+        increase_per_second: additive increase of the rate per second without a 429
+        decrease_factor: multiplicative decrease applied on a 429
+        backoff_cooldown: seconds during which further 429s do not cut the rate again
+        """
+        self.redis = redis
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst if burst is not None else max_rate
+        self.increase_per_second = increase_per_second
+        self.decrease_factor = decrease_factor
+        self.backoff_cooldown = backoff_cooldown
+        self.ttl = 3600
+
+        self._acquire = redis.register_script(ACQUIRE_SCRIPT)
+        self._backoff = redis.register_script(BACKOFF_SCRIPT)
+        self._stats = redis.register_script(STATS_SCRIPT)
+
+    def _bucket_key(self) -> str:
+        return f"ratelimit:{self.name}"
+
+    async def acquire(self):
+        # Reserve a slot and sleep until it comes up
+        wait = await self._acquire(
+            keys=[self._bucket_key()],
+            args=[self.max_rate, self.min_rate, self.burst, self.increase_per_second, self.ttl],
+        )
+        wait = float(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def on_rate_limited(self) -> float:
+        # Upstream answered 429, cut the shared rate
+        rate = await self._backoff(
+            keys=[self._bucket_key()],
+            args=[self.max_rate, self.min_rate, self.burst, self.increase_per_second, self.decrease_factor, self.backoff_cooldown, self.ttl],
+        )
+        return float(rate)
+
+    async def stats(self) -> dict:
+        rate, tokens = await self._stats(
+            keys=[self._bucket_key()],
+            args=[self.max_rate, self.min_rate, self.burst, self.increase_per_second],
+        )
+        rate = float(rate)
+        tokens = float(tokens)
+
+        return {
+            "name": self.name,
+            "rate": rate,
+            "max_rate": self.max_rate,
+            "min_rate": self.min_rate,
+            "available_tokens": max(tokens, 0.0),
+            # Reserved slots not yet due
+            "queue_depth": max(-tokens, 0.0),
+        }
+
+def build_gamma_limiter(redis: Redis) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(
+        redis,
+        name="polymarket:gamma",
+        max_rate=float(os.getenv("POLYMARKET_GAMMA_MAX_RATE", 30)),
+        min_rate=float(os.getenv("POLYMARKET_GAMMA_MIN_RATE", 1)),
+        increase_per_second=float(os.getenv("POLYMARKET_GAMMA_RATE_INCREASE", 1)),
+    )
+
+def build_clob_limiter(redis: Redis) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(
+        redis,
+        name="polymarket:clob",
+        max_rate=float(os.getenv("POLYMARKET_CLOB_MAX_RATE", 50)),
+        min_rate=float(os.getenv("POLYMARKET_CLOB_MIN_RATE", 2)),
+        increase_per_second=float(os.getenv("POLYMARKET_CLOB_RATE_INCREASE", 2)),
+    )
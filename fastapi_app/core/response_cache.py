@@ -0,0 +1,131 @@
+"""
+This module creates the api's in-process cache of finished task responses. A completed task's deltas and tree never
+change, so their encoded responses are kept in a bytes bounded LRU in each api process and served without reading
+redis. Entries are dropped when the retention sweeper deletes a task or its keys expire, both announced over redis
+pub/sub, and after a maximum age in case an announcement was missed. Expiry events need redis configured with
+notify-keyspace-events Ex.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from fastapi_app.core.lru_cache import LRUCache
+from fastapi_app.core.metrics import metrics
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the cache
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_MAX_AGE_SECONDS = float(os.getenv("RESPONSE_CACHE_MAX_AGE_SECONDS", 300))
+# Reads served from the cache are reported to the retention sweeper this often
+RESPONSE_CACHE_TOUCH_SECONDS = float(os.getenv("RESPONSE_CACHE_TOUCH_SECONDS", 10))
+
+class ResponseCache:
+    """
+    Keys are tuples starting with the task id, values the response body and headers
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_age: float = RESPONSE_CACHE_MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self.lru = LRUCache(max_bytes, weigher=lambda entry: len(entry[0]))
+        self._touched: set[str] = set()
+
+    def get(self, key: tuple) -> tuple[bytes, dict] | None:
+        entry = self.lru.get(key)
+        if entry is not None and time.monotonic() - entry[2] > self.max_age:
+            self.lru.pop(key)
+            self._update_gauges()
+            entry = None
+
+        if entry is None:
+            metrics.incr("response_cache:misses")
+            return None
+
+        metrics.incr("response_cache:hits")
+        self._touched.add(key[0])
+        return entry[0], entry[1]
+
+    def set(self, key: tuple, body: bytes, headers: dict | None = None):
+        self.lru.set(key, (body, headers or {}, time.monotonic()))
+        self._update_gauges()
+
+    def invalidate(self, task_id: str):
+        keys = [key for key in self.lru.keys() if key[0] == task_id]
+        for key in keys:
+            self.lru.pop(key)
+        if keys:
+            metrics.incr("response_cache:invalidations", len(keys))
+            self._update_gauges()
+
+    def clear(self):
+        self.lru.clear()
+        self._update_gauges()
+
+    def take_touched(self) -> list[str]:
+        touched, self._touched = self._touched, set()
+        return list(touched)
+
+    def stats(self) -> dict:
+        hits = metrics.counters["response_cache:hits"]
+        misses = metrics.counters["response_cache:misses"]
+        return {
+            "entries": len(self.lru),
+            "bytes": self.lru.weight,
+            "max_bytes": self.lru.max_weight,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "invalidations": metrics.counters["response_cache:invalidations"],
+        }
+
+    def _update_gauges(self):
+        metrics.set_gauge("response_cache:entries", len(self.lru))
+        metrics.set_gauge("response_cache:bytes", self.lru.weight)
+
+def invalidated_task_id(message: dict) -> str | None:
+    # Deletes publish the task id, expiry events the expired key
+    data = message["data"].decode("utf-8") if isinstance(message["data"], bytes) else str(message["data"])
+    if message["type"] == "message":
+        return data
+
+    parts = data.split(":")
+    if parts[0] == "ingestion" and len(parts) == 3:
+        return parts[1]
+    return None
+
+async def run_invalidation_listener(cache: ResponseCache, repo: AsyncIngestionRepository, touch_interval: float = RESPONSE_CACHE_TOUCH_SECONDS):
+    if await repo.expiry_events_enabled() is False:
+        logger.warning(f"Redis has notify-keyspace-events off, cached responses of expired tasks live up to {cache.max_age:.0f} seconds")
+
+    while True:
+        pubsub = None
+        try:
+            pubsub = await repo.subscribe_invalidations()
+            # Announcements made while unsubscribed are lost, start over
+            cache.clear()
+
+            last_touch = time.monotonic()
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    task_id = invalidated_task_id(message)
+                    if task_id is not None:
+                        cache.invalidate(task_id)
+
+                if time.monotonic() - last_touch >= touch_interval:
+                    await repo.touch_finished_tasks(cache.take_touched())
+                    last_touch = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Response cache invalidation listener failed: {e!r}")
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                await pubsub.aclose()
+
+# One cache per api process
+response_cache = ResponseCache()
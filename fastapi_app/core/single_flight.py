@@ -0,0 +1,109 @@
+"""
+This module coalesces identical upstream fetches. Inside a process concurrent callers with the same key share one
+task. Across processes a short redis lease elects one worker to fetch, the others poll for the result it publishes
+and fall back to fetching themselves if the lease holder gives up.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from fastapi_app.core.metrics import metrics
+
+# Delete the lease only if we still hold it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+SINGLE_FLIGHT_LEASE_MS = int(os.getenv("SINGLE_FLIGHT_LEASE_MS", 10000))
+SINGLE_FLIGHT_RESULT_TTL_MS = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL_MS", 5000))
+SINGLE_FLIGHT_POLL_SECONDS = float(os.getenv("SINGLE_FLIGHT_POLL_SECONDS", 0.05))
+
+class SingleFlight:
+    def __init__(self, redis: Redis | None = None):
+        self.redis = redis
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._release = redis.register_script(RELEASE_SCRIPT) if redis is not None else None
+
+    def _lease_key(self, key: str) -> str:
+        return f"singleflight:{key}:lease"
+
+    def _result_key(self, key: str) -> str:
+        return f"singleflight:{key}:result"
+
+    async def do(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return fetch(), sharing the result with every identical call in flight. The result must be json serializable
+        """
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            metrics.incr("single_flight:local_shared")
+        else:
+            task = asyncio.ensure_future(self._do_cluster(key, fetch))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # Shielded so one caller being cancelled does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def _do_cluster(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if self.redis is None:
+            return await fetch()
+
+        lease_key = self._lease_key(key)
+        result_key = self._result_key(key)
+
+        # Bounded so a flapping lease cannot keep us waiting forever
+        for _ in range(3):
+            raw_result = await self.redis.get(result_key)
+            if raw_result is not None:
+                metrics.incr("single_flight:remote_shared")
+                return json.loads(raw_result)
+
+            token = uuid.uuid4().hex
+            if await self.redis.set(lease_key, token, nx=True, px=SINGLE_FLIGHT_LEASE_MS):
+                return await self._fetch_and_publish(key, token, fetch)
+
+            metrics.incr("single_flight:remote_wait")
+            raw_result = await self._wait_for_result(lease_key, result_key)
+            if raw_result is not None:
+                metrics.incr("single_flight:remote_shared")
+                return json.loads(raw_result)
+
+        return await fetch()
+
+    async def _fetch_and_publish(self, key: str, token: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        lease_key = self._lease_key(key)
+        try:
+            result = await fetch()
+            await self.redis.set(self._result_key(key), json.dumps(result), px=SINGLE_FLIGHT_RESULT_TTL_MS) #type: ignore
+            return result
+        finally:
+            # Waiters see the lease disappear and take over if we failed
+            await self._release(keys=[lease_key], args=[token]) #type: ignore
+
+    async def _wait_for_result(self, lease_key: str, result_key: str) -> bytes | None:
+        # Poll until the holder publishes or its lease is gone
+        deadline = asyncio.get_running_loop().time() + SINGLE_FLIGHT_LEASE_MS / 1000
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+
+            async with self.redis.pipeline(transaction=False) as pipe: #type: ignore
+                pipe.get(result_key)
+                pipe.exists(lease_key)
+                raw_result, lease_held = await pipe.execute()
+
+            if raw_result is not None:
+                return raw_result
+            if not lease_held:
+                return None
+
+        return None
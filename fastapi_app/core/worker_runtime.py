@@ -0,0 +1,79 @@
+"""
+This module holds the resources that live for the whole lifetime of a celery worker process: one event loop,
+the pooled Polymarket http clients and the async redis connection pool. They are created when the worker
+process starts and closed when it shuts down, so connections are reused across ingestion tasks.
+"""
+
+import asyncio
+from typing import Coroutine
+
+from celery.signals import worker_process_init, worker_process_shutdown
+from redis.asyncio import Redis
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.core.celery_logging_config import get_logger
+from fastapi_app.core.metrics import metrics
+from fastapi_app.core.polymarket_client import PolymarketClient
+from utils.codecs import log_codec_availability
+
+logger = get_logger(__name__)
+
+class WorkerRuntime:
+    def __init__(self):
+        # Clients bind their connections to the loop they are first used on, so the loop is created first
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.redis: Redis = build_async_client()
+        self.polymarket = PolymarketClient(redis=self.redis)
+
+    def run(self, coroutine: Coroutine):
+        # Drive a coroutine to completion on the shared loop
+        try:
+            return self.loop.run_until_complete(coroutine)
+        finally:
+            self.publish_metrics()
+
+    def publish_metrics(self):
+        # Make this process' counters visible to the API
+        try:
+            self.loop.run_until_complete(metrics.publish(self.redis))
+        except Exception as e:
+            logger.warning(f"Error publishing worker metrics: {e}")
+
+    def close(self):
+        try:
+            self.loop.run_until_complete(self.polymarket.close())
+            self.loop.run_until_complete(self.redis.aclose())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+
+_runtime: WorkerRuntime | None = None
+
+def get_runtime() -> WorkerRuntime:
+    # Lazily build the runtime for pools that do not send worker_process_init (e.g. solo)
+    global _runtime
+    if _runtime is None:
+        _runtime = WorkerRuntime()
+    return _runtime
+
+@worker_process_init.connect
+def init_worker_runtime(**kwargs):
+    logger.info("Initializing worker runtime")
+    log_codec_availability()
+    get_runtime()
+
+@worker_process_shutdown.connect
+def shutdown_worker_runtime(**kwargs):
+    global _runtime
+    if _runtime is None:
+        return
+
+    logger.info("Closing worker runtime")
+    try:
+        _runtime.close()
+    except Exception as e:
+        logger.warning(f"Error closing worker runtime: {e}")
+    finally:
+        _runtime = None
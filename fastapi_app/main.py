@@ -1,8 +1,15 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from fastapi_app.api.routes import ingestion
+from fastapi_app.api.routes import ingestion, metrics
+from fastapi_app.core.response_cache import response_cache, run_invalidation_listener
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.repositories.retention_repository import AsyncRetentionRepository
+from fastapi_app.services.retention import run_sweeper
+from utils.codecs import log_codec_availability
 
 def setup_logging():
     logging.basicConfig(
@@ -12,9 +19,25 @@ def setup_logging():
 
 setup_logging()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_codec_availability()
+    # Retention sweeper runs alongside the api, a redis lock keeps it to one process at a time
+    sweeper = asyncio.create_task(run_sweeper(AsyncRetentionRepository()))
+    # Drops cached responses of deleted and expired tasks in this process
+    invalidation_listener = asyncio.create_task(run_invalidation_listener(response_cache, AsyncIngestionRepository()))
+    yield
+    sweeper.cancel()
+    invalidation_listener.cancel()
+    # Let both finish unwinding, the listener closes its pub/sub connection
+    await asyncio.gather(sweeper, invalidation_listener, return_exceptions=True)
+
 #Initialize app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 #Add ingestions route
 app.include_router(ingestion.router)
 
+#Add metrics route
+app.include_router(metrics.router)
+
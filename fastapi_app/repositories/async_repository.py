@@ -1,16 +1,116 @@
+import asyncio
+import os
+import time
+from typing import Callable
+
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline, PubSub
 
 from fastapi_app.core.async_redis import build_async_client
-from fastapi_app.repositories.ingestion_repository import IngestionRepository 
+from fastapi_app.repositories.ingestion_repository import HISTORY_BLOB_TTL_SECONDS, INGESTION_RAW_TTL_SECONDS, INGESTION_TTL_SECONDS, IngestionRepository
+from utils.history_codec import is_history_ref, map_histories, packed_from_bytes
+
+INGESTION_WRITE_BATCH = int(os.getenv("INGESTION_WRITE_BATCH", 100))
+INGESTION_WRITE_FLUSH_SECONDS = float(os.getenv("INGESTION_WRITE_FLUSH_MS", 50)) / 1000
+
+# Everything a status poll needs in one round trip: the loading status, the deltas from since on, the error and the
+# mirrored celery state while loading has not started. Finished tasks are marked as read
+STATUS_SCRIPT = """
+local status = redis.call('GET', KEYS[1])
+local celery_state = false
+local err = false
+local deltas = {}
+
+if status == 'IN_PROGRESS' or status == 'COMPLETE' then
+    deltas = redis.call('LRANGE', KEYS[2], ARGV[1], -1)
+end
+if status == 'COMPLETE' or status == 'FAILED' then
+    redis.call('ZADD', KEYS[5], 'XX', ARGV[3], ARGV[2])
+end
+if not status then
+    celery_state = redis.call('GET', KEYS[4])
+end
+if status == 'FAILED' or celery_state == 'FAILURE' then
+    err = redis.call('GET', KEYS[3])
+end
+
+return {status, celery_state, err, deltas}
+"""
+
+# Point a request fingerprint at a new task unless another submission already replaced the expected one, returning
+# the task it points at in that case
+REPLACE_REQUEST_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and current ~= ARGV[1] then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return false
+"""
 
 class AsyncIngestionRepository(IngestionRepository):
-    def __init__(self):
-        self.redis: Redis = build_async_client()
+    def __init__(self, redis: Redis | None = None):
+        # Share the worker's connection pool when one is given
+        self.redis: Redis = redis if redis is not None else build_async_client()
+        self._status = self.redis.register_script(STATUS_SCRIPT)
+        self._replace_request = self.redis.register_script(REPLACE_REQUEST_SCRIPT)
+
+    def buffered_writer(self, max_batch: int = INGESTION_WRITE_BATCH, flush_interval: float = INGESTION_WRITE_FLUSH_SECONDS) -> "BufferedIngestionWriter":
+        return BufferedIngestionWriter(self, max_batch=max_batch, flush_interval=flush_interval)
+
+    async def save_history_blob(self, task_id: str, history: dict | list) -> dict | list:
+        """
+        Store a wide history once under its content hash and return the reference to keep in its place. The blob is
+        recorded as referenced by task_id
+        """
+
+        if not history or is_history_ref(history):
+            return history
+
+        blob_key, blob, ref = self._history_blob(history) #type: ignore
+        blobs_key = self._blobs_key(task_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(blob_key, blob, nx=True, ex=HISTORY_BLOB_TTL_SECONDS)
+            pipe.expire(blob_key, HISTORY_BLOB_TTL_SECONDS)
+            pipe.sadd(blobs_key, blob_key)
+            pipe.expire(blobs_key, INGESTION_TTL_SECONDS)
+            await pipe.execute()
+        return ref
+
+    async def resolve_histories(self, data):
+        """
+        Replace history references in deltas, trees or markets with the packed blobs, in one round trip.
+        Histories whose blob has expired become empty
+        """
+
+        digests = set()
+        def collect(history):
+            if is_history_ref(history):
+                digests.add(history['ref'])
+            return history
+        map_histories(data, collect)
+
+        if not digests:
+            return data
+
+        digests = list(digests)
+        blobs = await self.redis.mget([self._history_blob_key(d) for d in digests])
+        resolved = {d: packed_from_bytes(blob) for d, blob in zip(digests, blobs) if blob is not None}
+
+        return map_histories(data, lambda history: resolved.get(history['ref'], []) if is_history_ref(history) else history)
+
+    async def _write_with_ttl(self, keys: list[str], ttl: int, write: Callable[[Pipeline], None]):
+        # The write and its expiry go in one MULTI so a key never exists without a ttl
+        async with self.redis.pipeline(transaction=True) as pipe:
+            write(pipe)
+            for key in keys:
+                pipe.expire(key, ttl)
+            await pipe.execute()
 
     async def save_raw_market(self, task_id: str, market: dict):
         raw_key = self._raw_key(task_id)
         serialized_market = self._serialize(market)
-        await self.redis.rpush(raw_key, serialized_market) #type: ignore
+        await self._write_with_ttl([raw_key], INGESTION_RAW_TTL_SECONDS, lambda pipe: pipe.rpush(raw_key, serialized_market))
 
     async def get_raw_markets(self, task_id: str):
         raw_key = self._raw_key(task_id)
@@ -18,32 +118,92 @@ class AsyncIngestionRepository(IngestionRepository):
         markets = self._deserialize_many(raw_markets)
         return markets
 
-    async def save_tree(self, task_id: str, tree: dict):
-        tree_key = self._tree_key(task_id)
-        dicted_tree = self._tree_to_dict(tree)
-        serialized_tree = self._serialize(dicted_tree)
-        await self.redis.set(
-            tree_key,
-            serialized_tree
-        )
-
-    async def load_tree(self, task_id: str) -> dict: 
-        tree_key = self._tree_key(task_id)
-        raw_data = await self.redis.get(tree_key)
-        data = self._deserialize(raw_data)
-        return data
-
     async def save_tree_delta(self, task_id: str, tree_delta: dict):
         tree_delta_key = self._tree_delta_key(task_id)
+        stream_key = self._stream_key(task_id)
         serialized_delta = self._serialize(tree_delta)
-        await self.redis.rpush(tree_delta_key, serialized_delta) #type: ignore
+
+        def write(pipe: Pipeline):
+            pipe.rpush(tree_delta_key, serialized_delta)
+            pipe.xadd(stream_key, {"type": "delta", "data": serialized_delta})
+        await self._write_with_ttl([tree_delta_key, stream_key], INGESTION_TTL_SECONDS, write)
     
-    async def load_tree_deltas(self, task_id: str):
+    async def load_tree_deltas(self, task_id: str, since: int = 0):
+        # Deltas are append only, since skips the ones a client already has
         tree_delta_key = self._tree_delta_key(task_id)
-        raw_deltas = await self.redis.lrange(tree_delta_key, 0, -1) #type: ignore
+        raw_deltas = await self.redis.lrange(tree_delta_key, since, -1) #type: ignore
         deltas = self._deserialize_many(raw_deltas)
         return deltas
 
+    async def save_result_tree(self, task_id: str, tree: dict, wire: dict[str, dict[str, bytes]] | None = None) -> str:
+        """
+        Store the materialized tree of a task, serialized once, and return its etag. wire maps a response name to
+        its response body in each content encoding, stored ready to send
+        """
+
+        result_key = self._result_key(task_id)
+        payload = self._serialize(tree)
+        etag = self._result_etag(payload)
+
+        fields = {"etag": etag, "tree": payload}
+        for name, encoded in (wire or {}).items():
+            for encoding, body in encoded.items():
+                fields[self._wire_field(name, encoding)] = body
+
+        await self._write_with_ttl([result_key], INGESTION_TTL_SECONDS, lambda pipe: pipe.hset(result_key, mapping=fields))
+        return etag
+
+    async def load_wire_payload(self, task_id: str, name: str, encoding: str) -> tuple[str, bytes] | None:
+        # (etag, compressed response body), None when the task has no such payload
+        etag, body = await self.redis.hmget(self._result_key(task_id), ["etag", self._wire_field(name, encoding)]) #type: ignore
+        if body is None:
+            return None
+        return etag.decode("utf-8"), body
+
+    async def get_result_etag(self, task_id: str) -> str | None:
+        etag = await self.redis.hget(self._result_key(task_id), "etag") #type: ignore
+        return etag.decode("utf-8") if etag is not None else None
+
+    async def load_result_tree(self, task_id: str) -> tuple[str, dict] | None:
+        # (etag, tree), None until the task has completed with markets
+        etag, payload = await self.redis.hmget(self._result_key(task_id), ["etag", "tree"]) #type: ignore
+        if payload is None:
+            return None
+        return etag.decode("utf-8"), self._deserialize(payload)
+
+    async def read_stream(self, task_id: str, last_id: str = "0", block_ms: int | None = None, count: int = 100) -> list[tuple[str, str, dict | str]]:
+        """
+        Return (event id, type, data) of the stream entries after last_id, waiting up to block_ms for the first one.
+        Delta data is the delta, status data the loading status
+        """
+
+        stream_key = self._stream_key(task_id)
+        response = await self.redis.xread({stream_key: last_id}, count=count, block=block_ms)
+        if not response:
+            return []
+
+        events = []
+        _, entries = response[0]
+        for entry_id, fields in entries:
+            kind = fields[b"type"].decode("utf-8")
+            data = self._deserialize(fields[b"data"]) if kind == "delta" else fields[b"data"].decode("utf-8")
+            events.append((entry_id.decode("utf-8"), kind, data))
+        return events
+
+    async def save_deferred_market(self, task_id: str, market: dict):
+        deferred_key = self._deferred_key(task_id)
+        fields = self._deferred_fields(market)
+        await self._write_with_ttl([deferred_key], INGESTION_TTL_SECONDS, lambda pipe: pipe.hset(deferred_key, mapping=fields))
+
+    async def load_deferred_markets(self, task_id: str, token_ids: list[str] | None = None) -> list[dict]:
+        deferred_key = self._deferred_key(task_id)
+        if token_ids is None:
+            raw_markets = list((await self.redis.hgetall(deferred_key)).values()) #type: ignore
+        else:
+            raw_markets = [m for m in await self.redis.hmget(deferred_key, token_ids) if m is not None] #type: ignore
+        markets = self._unique_markets(raw_markets)
+        return markets
+
     async def get_status(self, task_id: str) -> str:
         load_key = self._load_key(task_id)
         status = await self.redis.get(load_key)
@@ -54,26 +214,276 @@ class AsyncIngestionRepository(IngestionRepository):
     async def data_loading_status_start(self, task_id: str):
         load_key = self._load_key(task_id)
         start_status = "IN_PROGRESS"
-        await self.redis.set(load_key, start_status)
+        stream_key = self._stream_key(task_id)
+
+        def write(pipe: Pipeline):
+            pipe.set(load_key, start_status, ex=INGESTION_TTL_SECONDS)
+            pipe.xadd(stream_key, {"type": "status", "data": start_status})
+        await self._write_with_ttl([stream_key], INGESTION_TTL_SECONDS, write)
     
     async def data_loading_status_end(self, task_id: str):
-        load_key = self._load_key(task_id)
         end_status = "COMPLETE"
-        await self.redis.set(load_key, end_status)
+        await self._finish(task_id, end_status)
 
     async def data_loading_status_failed(self, task_id: str):
-        load_key = self._load_key(task_id)
         failed_status = "FAILED"
-        await self.redis.set(load_key, failed_status)
+        await self._finish(task_id, failed_status)
+
+    async def _finish(self, task_id: str, status: str):
+        # Finished tasks become candidates for the retention sweeper
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._load_key(task_id), status, ex=INGESTION_TTL_SECONDS)
+            pipe.zadd(self._finished_key(), {task_id: time.time()})
+            pipe.xadd(self._stream_key(task_id), {"type": "status", "data": status})
+            pipe.expire(self._stream_key(task_id), INGESTION_TTL_SECONDS)
+            await pipe.execute()
+
+    async def reset_task(self, task_id: str):
+        """
+        Delete what a run of the task wrote before it was interrupted, so running it again does not repeat its deltas.
+        Deferred markets and blob references are rewritten as they were
+        """
+
+        await self.redis.unlink(
+            self._load_key(task_id),
+            self._tree_delta_key(task_id),
+            self._stream_key(task_id),
+            self._raw_key(task_id),
+            self._result_key(task_id),
+        )
+
+    async def touch_finished_task(self, task_id: str):
+        # Record a read, only for tasks already in the finished set
+        await self.redis.zadd(self._finished_key(), {task_id: time.time()}, xx=True)
+
+    async def subscribe_invalidations(self) -> PubSub:
+        """
+        Pub/sub subscribed to deleted task ids and to expired keys
+        """
+
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._invalidation_channel())
+        await pubsub.psubscribe("__keyevent@*__:expired")
+        return pubsub
+
+    async def expiry_events_enabled(self) -> bool | None:
+        # None when CONFIG is not available, as on some managed redis
+        try:
+            config = await self.redis.config_get("notify-keyspace-events")
+        except Exception:
+            return None
+        flags = config.get("notify-keyspace-events", "")
+        flags = flags.decode("utf-8") if isinstance(flags, bytes) else flags
+        # Keyevent notifications for expired keys, A stands for every event class including x
+        return "E" in flags and ("x" in flags or "A" in flags)
+
+    async def touch_finished_tasks(self, task_ids: list[str]):
+        # Reads served from the api's response cache, recorded in batches
+        if task_ids:
+            now = time.time()
+            await self.redis.zadd(self._finished_key(), {task_id: now for task_id in task_ids}, xx=True)
+
+    async def lookup_task(self, task_id: str, since: int = 0) -> tuple[str, str | None, str | None, list[dict]]:
+        """
+        Return (loading status, celery state, error, deltas from since on) in one round trip
+        """
+
+        keys = [
+            self._load_key(task_id),
+            self._tree_delta_key(task_id),
+            self._error_key(task_id),
+            self._celery_state_key(task_id),
+            self._finished_key(),
+        ]
+        status, celery_state, error, raw_deltas = await self._status(keys=keys, args=[since, task_id, time.time()])
+
+        return (
+            status.decode("utf-8") if status is not None else "PENDING",
+            celery_state.decode("utf-8") if celery_state is not None else None,
+            error.decode("utf-8") if error is not None else None,
+            self._deserialize_many(raw_deltas),
+        )
+
+    async def batch_status(self, cursors: list[tuple[str, int]]) -> list[tuple[str, str | None, str | None, list[dict]]]:
+        """
+        Return (loading status, celery state, error, deltas from since on) for each (task_id, since) in one round
+        trip. Finished tasks among them count as read
+        """
+
+        if not cursors:
+            return []
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for task_id, since in cursors:
+                pipe.get(self._load_key(task_id))
+                pipe.get(self._celery_state_key(task_id))
+                pipe.get(self._error_key(task_id))
+                pipe.lrange(self._tree_delta_key(task_id), since, -1)
+            pipe.zadd(self._finished_key(), {task_id: time.time() for task_id, _ in cursors}, xx=True)
+            replies = await pipe.execute()
+
+        results = []
+        for i in range(len(cursors)):
+            status, celery_state, error, raw_deltas = replies[4 * i:4 * i + 4]
+            results.append((
+                status.decode("utf-8") if status is not None else "PENDING",
+                celery_state.decode("utf-8") if celery_state is not None else None,
+                error.decode("utf-8") if error is not None else None,
+                self._deserialize_many(raw_deltas),
+            ))
+        return results
+
+    async def claim_request(self, fingerprint: str, task_id: str, window: int) -> str | None:
+        """
+        Record task_id as the task of a request unless one was recorded within window seconds, returning that one
+        """
+
+        existing = await self.redis.set(self._request_key(fingerprint), task_id, nx=True, get=True, ex=window)
+        return existing.decode("utf-8") if existing is not None else None
+
+    async def replace_request(self, fingerprint: str, expected: str, task_id: str, window: int) -> str | None:
+        """
+        Record task_id as the task of a request in place of expected, returning the task recorded instead when
+        another submission replaced expected first
+        """
+
+        current = await self._replace_request(keys=[self._request_key(fingerprint)], args=[expected, task_id, window])
+        return current.decode("utf-8") if current is not None else None
+
+    async def discard_celery_state(self, task_id: str):
+        # A task id that was never enqueued
+        await self.redis.delete(self._celery_state_key(task_id))
+
+    async def get_task_state(self, task_id: str) -> tuple[str, str | None]:
+        # (loading status, mirrored celery state) without reading any deltas
+        status, celery_state = await self.redis.mget(self._load_key(task_id), self._celery_state_key(task_id))
+        return (
+            status.decode("utf-8") if status is not None else "PENDING",
+            celery_state.decode("utf-8") if celery_state is not None else None,
+        )
+
+    async def set_celery_state(self, task_id: str, state: str, error: str | None = None, only_new: bool = False):
+        """
+        Mirror a celery state into the ingestion db. only_new leaves an existing state, so a late QUEUED never
+        overwrites the worker's STARTED. An error already set by the task is kept
+        """
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._celery_state_key(task_id), state, ex=INGESTION_TTL_SECONDS, nx=only_new)
+            if error is not None:
+                pipe.set(self._error_key(task_id), error, ex=INGESTION_TTL_SECONDS, nx=True)
+            await pipe.execute()
 
     async def set_error(self, task_id: str, error: Exception):
         error_key = self._error_key(task_id)
         error_str = str(error)
-        await self.redis.set(error_key, error_str)
+        await self.redis.set(error_key, error_str, ex=INGESTION_TTL_SECONDS)
 
     async def get_error(self, task_id: str):
         error_key = self._error_key(task_id)
         error = await self.redis.get(error_key)
         if error is None:
             return "Unknown error"
-        return error.decode("utf-8")   
\ No newline at end of file
+        return error.decode("utf-8")
+
+class BufferedIngestionWriter:
+    """
+    Drop-in for the repository's per-market writes that groups them into redis pipelines. Buffered writes are flushed
+    once max_batch are queued, flush_interval seconds after the first one was queued, and when the writer exits, so
+    everything is in redis before the caller marks the task complete
+    """
+
+    def __init__(self, repo: AsyncIngestionRepository, max_batch: int, flush_interval: float):
+        self.repo = repo
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+
+        self._commands: list[Callable[[Pipeline], None]] = []
+        self._expiries: dict[str, int] = {}
+        self._timer: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+        self._error: Exception | None = None
+        self._saved_blobs: set[tuple[str, str]] = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.flush()
+
+    async def save_history_blob(self, task_id: str, history: dict | list) -> dict | list:
+        if not history or is_history_ref(history):
+            return history
+
+        blob_key, blob, ref = self.repo._history_blob(history) #type: ignore
+        blobs_key = self.repo._blobs_key(task_id)
+        if (task_id, blob_key) not in self._saved_blobs:
+            self._saved_blobs.add((task_id, blob_key))
+
+            def write_blob(pipe: Pipeline):
+                pipe.set(blob_key, blob, nx=True, ex=HISTORY_BLOB_TTL_SECONDS)
+                pipe.expire(blob_key, HISTORY_BLOB_TTL_SECONDS)
+                pipe.sadd(blobs_key, blob_key)
+            await self._add(write_blob, blobs_key, INGESTION_TTL_SECONDS)
+
+        return ref
+
+    async def save_raw_market(self, task_id: str, market: dict):
+        raw_key = self.repo._raw_key(task_id)
+        serialized_market = self.repo._serialize(market)
+        await self._add(lambda pipe: pipe.rpush(raw_key, serialized_market), raw_key, INGESTION_RAW_TTL_SECONDS)
+
+    async def save_tree_delta(self, task_id: str, tree_delta: dict):
+        tree_delta_key = self.repo._tree_delta_key(task_id)
+        stream_key = self.repo._stream_key(task_id)
+        serialized_delta = self.repo._serialize(tree_delta)
+        await self._add(lambda pipe: pipe.rpush(tree_delta_key, serialized_delta), tree_delta_key, INGESTION_TTL_SECONDS)
+        await self._add(lambda pipe: pipe.xadd(stream_key, {"type": "delta", "data": serialized_delta}), stream_key, INGESTION_TTL_SECONDS)
+
+    async def save_deferred_market(self, task_id: str, market: dict):
+        deferred_key = self.repo._deferred_key(task_id)
+        fields = self.repo._deferred_fields(market)
+        await self._add(lambda pipe: pipe.hset(deferred_key, mapping=fields), deferred_key, INGESTION_TTL_SECONDS)
+
+    async def flush(self):
+        # A timer that already started flushing clears itself first, so it is never cancelled mid write
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if self._error is not None:
+                raise self._error
+
+            commands, self._commands = self._commands, []
+            expiries, self._expiries = self._expiries, {}
+            if not commands:
+                return
+
+            # One MULTI per batch, each key touched gets its ttl once alongside its writes
+            async with self.repo.redis.pipeline(transaction=True) as pipe:
+                for command in commands:
+                    command(pipe)
+                for key, ttl in expiries.items():
+                    pipe.expire(key, ttl)
+                await pipe.execute()
+
+    async def _add(self, command: Callable[[Pipeline], None], key: str | None = None, ttl: int | None = None):
+        self._commands.append(command)
+        if key is not None and ttl is not None:
+            self._expiries[key] = ttl
+
+        if len(self._commands) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # Raised from the next flush so the task fails instead of losing writes silently
+            self._error = e
+
@@ -1,11 +1,21 @@
-import json 
-import zlib
+import hashlib
+import os
 
 from fastapi_app.core.async_redis import build_async_client
 from fastapi_app.core.sync_redis import build_sync_client
+from utils.codecs import decode, get_codec
+from utils.history_codec import encode_history, history_ref
+
+# Per task keys expire this long after their last write, the raw log is only kept for debugging
+INGESTION_TTL_SECONDS = int(os.getenv("INGESTION_TTL_SECONDS", 24 * 3600))
+INGESTION_RAW_TTL_SECONDS = int(os.getenv("INGESTION_RAW_TTL_SECONDS", 6 * 3600))
+
+# Histories are stored once per content hash, every write referencing a blob extends its ttl
+HISTORY_BLOB_TTL_SECONDS = int(os.getenv("HISTORY_BLOB_TTL_SECONDS", 7 * 24 * 3600))
 
 class IngestionRepository():
 
+    # Tree of tasks from before the result hash, no longer written but still deleted with its task
     def _tree_key(self, task_id: str) -> str:
         return f"ingestion:{task_id}:tree"
 
@@ -18,21 +28,90 @@ class IngestionRepository():
     def _error_key(self, task_id: str) -> str:
         return f"ingestion:{task_id}:error"
     
+    # Celery level state mirrored by the api and the worker (QUEUED, STARTED, SUCCESS, FAILURE)
+    def _celery_state_key(self, task_id: str) -> str:
+        return f"ingestion:{task_id}:celery"
+
     def _tree_delta_key(self, task_id: str) -> str:
         return f"ingestion:{task_id}:tree_delta"
 
-    # Use msgpack.packb()?
+    def _deferred_key(self, task_id: str) -> str:
+        return f"ingestion:{task_id}:deferred"
+
+    # Deltas and status transitions in order, for streaming clients
+    def _stream_key(self, task_id: str) -> str:
+        return f"ingestion:{task_id}:stream"
+
+    # Hash of the tree compacted from the deltas when the task completes, and its etag
+    def _result_key(self, task_id: str) -> str:
+        return f"ingestion:{task_id}:result"
+
+    # Set of the history blob keys a task references, so blobs no task references can be freed
+    def _blobs_key(self, task_id: str) -> str:
+        return f"ingestion:{task_id}:blobs"
+
+    def _task_keys(self, task_id: str) -> list[str]:
+        return [
+            self._stream_key(task_id),
+            self._result_key(task_id),
+            self._tree_key(task_id),
+            self._raw_key(task_id),
+            self._load_key(task_id),
+            self._celery_state_key(task_id),
+            self._error_key(task_id),
+            self._tree_delta_key(task_id),
+            self._deferred_key(task_id),
+            self._blobs_key(task_id),
+        ]
+
+    # Sorted set of finished task ids scored by when they were last read, the sweeper evicts the lowest first
+    def _finished_key(self) -> str:
+        return "ingestion:finished"
+
+    # Task id of the latest submission of an identical ingestion request, kept for the dedup window
+    def _request_key(self, fingerprint: str) -> str:
+        return f"ingestion_request:{fingerprint}"
+
+    # Pub/sub channel announcing task ids whose keys were deleted, so cached responses are dropped
+    def _invalidation_channel(self) -> str:
+        return "ingestion:invalidate"
+
+    def _history_blob_key(self, digest: str) -> str:
+        return f"history:blob:{digest}"
+
+    def _history_blob(self, history: dict) -> tuple[str, bytes, dict]:
+        # Returns the blob key, the columnar bytes and the reference stored in place of the history
+        blob = encode_history(history)
+        digest = hashlib.blake2b(blob, digest_size=16).hexdigest()
+        return self._history_blob_key(digest), blob, history_ref(digest)
+
+    def _wire_field(self, name: str, encoding: str) -> str:
+        return f"wire:{name}:{encoding}"
+
+    def _result_etag(self, payload: bytes) -> str:
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    # Codec is set by PAYLOAD_FORMAT and PAYLOAD_COMPRESSION, payloads written with any other codec still decode
     def _serialize(self, data: dict | list) -> bytes:
-        return zlib.compress(json.dumps(data).encode())
+        return get_codec().encode(data)
 
-    # Use msgpack.unpackb()?
     def _deserialize(self, payload: bytes) -> dict:
-        return json.loads(zlib.decompress(payload))
+        return decode(payload)
     
     def _deserialize_many(self, payloads) -> list[dict]:
         return [self._deserialize(p) for p in payloads]
     
-    def _tree_to_dict(self, tree: dict) -> dict:
-        # Recursively turn defaultdicts into dicts for serialization
-        if isinstance(tree, dict):
-            return {k: self._tree_to_dict(v) for k, v in tree.items()}
+    def _deferred_fields(self, market: dict) -> dict[str, bytes]:
+        # Binary markets fetched alone are also found by the tokenId of their derived complement
+        serialized_market = self._serialize(market)
+        fields = {market['tokenId']: serialized_market}
+        if market.get('complement'):
+            fields[market['complement']['tokenId']] = serialized_market
+        return fields
+
+    def _unique_markets(self, payloads) -> list[dict]:
+        # A market asked for by both of its tokenIds is fetched once
+        markets = {}
+        for market in self._deserialize_many(payloads):
+            markets.setdefault(market['tokenId'], market)
+        return list(markets.values())
@@ -0,0 +1,97 @@
+import os
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.repositories.ingestion_repository import IngestionRepository
+
+# Acked jobs are deleted, the cap only bounds a stream nobody consumes
+INGESTION_JOBS_MAXLEN = int(os.getenv("INGESTION_JOBS_MAXLEN", 100000))
+
+# Claiming our own jobs resets their idle time, so runners only reclaim jobs of runners that stopped. Only entries
+# still pending on this consumer are claimed, one another runner took over stays with it. Returns the claimed ids
+HEARTBEAT_SCRIPT = """
+local claimed = {}
+for i = 3, #ARGV do
+    local pending = redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[i], ARGV[i], 1)
+    if pending[1] and pending[1][2] == ARGV[2] then
+        redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[i], 'JUSTID')
+        table.insert(claimed, ARGV[i])
+    end
+end
+return claimed
+"""
+
+class AsyncJobRepository(IngestionRepository):
+    """
+    Ingestion jobs on a redis stream read by a consumer group, each job is delivered to one runner and stays pending
+    until it is acked
+    """
+
+    def __init__(self, redis: Redis | None = None):
+        self.redis: Redis = redis if redis is not None else build_async_client()
+        self._heartbeat = self.redis.register_script(HEARTBEAT_SCRIPT)
+
+    def _jobs_key(self) -> str:
+        return "ingestion:jobs"
+
+    def _jobs_group(self) -> str:
+        return "ingestion-runners"
+
+    async def enqueue(self, job: dict) -> str:
+        entry_id = await self.redis.xadd(self._jobs_key(), {"job": self._serialize(job)}, maxlen=INGESTION_JOBS_MAXLEN, approximate=True)
+        return entry_id.decode("utf-8")
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self._jobs_key(), self._jobs_group(), id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _parse(self, entries) -> list[tuple[str, dict]]:
+        # Entries deleted while pending come back without fields
+        return [(entry_id.decode("utf-8"), self._deserialize(fields[b"job"])) for entry_id, fields in entries if fields]
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict]]:
+        """
+        Return up to count (entry id, job) never delivered to any runner, waiting up to block_ms for the first one
+        """
+
+        response = await self.redis.xreadgroup(self._jobs_group(), consumer, {self._jobs_key(): ">"}, count=count, block=block_ms)
+        if not response:
+            return []
+        _, entries = response[0]
+        return self._parse(entries)
+
+    async def claim_stale(self, consumer: str, min_idle_ms: int, count: int, start_id: str = "0-0") -> tuple[str, list[tuple[str, dict]]]:
+        """
+        Take over up to count jobs pending on other runners for at least min_idle_ms. Returns the id to resume the
+        scan from and the claimed (entry id, job)
+        """
+
+        response = await self.redis.xautoclaim(self._jobs_key(), self._jobs_group(), consumer, min_idle_ms, start_id=start_id, count=count)
+        next_id, entries = response[0], response[1]
+        return next_id.decode("utf-8") if isinstance(next_id, bytes) else next_id, self._parse(entries)
+
+    async def deliveries(self, entry_id: str) -> int:
+        pending = await self.redis.xpending_range(self._jobs_key(), self._jobs_group(), min=entry_id, max=entry_id, count=1)
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def heartbeat(self, consumer: str, entry_ids: list[str]) -> set[str]:
+        """
+        Reset the idle time of the jobs among entry_ids still pending on consumer, returning those. The others were
+        acked or claimed by another runner
+        """
+
+        if not entry_ids:
+            return set()
+        claimed = await self._heartbeat(keys=[self._jobs_key()], args=[self._jobs_group(), consumer, *entry_ids])
+        return {entry_id.decode("utf-8") for entry_id in claimed}
+
+    async def ack(self, entry_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self._jobs_key(), self._jobs_group(), entry_id)
+            pipe.xdel(self._jobs_key(), entry_id)
+            await pipe.execute()
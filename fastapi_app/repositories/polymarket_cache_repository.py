@@ -0,0 +1,44 @@
+from redis.asyncio import Redis
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.repositories.ingestion_repository import IngestionRepository
+from utils.history_codec import decode_history, encode_history
+
+class AsyncPolymarketCacheRepository(IngestionRepository):
+    """
+    Upstream payloads shared between ingestion tasks, keyed by Polymarket identifiers rather than task ids
+    """
+
+    def __init__(self, redis: Redis | None = None):
+        self.redis: Redis = redis if redis is not None else build_async_client()
+
+    def _history_key(self, token_id: str, fidelity: int) -> str:
+        return f"polymarket:history:{token_id}:{fidelity}:columnar"
+
+    # Histories are stored in the columnar encoding as is, they are already compact and need no payload codec
+    async def load_history(self, token_id: str, fidelity: int) -> dict | None:
+        history_key = self._history_key(token_id, fidelity)
+        raw_history = await self.redis.get(history_key)
+        if raw_history is None:
+            return None
+        t, p = decode_history(raw_history)
+        return {'t': t.tolist(), 'p': p.tolist()}
+
+    async def save_history(self, token_id: str, fidelity: int, history: dict, ttl: int):
+        history_key = self._history_key(token_id, fidelity)
+        await self.redis.set(history_key, encode_history(history), ex=ttl)
+
+    def _metadata_key(self, cache_key: str) -> str:
+        return f"polymarket:metadata:{cache_key}"
+
+    async def load_metadata(self, cache_key: str) -> dict | None:
+        metadata_key = self._metadata_key(cache_key)
+        raw_entry = await self.redis.get(metadata_key)
+        if raw_entry is None:
+            return None
+        return self._deserialize(raw_entry)
+
+    async def save_metadata(self, cache_key: str, entry: dict, ttl: int):
+        metadata_key = self._metadata_key(cache_key)
+        serialized_entry = self._serialize(entry)
+        await self.redis.set(metadata_key, serialized_entry, ex=ttl)
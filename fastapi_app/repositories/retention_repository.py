@@ -0,0 +1,108 @@
+from redis.asyncio import Redis
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.repositories.ingestion_repository import HISTORY_BLOB_TTL_SECONDS, IngestionRepository
+
+class AsyncRetentionRepository(IngestionRepository):
+    """
+    Memory accounting and eviction of finished ingestion tasks and their history blobs
+    """
+
+    def __init__(self, redis: Redis | None = None):
+        self.redis: Redis = redis if redis is not None else build_async_client()
+
+    def _sweep_lock_key(self) -> str:
+        return "retention:sweep_lock"
+
+    async def acquire_sweep_lock(self, token: str, ttl_ms: int) -> bool:
+        # One sweeper at a time across api processes, the lock is left to expire
+        return bool(await self.redis.set(self._sweep_lock_key(), token, nx=True, px=ttl_ms))
+
+    async def used_memory(self) -> int:
+        info = await self.redis.info("memory")
+        return int(info["used_memory"])
+
+    async def memory_usage(self, keys: list) -> list[int]:
+        # Bytes used by each key in one round trip, 0 for keys that no longer exist
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.memory_usage(key)
+            return [usage or 0 for usage in await pipe.execute()]
+
+    async def least_recently_read(self, count: int) -> list[str]:
+        task_ids = await self.redis.zrange(self._finished_key(), 0, count - 1)
+        return [task_id.decode("utf-8") for task_id in task_ids]
+
+    async def prune_finished(self, older_than: float):
+        # Entries neither written nor read within the ttl point at keys that have already expired
+        await self.redis.zremrangebyscore(self._finished_key(), "-inf", older_than)
+
+    async def delete_task(self, task_id: str) -> int:
+        """
+        Delete every key of a task, returning the bytes they used
+        """
+
+        keys = self._task_keys(task_id)
+        usages = await self.memory_usage(keys)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.unlink(*keys)
+            pipe.zrem(self._finished_key(), task_id)
+            pipe.publish(self._invalidation_channel(), task_id)
+            await pipe.execute()
+
+        return sum(usages)
+
+    async def blob_references(self, batch: int = 1000) -> dict[str, set[str]]:
+        """
+        Return the history blob keys referenced by each task that still has keys
+        """
+
+        references = {}
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor, match=self._blobs_key("*"), count=batch)
+            if keys:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.smembers(key)
+                    members = await pipe.execute()
+                for key, blob_keys in zip(keys, members):
+                    task_id = key.decode("utf-8").split(":")[1]
+                    references[task_id] = {blob_key.decode("utf-8") for blob_key in blob_keys}
+            if cursor == 0:
+                return references
+
+    async def delete_blobs(self, blob_keys: list[str], min_age: int) -> list[str]:
+        """
+        Delete history blobs whose ttl was last refreshed at least min_age seconds ago, returning the deleted keys.
+        A blob written or referenced more recently may belong to a task not yet seen by the caller
+        """
+
+        if not blob_keys:
+            return []
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for blob_key in blob_keys:
+                pipe.ttl(blob_key)
+            ttls = await pipe.execute()
+
+        stale = [blob_key for blob_key, ttl in zip(blob_keys, ttls) if 0 <= ttl <= HISTORY_BLOB_TTL_SECONDS - min_age]
+        if stale:
+            await self.redis.unlink(*stale)
+        return stale
+
+    async def key_usage(self, match: str = "*", batch: int = 1000) -> list[tuple[str, int]]:
+        """
+        Return (key, bytes) for every key matching match, sized a scan batch per round trip
+        """
+
+        usage = []
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis.scan(cursor, match=match, count=batch)
+            if keys:
+                sizes = await self.memory_usage(keys)
+                usage.extend((key.decode("utf-8"), size) for key, size in zip(keys, sizes))
+            if cursor == 0:
+                return usage
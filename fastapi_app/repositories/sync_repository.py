@@ -1,16 +1,28 @@
+import time
+from typing import Callable
+
 from redis import Redis
+from redis.client import Pipeline
 
 from fastapi_app.core.sync_redis import build_sync_client
-from fastapi_app.repositories.ingestion_repository import IngestionRepository 
+from fastapi_app.repositories.ingestion_repository import INGESTION_RAW_TTL_SECONDS, INGESTION_TTL_SECONDS, IngestionRepository
 
 class SyncIngestionRepository(IngestionRepository):
     def __init__(self):
         self.redis: Redis = build_sync_client()
 
+    def _write_with_ttl(self, keys: list[str], ttl: int, write: Callable[[Pipeline], None]):
+        # The write and its expiry go in one MULTI so a key never exists without a ttl
+        with self.redis.pipeline(transaction=True) as pipe:
+            write(pipe)
+            for key in keys:
+                pipe.expire(key, ttl)
+            pipe.execute()
+
     def save_raw_market(self, task_id: str, market: dict):
         raw_key = self._raw_key(task_id)
         serialized_market = self._serialize(market)
-        self.redis.rpush(raw_key, serialized_market) #type: ignore
+        self._write_with_ttl([raw_key], INGESTION_RAW_TTL_SECONDS, lambda pipe: pipe.rpush(raw_key, serialized_market))
 
     def get_raw_markets(self, task_id: str):
         raw_key = self._raw_key(task_id)
@@ -18,32 +30,50 @@ class SyncIngestionRepository(IngestionRepository):
         markets = self._deserialize_many(raw_markets) #type: ignore
         return markets
 
-    def save_tree(self, task_id: str, tree: dict):
-        tree_key = self._tree_key(task_id)
-        dicted_tree = self._tree_to_dict(tree)
-        serialized_tree = self._serialize(dicted_tree)
-        self.redis.set(
-            tree_key,
-            serialized_tree
-        )
-
-    def load_tree(self, task_id: str) -> dict: 
-        tree_key = self._tree_key(task_id)
-        raw_data = self.redis.get(tree_key)
-        data = self._deserialize(raw_data) #type: ignore
-        return data
-
     def save_tree_delta(self, task_id: str, tree_delta: dict):
         tree_delta_key = self._tree_delta_key(task_id)
+        stream_key = self._stream_key(task_id)
         serialized_delta = self._serialize(tree_delta)
-        self.redis.rpush(tree_delta_key, serialized_delta) #type: ignore
+
+        def write(pipe: Pipeline):
+            pipe.rpush(tree_delta_key, serialized_delta)
+            pipe.xadd(stream_key, {"type": "delta", "data": serialized_delta})
+        self._write_with_ttl([tree_delta_key, stream_key], INGESTION_TTL_SECONDS, write)
     
-    def load_tree_deltas(self, task_id: str):
+    def load_tree_deltas(self, task_id: str, since: int = 0):
+        # Deltas are append only, since skips the ones a client already has
         tree_delta_key = self._tree_delta_key(task_id)
-        raw_deltas = self.redis.lrange(tree_delta_key, 0, -1) 
+        raw_deltas = self.redis.lrange(tree_delta_key, since, -1) 
         deltas = self._deserialize_many(raw_deltas)
         return deltas
 
+    def save_result_tree(self, task_id: str, tree: dict) -> str:
+        result_key = self._result_key(task_id)
+        payload = self._serialize(tree)
+        etag = self._result_etag(payload)
+        self._write_with_ttl([result_key], INGESTION_TTL_SECONDS, lambda pipe: pipe.hset(result_key, mapping={"etag": etag, "tree": payload})) #type: ignore
+        return etag
+
+    def load_result_tree(self, task_id: str) -> tuple[str, dict] | None:
+        etag, payload = self.redis.hmget(self._result_key(task_id), ["etag", "tree"]) #type: ignore
+        if payload is None:
+            return None
+        return etag.decode("utf-8"), self._deserialize(payload)
+
+    def save_deferred_market(self, task_id: str, market: dict):
+        deferred_key = self._deferred_key(task_id)
+        fields = self._deferred_fields(market)
+        self._write_with_ttl([deferred_key], INGESTION_TTL_SECONDS, lambda pipe: pipe.hset(deferred_key, mapping=fields)) #type: ignore
+
+    def load_deferred_markets(self, task_id: str, token_ids: list[str] | None = None) -> list[dict]:
+        deferred_key = self._deferred_key(task_id)
+        if token_ids is None:
+            raw_markets = list(self.redis.hgetall(deferred_key).values()) #type: ignore
+        else:
+            raw_markets = [m for m in self.redis.hmget(deferred_key, token_ids) if m is not None] #type: ignore
+        markets = self._unique_markets(raw_markets)
+        return markets
+
     def get_status(self, task_id: str) -> str:
         load_key = self._load_key(task_id)
         status = self.redis.get(load_key)
@@ -54,22 +84,34 @@ class SyncIngestionRepository(IngestionRepository):
     def data_loading_status_start(self, task_id: str):
         load_key = self._load_key(task_id)
         start_status = "IN_PROGRESS"
-        self.redis.set(load_key, start_status)
+        stream_key = self._stream_key(task_id)
+
+        def write(pipe: Pipeline):
+            pipe.set(load_key, start_status, ex=INGESTION_TTL_SECONDS)
+            pipe.xadd(stream_key, {"type": "status", "data": start_status})
+        self._write_with_ttl([stream_key], INGESTION_TTL_SECONDS, write)
     
     def data_loading_status_end(self, task_id: str):
-        load_key = self._load_key(task_id)
         end_status = "COMPLETE"
-        self.redis.set(load_key, end_status)
+        self._finish(task_id, end_status)
 
     def data_loading_status_failed(self, task_id: str):
-        load_key = self._load_key(task_id)
         failed_status = "FAILED"
-        self.redis.set(load_key, failed_status)
+        self._finish(task_id, failed_status)
+
+    def _finish(self, task_id: str, status: str):
+        # Finished tasks become candidates for the retention sweeper
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._load_key(task_id), status, ex=INGESTION_TTL_SECONDS)
+            pipe.zadd(self._finished_key(), {task_id: time.time()})
+            pipe.xadd(self._stream_key(task_id), {"type": "status", "data": status})
+            pipe.expire(self._stream_key(task_id), INGESTION_TTL_SECONDS)
+            pipe.execute()
 
     def set_error(self, task_id: str, error: Exception):
         error_key = self._error_key(task_id)
         error_str = str(error)
-        self.redis.set(error_key, error_str)
+        self.redis.set(error_key, error_str, ex=INGESTION_TTL_SECONDS)
 
     def get_error(self, task_id: str):
         error_key = self._error_key(task_id)
@@ -3,7 +3,7 @@ This module creates a base model for data ingestion
 """
 
 from datetime import date
-from typing import Literal, Union
+from typing import List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
 from typing_extensions import Annotated
@@ -24,6 +24,18 @@ class PolymarketIngestion(IngestionBase):
     provider : Literal['polymarket'] # type: ignore
     config: PolymarketConfig = PolymarketConfig()
 
+class DeferredHistoryRequest(BaseModel):
+    # tokenIds of metadata only markets to fetch, derived complements included, all deferred markets of the task when omitted
+    token_ids : Optional[List[str]] = None
+
+class TaskCursor(BaseModel):
+    task_id : str
+    # Index of the first delta to return, the next_cursor of the previous poll
+    since : int = Field(0, ge=0)
+
+class BatchStatusRequest(BaseModel):
+    tasks : List[TaskCursor] = Field(max_length=1000)
+
 IngestionRequest = Annotated[
         Union[KalshiIngestion, PolymarketIngestion],
         Field(discriminator="provider")
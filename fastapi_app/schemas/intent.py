@@ -16,6 +16,10 @@ class ExactSearch(BaseModel):
 class KeywordSearch(BaseModel):
     kind : Literal['keyword']
     limit : Optional[int] = 30
+    # Markets whose history is fetched, per event and across the whole search, ranked by volume then liquidity.
+    # The remaining markets are returned metadata only and their history can be requested later
+    markets_per_event : Optional[int] = Field(default=None, ge=0)
+    market_budget : Optional[int] = Field(default=None, ge=0)
 
 SearchType = Annotated[
             ExactSearch | KeywordSearch,
@@ -11,4 +11,8 @@ class KalshiConfig(BaseModel):
 
 class PolymarketConfig(BaseModel):
     base_url : str = "https://gamma-api.polymarket.com"
+    # Fetch only the first outcome of binary markets and derive the other as 1 - p
+    derive_binary_complement : bool = True
+    # Market ids whose order books diverge, both outcomes are fetched for these
+    complement_opt_out : list[str] = []
     
@@ -1,21 +1,27 @@
 from typing import List
 
 from fastapi_app.core.polymarket_client import PolymarketClient
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
 from fastapi_app.schemas.ingestion import IngestionRequest, PolymarketIngestion, KalshiIngestion
 from fastapi_app.services.polymarket.handler import polymarket_handler
 
-async def dispatcher(api_request : IngestionRequest, task_id : str):
+async def dispatcher(api_request : IngestionRequest, task_id : str, client : PolymarketClient | None = None, repo : AsyncIngestionRepository | None = None):
 # Checks for service provider and dispatches request to the correct handler for API queries
+# Pooled client and repository are supplied by the worker runtime, otherwise they are built for this call only
 
     match api_request:
         case PolymarketIngestion():
+            if client is not None:
+                await polymarket_handler(api_request, client, task_id, repo)
+                return
+
             client = PolymarketClient()
             try:
-                await polymarket_handler(api_request, client, task_id)
+                await polymarket_handler(api_request, client, task_id, repo)
             finally:
                 await client.close()
-            
+
         case KalshiIngestion():
             pass
-    
+
 
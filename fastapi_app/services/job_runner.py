@@ -0,0 +1,192 @@
+"""
+This module creates the asyncio job runner, an alternative to the celery worker for ingestion. Ingestion tasks spend
+nearly all their time waiting on Polymarket and redis, so one runner process drives up to JOB_RUNNER_CONCURRENCY of
+them on a single event loop where a prefork child drives one.
+
+Jobs are read from a redis stream through a consumer group and acked only once they have finished, failed jobs
+included since their failure is recorded on the task. A runner keeps its running jobs claimed, jobs left pending by a
+runner that died go idle and are claimed by another one.
+
+    INGESTION_EXECUTOR=stream                            api enqueues on the stream instead of celery
+    python -m fastapi_app.services.job_runner            run a runner
+"""
+
+import asyncio
+import os
+import signal
+import socket
+
+from pydantic import TypeAdapter
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.core.celery_logging_config import get_logger
+from fastapi_app.core.metrics import metrics
+from fastapi_app.core.polymarket_client import PolymarketClient
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.repositories.job_repository import AsyncJobRepository
+from fastapi_app.schemas.ingestion import IngestionRequest
+from fastapi_app.services.dispatcher import dispatcher
+from fastapi_app.services.polymarket.handler import polymarket_fetch_deferred
+from utils.codecs import log_codec_availability
+
+logger = get_logger(__name__)
+
+# celery or stream
+INGESTION_EXECUTOR = os.getenv("INGESTION_EXECUTOR", "celery")
+
+JOB_RUNNER_CONCURRENCY = int(os.getenv("JOB_RUNNER_CONCURRENCY", 64))
+# Connections the running jobs share, callers wait for a free one. The job stream reads on a pool of its own
+JOB_RUNNER_REDIS_CONNECTIONS = int(os.getenv("JOB_RUNNER_REDIS_CONNECTIONS", JOB_RUNNER_CONCURRENCY))
+JOB_STREAM_CONNECTIONS = int(os.getenv("JOB_STREAM_CONNECTIONS", 4))
+JOB_READ_BLOCK_MS = int(os.getenv("JOB_READ_BLOCK_MS", 5000))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 15))
+# A job pending this long without a heartbeat belongs to a runner that died
+JOB_CLAIM_IDLE_MS = int(os.getenv("JOB_CLAIM_IDLE_MS", 60000))
+# Jobs that keep killing their runner are failed instead of delivered again
+JOB_MAX_DELIVERIES = int(os.getenv("JOB_MAX_DELIVERIES", 3))
+JOB_SHUTDOWN_SECONDS = float(os.getenv("JOB_SHUTDOWN_SECONDS", 30))
+
+def ingestion_job(task_id: str, request: dict) -> dict:
+    return {"kind": "ingestion", "task_id": task_id, "request": request}
+
+def deferred_job(task_id: str, parent_task_id: str, token_ids: list[str] | None) -> dict:
+    return {"kind": "deferred", "task_id": task_id, "parent_task_id": parent_task_id, "token_ids": token_ids}
+
+class JobRunner:
+    def __init__(self, concurrency: int = JOB_RUNNER_CONCURRENCY, consumer: str | None = None):
+        self.concurrency = concurrency
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self._running: dict[str, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+        self._claim_from = "0-0"
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self, redis=None, job_redis=None):
+        # The blocking XREADGROUP holds a connection for up to JOB_READ_BLOCK_MS, so it never takes one from the jobs
+        redis = redis if redis is not None else build_async_client(max_connections=JOB_RUNNER_REDIS_CONNECTIONS, blocking=True)
+        job_redis = job_redis if job_redis is not None else build_async_client(max_connections=JOB_STREAM_CONNECTIONS, blocking=True)
+        self.jobs = AsyncJobRepository(job_redis)
+        self.repo = AsyncIngestionRepository(redis)
+        self.polymarket = PolymarketClient(redis=redis)
+
+        await self.jobs.ensure_group()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info(f"Job runner {self.consumer} started, {self.concurrency} concurrent jobs")
+
+        try:
+            while not self._stopping.is_set():
+                free = self.concurrency - len(self._running)
+                if free <= 0:
+                    await asyncio.wait(self._running.values(), timeout=1, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                try:
+                    entries = await self._claim_stale(free)
+                    if not entries:
+                        entries = await self.jobs.read(self.consumer, free, JOB_READ_BLOCK_MS)
+                except Exception as e:
+                    logger.warning(f"Error reading jobs: {e!r}")
+                    await asyncio.sleep(1)
+                    continue
+
+                for entry_id, job in entries:
+                    task = asyncio.create_task(self._execute(entry_id, job))
+                    self._running[entry_id] = task
+                    task.add_done_callback(lambda _, entry_id=entry_id: self._running.pop(entry_id, None))
+        finally:
+            # Running jobs get a grace period, the ones cancelled after it stay pending for another runner
+            if self._running:
+                _, unfinished = await asyncio.wait(self._running.values(), timeout=JOB_SHUTDOWN_SECONDS)
+                for task in unfinished:
+                    task.cancel()
+                await asyncio.gather(*unfinished, return_exceptions=True)
+            heartbeat.cancel()
+            await self.polymarket.close()
+            await metrics.publish(redis)
+            logger.info(f"Job runner {self.consumer} stopped")
+
+    async def _claim_stale(self, count: int) -> list[tuple[str, dict]]:
+        self._claim_from, entries = await self.jobs.claim_stale(self.consumer, JOB_CLAIM_IDLE_MS, count, self._claim_from)
+
+        claimed = []
+        for entry_id, job in entries:
+            deliveries = await self.jobs.deliveries(entry_id)
+            if deliveries > JOB_MAX_DELIVERIES:
+                logger.warning(f"Giving up on job {entry_id} of task {job['task_id']} after {deliveries} deliveries")
+                await self.repo.set_celery_state(job["task_id"], "FAILURE", f"Job abandoned after {deliveries} deliveries")
+                await self.jobs.ack(entry_id)
+                continue
+
+            # A job whose task finished before its runner died only lost its ack
+            status = await self.repo.get_status(job["task_id"])
+            if status in ("COMPLETE", "FAILED"):
+                logger.info(f"Acking reclaimed job {entry_id} of task {job['task_id']}, already {status}")
+                await self.repo.set_celery_state(job["task_id"], "SUCCESS" if status == "COMPLETE" else "FAILURE")
+                await self.jobs.ack(entry_id)
+                continue
+
+            # Otherwise it runs again from the start, without the deltas the dead runner wrote
+            await self.repo.reset_task(job["task_id"])
+            logger.info(f"Reclaimed job {entry_id} of task {job['task_id']}")
+            metrics.incr("job_runner:reclaimed")
+            claimed.append((entry_id, job))
+        return claimed
+
+    async def _execute(self, entry_id: str, job: dict):
+        task_id = job["task_id"]
+        await self.repo.set_celery_state(task_id, "STARTED")
+        metrics.incr("job_runner:started")
+
+        try:
+            if job["kind"] == "ingestion":
+                # Repopulate model at the process boundary, as the celery task does
+                request = TypeAdapter(IngestionRequest).validate_python(job["request"])
+                await dispatcher(api_request=request, task_id=task_id, client=self.polymarket, repo=self.repo)
+            elif job["kind"] == "deferred":
+                await polymarket_fetch_deferred(parent_task_id=job["parent_task_id"], token_ids=job["token_ids"], client=self.polymarket, repo=self.repo, task_id=task_id)
+            else:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+            await self.repo.set_celery_state(task_id, "SUCCESS")
+            metrics.incr("job_runner:succeeded")
+        except asyncio.CancelledError:
+            # Not acked, another runner picks it up
+            raise
+        except Exception as e:
+            logger.warning(f"Job {entry_id} of task {task_id} failed: {e!r}")
+            await self.repo.set_celery_state(task_id, "FAILURE", str(e))
+            metrics.incr("job_runner:failed")
+
+        await self.jobs.ack(entry_id)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                running = list(self._running)
+                owned = await self.jobs.heartbeat(self.consumer, running)
+
+                # Jobs another runner reclaimed after missed heartbeats run there, stop them here
+                for entry_id in running:
+                    task = self._running.get(entry_id)
+                    if entry_id not in owned and task is not None:
+                        logger.warning(f"Job {entry_id} was claimed by another runner, cancelling it")
+                        metrics.incr("job_runner:lost")
+                        task.cancel()
+
+                metrics.set_gauge("job_runner:running", len(self._running))
+                await metrics.publish(self.jobs.redis)
+            except Exception as e:
+                logger.warning(f"Job runner heartbeat failed: {e!r}")
+
+async def main():
+    log_codec_availability()
+    runner = JobRunner()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, runner.stop)
+    await runner.run()
+
+if __name__ == "__main__":
+    asyncio.run(main())
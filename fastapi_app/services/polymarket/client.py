@@ -1,25 +1,57 @@
 import asyncio
+import bisect
+import hashlib
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List
+
 import httpx
-from typing import Any, Dict, List
 
+from fastapi_app.core.circuit_breaker import get_breaker
+from fastapi_app.core.metadata_cache import MetadataCache, is_fresh
+from fastapi_app.core.metrics import metrics
 from fastapi_app.core.polymarket_client import PolymarketClient, PolymarketRateLimit, PolymarketUnavailable
+from fastapi_app.core.rate_limiter import AdaptiveRateLimiter
+from fastapi_app.core.single_flight import SingleFlight
 from fastapi_app.schemas.ingestion import IngestionRequest
 from fastapi_app.schemas.intent import ExactSearch, KeywordSearch
 
-async def polymarket_query_event_slug(slug: str, client: httpx.AsyncClient, semaphore: asyncio.Semaphore) -> Dict:
+POLYMARKET_MAX_RETRIES = int(os.getenv("POLYMARKET_MAX_RETRIES", 3))
+POLYMARKET_BACKOFF_BASE = float(os.getenv("POLYMARKET_BACKOFF_BASE", 0.5))
+POLYMARKET_BACKOFF_MAX = float(os.getenv("POLYMARKET_BACKOFF_MAX", 10))
+POLYMARKET_RETRY_AFTER_MAX = float(os.getenv("POLYMARKET_RETRY_AFTER_MAX", 60))
+
+# Price history window, fidelity is in minutes
+HISTORY_INTERVAL = '1w'
+HISTORY_WINDOW_SECONDS = 7 * 24 * 60 * 60
+HISTORY_FIDELITY = 60
+HISTORY_REFRESH_SECONDS = int(os.getenv("POLYMARKET_HISTORY_REFRESH_SECONDS", HISTORY_FIDELITY * 60))
+
+# Seconds Gamma metadata is served from cache before it is revalidated
+EVENT_CACHE_TTL = int(os.getenv("POLYMARKET_EVENT_CACHE_TTL", 300))
+SEARCH_CACHE_TTL = int(os.getenv("POLYMARKET_SEARCH_CACHE_TTL", 120))
+
+# Events requested per /public-search page when streaming keyword results
+SEARCH_PAGE_SIZE = int(os.getenv("POLYMARKET_SEARCH_PAGE_SIZE", 10))
+
+async def polymarket_query_event_slug(slug: str, client: PolymarketClient, semaphore: asyncio.Semaphore) -> Dict:
     """
     Return polymarket event from slug
     """
 
     ENDPOINT = f'/events/slug/{slug}'
 
-    resp = await polymarket_get(client=client, semaphore=semaphore, endpoint=ENDPOINT)
-    
+    resp = await polymarket_get_cached(client=client.gamma, semaphore=semaphore, endpoint=ENDPOINT, limiter=client.gamma_limiter, route='/events/slug', cache=client.metadata_cache, ttl=EVENT_CACHE_TTL, single_flight=client.single_flight)
+
     return resp
 
-async def polymarket_get_events_from_keyword(keyword: str, limit: int, client: httpx.AsyncClient, semaphore: asyncio.Semaphore) -> List[Dict]:
+async def polymarket_get_events_from_keyword(keyword: str, limit: int, client: PolymarketClient, semaphore: asyncio.Semaphore) -> List[Dict]:
     """
-    Return polymarket list of polymarket events that 
+    Return polymarket list of polymarket events that
     """
 
     ENDPOINT = '/public-search'
@@ -28,55 +60,290 @@ async def polymarket_get_events_from_keyword(keyword: str, limit: int, client: h
         'limit_per_type' : limit
     }
 
-    resp = await polymarket_get(client=client, semaphore=semaphore, endpoint=ENDPOINT, params=PARAMS)
+    resp = await polymarket_get_cached(client=client.gamma, semaphore=semaphore, endpoint=ENDPOINT, params=PARAMS, limiter=client.gamma_limiter, route=ENDPOINT, cache=client.metadata_cache, ttl=SEARCH_CACHE_TTL, single_flight=client.single_flight)
 
     events = resp.get('events',[])
 
     return events
 
+async def polymarket_iter_events_from_keyword(keyword: str, limit: int | None, client: PolymarketClient, semaphore: asyncio.Semaphore) -> AsyncIterator[Dict]:
+    """
+    Yield polymarket events matching a keyword page by page, up to limit events or every page when limit is None, so
+    callers can start on the first page while later pages are still being fetched
+    """
+
+    ENDPOINT = '/public-search'
+    page_size = SEARCH_PAGE_SIZE if limit is None else min(limit, SEARCH_PAGE_SIZE)
+
+    page = 1
+    yielded = 0
+    while limit is None or yielded < limit:
+        PARAMS = {
+            'q' : keyword,
+            'limit_per_type' : page_size,
+            'page' : page
+        }
+
+        resp = await polymarket_get_cached(client=client.gamma, semaphore=semaphore, endpoint=ENDPOINT, params=PARAMS, limiter=client.gamma_limiter, route=ENDPOINT, cache=client.metadata_cache, ttl=SEARCH_CACHE_TTL, single_flight=client.single_flight)
+
+        events = resp.get('events',[])
+        for event in events if limit is None else events[:limit - yielded]:
+            yield event
+            yielded += 1
+
+        # Without pagination metadata a short page is the last one
+        pagination = resp.get('pagination')
+        has_more = pagination.get('hasMore', False) if pagination else len(events) == page_size
+        if not events or not has_more:
+            return
+
+        page += 1
+
 # Fix this to take into count new nested structure of markets but keep async
-async def polymarket_price_history(data: Dict, client: httpx.AsyncClient, semaphore: asyncio.Semaphore) -> Dict:
+async def polymarket_price_history(data: Dict, client: PolymarketClient, semaphore: asyncio.Semaphore) -> Dict:
     """
     Return price history for a given market and outcome
+
+    When the tokenId is cached only the tail since the last cached timestamp is fetched, appended and trimmed to the window
     """
 
     ENDPOINT = '/prices-history'
-    PARAMS = {
-            'market':data['tokenId'],
-            'interval':'1w',
-            'fidelity':60
-            }
+    token_id = data['tokenId']
 
-    resp = await polymarket_get(client=client, semaphore=semaphore, endpoint=ENDPOINT, params=PARAMS)
+    now = int(time.time())
+    window_start = now - HISTORY_WINDOW_SECONDS
 
-    data['history'] = resp.get('history',[])
+    cached = None
+    if client.cache is not None:
+        cached = await client.cache.load_history(token_id, HISTORY_FIDELITY)
 
-    if data['history']:
-        # API returns results in long format [{t: ..., p: ...}, {t: ..., p: ...}]. Convert to wide to speed serialization
-        data['history'] = {key: [d[key] for d in data['history']] for key in data['history'][0]}
+    if cached and cached['t'] and cached['t'][-1] >= window_start:
+        last_ts = cached['t'][-1]
+
+        # The tail ends on a fidelity step rather than the current second, so concurrent tasks fetching the same
+        # token send identical params and share one single-flight request
+        end_ts = now - now % (HISTORY_FIDELITY * 60)
+
+        if now - last_ts < HISTORY_REFRESH_SECONDS or end_ts <= last_ts:
+            # Nothing new is due at this fidelity, serve the cache
+            metrics.incr("history_cache:fresh")
+            tail = {'t': [], 'p': []}
+        else:
+            metrics.incr("history_cache:delta")
+            PARAMS = {
+                    'market':token_id,
+                    'startTs':last_ts + 1,
+                    'endTs':end_ts,
+                    'fidelity':HISTORY_FIDELITY
+                    }
+            resp = await polymarket_get(client=client.clob, semaphore=semaphore, endpoint=ENDPOINT, params=PARAMS, limiter=client.clob_limiter, route=ENDPOINT, single_flight=client.single_flight)
+            tail = _history_to_wide(resp.get('history',[]))
+
+        history = {
+            't': cached['t'] + [t for t in tail['t'] if t > last_ts],
+            'p': cached['p'] + [p for t, p in zip(tail['t'], tail['p']) if t > last_ts],
+        }
+    else:
+        metrics.incr("history_cache:miss")
+        PARAMS = {
+                'market':token_id,
+                'interval':HISTORY_INTERVAL,
+                'fidelity':HISTORY_FIDELITY
+                }
+        resp = await polymarket_get(client=client.clob, semaphore=semaphore, endpoint=ENDPOINT, params=PARAMS, limiter=client.clob_limiter, route=ENDPOINT, single_flight=client.single_flight)
+        history = _history_to_wide(resp.get('history',[]))
+
+    # Drop points that have aged out of the window
+    first = bisect.bisect_left(history['t'], window_start)
+    history = {'t': history['t'][first:], 'p': history['p'][first:]}
+
+    if client.cache is not None and history['t']:
+        await client.cache.save_history(token_id, HISTORY_FIDELITY, history, ttl=HISTORY_WINDOW_SECONDS)
+
+    data['history'] = history if history['t'] else []
 
     return data
 
-async def polymarket_get(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, endpoint: str, *,params: dict | None = None,) -> Dict:
+def _history_to_wide(history: list) -> dict:
+    # API returns results in long format [{t: ..., p: ...}, {t: ..., p: ...}]. Convert to wide to speed serialization
+    return {
+        't': [d['t'] for d in history],
+        'p': [d['p'] for d in history],
+    }
+
+def _parse_retry_after(resp: httpx.Response) -> float | None:
+    """
+    Return the Retry-After header in seconds, it may be given as seconds or as an http date
+    """
+
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+def _backoff_delay(attempt: int, retry_after: float | None) -> float:
+    # Full jitter exponential backoff, never sooner than upstream asked for
+    delay = random.uniform(0, min(POLYMARKET_BACKOFF_MAX, POLYMARKET_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, POLYMARKET_RETRY_AFTER_MAX))
+    return delay
+
+async def polymarket_get_cached(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, endpoint: str, *, cache: MetadataCache, ttl: int, params: dict | None = None, limiter: AdaptiveRateLimiter | None = None, route: str | None = None, single_flight: SingleFlight | None = None) -> Dict:
     """
-    async get polymarket get function with error handling
+    polymarket_get for metadata payloads, served from cache while fresh and revalidated with ETag/Last-Modified once stale
     """
-    
+
+    route = route or endpoint
+    cache_key = _cache_key(endpoint, params)
+
+    entry, tier = await cache.get(cache_key)
+    if entry is not None and is_fresh(entry):
+        metrics.incr(f"metadata_cache:{route}:{tier}_hit")
+        return entry["payload"]
+
+    async def refresh() -> Dict:
+        return await _refresh_cached(client, semaphore, endpoint, cache=cache, cache_key=cache_key, entry=entry, ttl=ttl, params=params, limiter=limiter, route=route)
+
+    if single_flight is None:
+        return await refresh()
+    return await single_flight.do(f"cached:{cache_key}", refresh)
+
+async def _refresh_cached(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, endpoint: str, *, cache: MetadataCache, cache_key: str, entry: dict | None, ttl: int, params: dict | None, limiter: AdaptiveRateLimiter | None, route: str) -> Dict:
+    """
+    Fetch or revalidate a stale metadata entry and store the result
+    """
+
+    # Ask upstream to answer 304 if our stale copy is still current
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    resp = await polymarket_get_response(client=client, semaphore=semaphore, endpoint=endpoint, params=params, limiter=limiter, route=route, headers=headers or None)
+
+    if resp.status_code == 304 and entry is not None:
+        metrics.incr(f"metadata_cache:{route}:revalidated")
+        payload = entry["payload"]
+    else:
+        metrics.incr(f"metadata_cache:{route}:miss")
+        payload = resp.json()
+
+    await cache.put(cache_key, {
+        "payload": payload,
+        "etag": resp.headers.get("ETag") or (entry or {}).get("etag"),
+        "last_modified": resp.headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+        "expires_at": time.time() + ttl,
+    })
+
+    return payload
+
+def _cache_key(endpoint: str, params: dict | None) -> str:
+    # Stable across processes regardless of parameter order
+    canonical = json.dumps([endpoint, params or {}], sort_keys=True)
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+async def polymarket_get(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, endpoint: str, *,params: dict | None = None, limiter: AdaptiveRateLimiter | None = None, route: str | None = None, single_flight: SingleFlight | None = None) -> Dict:
+    """
+    async get polymarket get function with error handling, identical concurrent calls share a request through single_flight
+    """
+
+    async def fetch() -> Dict:
+        resp = await polymarket_get_response(client=client, semaphore=semaphore, endpoint=endpoint, params=params, limiter=limiter, route=route)
+        return resp.json()
+
+    if single_flight is None:
+        return await fetch()
+    return await single_flight.do(f"get:{_cache_key(str(client.base_url) + endpoint, params)}", fetch)
+
+async def polymarket_get_response(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, endpoint: str, *,params: dict | None = None, limiter: AdaptiveRateLimiter | None = None, route: str | None = None, headers: dict | None = None) -> httpx.Response:
+    """
+    Return the 200 (or 304 to a conditional request) response for a polymarket get
+
+    Timeouts, 429s and 5xxs are retried with backoff, route names the circuit breaker and metrics for the endpoint
+    """
+
+    route = route or endpoint
+    breaker = get_breaker(route)
+
+    # The breaker admits and counts the call once however many attempts it takes, so a single request retried
+    # until it gives up is one failure, not one per attempt
+    breaker.before_request()
+
+    for attempt in range(POLYMARKET_MAX_RETRIES + 1):
+        metrics.incr(f"requests:{route}")
+
+        try:
+            resp = await _polymarket_get_once(client, semaphore, endpoint, params=params, limiter=limiter, headers=headers)
+        except PolymarketRateLimit as e:
+            # Upstream is alive, the rate limiter handles throttling so the breaker is not tripped
+            breaker.record_success()
+            metrics.incr(f"rate_limited:{route}")
+            error = e
+        except PolymarketUnavailable as e:
+            metrics.incr(f"unavailable:{route}")
+            error = e
+        except httpx.HTTPStatusError:
+            # Other 4xxs will not succeed on retry
+            breaker.record_success()
+            metrics.incr(f"client_errors:{route}")
+            raise
+        else:
+            breaker.record_success()
+            return resp
+
+        if attempt == POLYMARKET_MAX_RETRIES:
+            metrics.incr(f"retries_exhausted:{route}")
+            if isinstance(error, PolymarketUnavailable):
+                breaker.record_failure()
+            raise error
+
+        # Sleep outside the semaphore so waiting retries do not hold a request slot
+        metrics.incr(f"retries:{route}")
+        await asyncio.sleep(_backoff_delay(attempt, error.retry_after))
+
+    raise PolymarketUnavailable()
+
+async def _polymarket_get_once(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, endpoint: str, *,params: dict | None = None, limiter: AdaptiveRateLimiter | None = None, headers: dict | None = None) -> httpx.Response:
+    """
+    Single polymarket get request, raises on responses other than 200 or 304
+    """
+
     async with semaphore:
+        # Wait for a slot in the cluster wide bucket for this host
+        if limiter is not None:
+            await limiter.acquire()
+
         try:
-            resp = await client.get(endpoint, params=params)
+            resp = await client.get(endpoint, params=params, headers=headers)
         except httpx.TimeoutException as e:
             raise PolymarketUnavailable() from e
+        except httpx.TransportError as e:
+            raise PolymarketUnavailable(str(e)) from e
 
-    if resp.status_code == 200:
-        return resp.json()
+    if resp.status_code in (200, 304):
+        return resp
 
     if resp.status_code == 429:
-        raise PolymarketRateLimit()
+        if limiter is not None:
+            await limiter.on_rate_limited()
+        raise PolymarketRateLimit(retry_after=_parse_retry_after(resp))
 
     if resp.status_code >= 500:
-        raise PolymarketUnavailable()
+        raise PolymarketUnavailable(retry_after=_parse_retry_after(resp))
 
     resp.raise_for_status()
 
-    raise PolymarketUnavailable()
\ No newline at end of file
+    raise PolymarketUnavailable()
@@ -1,17 +1,39 @@
 import asyncio
 import logging
+import os
 
-from fastapi_app.core.polymarket_client import PolymarketClient
+from fastapi_app.core.polymarket_client import PolymarketClient, PolymarketError
 from fastapi_app.core.celery_logging_config import get_logger
-from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository, BufferedIngestionWriter
 from fastapi_app.schemas.ingestion import IngestionRequest
 from fastapi_app.schemas.intent import ExactSearch, KeywordSearch
-from fastapi_app.services.polymarket.client import polymarket_get_events_from_keyword, polymarket_price_history, polymarket_query_event_slug
-from fastapi_app.services.polymarket.parsing import polymarket_get_market_ids, create_tree, add_market_to_tree, market_to_tree_delta
+from fastapi_app.services.polymarket.client import polymarket_iter_events_from_keyword, polymarket_price_history, polymarket_query_event_slug
+from fastapi_app.schemas.providers import PolymarketConfig
+from fastapi_app.services.polymarket.parsing import polymarket_get_market_ids, market_priority, market_to_tree_delta, metadata_only_markets, select_top_markets, with_derived_complement
+from fastapi_app.services.polymarket.scheduler import FetchScheduler
+from utils.codecs import wire_encode, wire_encodings
+from utils.merge_tree_deltas import merge_tree_deltas
 
 logger = get_logger(__name__)
 
-async def polymarket_handler(req: IngestionRequest, client: PolymarketClient, task_id: str):
+# History fetches in flight per task, and markets the keyword search may queue ahead of them
+HISTORY_FETCH_WINDOW = int(os.getenv("POLYMARKET_HISTORY_FETCH_WINDOW", 10))
+MAX_PENDING_MARKETS = int(os.getenv("POLYMARKET_MAX_PENDING_MARKETS", 500))
+
+def history_scheduler(client: PolymarketClient, semaphore: asyncio.Semaphore, max_pending: int | None = None) -> FetchScheduler:
+    """
+    Price history fetches run through a bounded window, highest volume markets first
+    """
+
+    return FetchScheduler(
+        lambda datum: polymarket_price_history(datum, client, semaphore),
+        window=HISTORY_FETCH_WINDOW,
+        priority=market_priority,
+        max_pending=max_pending,
+        tolerate=(PolymarketError,),
+    )
+
+async def polymarket_handler(req: IngestionRequest, client: PolymarketClient, task_id: str, repo: AsyncIngestionRepository | None = None):
     """
     Intake ingestion request, parse intent, query data, and return a list of dicts with the following format:
 
@@ -26,7 +48,7 @@ async def polymarket_handler(req: IngestionRequest, client: PolymarketClient, ta
 
     """
     
-    redis_repository = AsyncIngestionRepository()
+    redis_repository = repo if repo is not None else AsyncIngestionRepository()
 
     # Define semaphore for this module to limit requests, semaphore must be created in each event loop or asyncio.run will cause error
     polymarket_sem = asyncio.Semaphore(10) 
@@ -34,89 +56,246 @@ async def polymarket_handler(req: IngestionRequest, client: PolymarketClient, ta
     search = req.search
 
     if isinstance(search, ExactSearch):
-        await polymarket_search_event(slug = req.search_term, client = client, semaphore = polymarket_sem, repo = redis_repository, task_id = task_id)
+        await polymarket_search_event(slug = req.search_term, client = client, semaphore = polymarket_sem, repo = redis_repository, task_id = task_id, config = req.config)
     elif isinstance(search, KeywordSearch):
-        await polymarket_search_keyword(keyword = req.search_term, limit = req.search.limit, client = client, semaphore = polymarket_sem, repo = redis_repository, task_id = task_id) #type:ignore 
+        await polymarket_search_keyword(keyword = req.search_term, limit = req.search.limit, client = client, semaphore = polymarket_sem, repo = redis_repository, task_id = task_id, config = req.config, markets_per_event = search.markets_per_event, market_budget = search.market_budget) #type:ignore
     else:
         raise TypeError("search must be exact or keyword")
     
-async def polymarket_search_event(slug: str, client: PolymarketClient, semaphore: asyncio.Semaphore, repo: AsyncIngestionRepository, task_id: str):
+async def polymarket_search_event(slug: str, client: PolymarketClient, semaphore: asyncio.Semaphore, repo: AsyncIngestionRepository, task_id: str, config: PolymarketConfig = PolymarketConfig()):
     """
     return all markets in an event in the format described in polymarker_handler
     """
 
     # Query metadata of event from Gamma API
-    event = await polymarket_query_event_slug(slug, client.gamma, semaphore)
+    event = await polymarket_query_event_slug(slug, client, semaphore)
 
     # Parse metadata from response
-    data = polymarket_get_market_ids(event)
+    data = polymarket_get_market_ids(event, config.derive_binary_complement, config.complement_opt_out)
 
-    tasks = [polymarket_price_history(datum, client.clob, semaphore) for datum in data]
-
-    tree = create_tree()
-    
     await repo.data_loading_status_start(task_id)
 
     try:
-        for coroutine in asyncio.as_completed(tasks):
-            result = await coroutine
+        fetched = 0
+        last_error = None
+        async with history_scheduler(client, semaphore) as scheduler, repo.buffered_writer() as writer:
+            for datum in data:
+                await scheduler.submit(datum)
+            await scheduler.close()
+
+            async for result in scheduler.results():
+                # One market failing after retries should not discard the others
+                if isinstance(result, PolymarketError):
+                    logger.warning(f"Skipping market after failed history fetch: {result!r}")
+                    last_error = result
+                    continue
+                fetched += 1
+
+                # Binary markets fetched alone also yield their derived complement
+                for market in with_derived_complement(result):
 
-            # Append raw market data to list of raw market data for logging
-            await repo.save_raw_market(task_id, result)
+                    # Histories are stored once as columnar blobs, records keep a reference
+                    market['history'] = await writer.save_history_blob(task_id, market['history'])
 
-            # Update tree 
-            tree = add_market_to_tree(tree, result)
-            await repo.save_tree(task_id, tree)
-        
-        # Set loading status to complete
+                    # Append raw market data to list of raw market data for logging
+                    await writer.save_raw_market(task_id, market)
+
+                    # Exact searches poll, stream and materialize their tree from deltas like keyword searches
+                    await writer.save_tree_delta(task_id, market_to_tree_delta(market))
+
+        # Every history fetch failed, report the upstream error instead of an empty result
+        if last_error is not None and not fetched:
+            raise last_error
+
+        # Set loading status to complete once the result tree is in place
+        await materialize_tree(repo, task_id)
         await repo.data_loading_status_end(task_id)
 
     except Exception as e:
-        await repo.data_loading_status_failed(task_id)
+        # Error first, a client seeing the FAILED status reads it straight away
         await repo.set_error(task_id,e)
+        await repo.data_loading_status_failed(task_id)
         raise
 
-async def polymarket_search_keyword(keyword : str, limit : int, client: PolymarketClient, semaphore: asyncio.Semaphore, repo: AsyncIngestionRepository, task_id: str):
+async def polymarket_search_keyword(keyword : str, limit : int | None, client: PolymarketClient, semaphore: asyncio.Semaphore, repo: AsyncIngestionRepository, task_id: str, config: PolymarketConfig = PolymarketConfig(), markets_per_event: int | None = None, market_budget: int | None = None):
     """
     returns all markets related to keyword search in the form described by polymarket_handler
+
+    Runs as a pipeline: search pages are parsed as they arrive, their markets are queued on a fetch scheduler that
+    fetches a bounded window of histories at a time, and each finished market is written as a tree delta
+
+    Only the top markets_per_event markets of each event, and the top market_budget overall, have their history
+    fetched, highest volume first. The rest are written metadata only. A global budget needs every candidate, so
+    with one set all search pages are read before the first history is fetched
     """
-    
+
     print("ENTERED polymarket_search_keyword")
 
-    # Get list of events relating to keyword search
-    events = await polymarket_get_events_from_keyword(keyword, limit, client.gamma, semaphore)
+    scheduler = history_scheduler(client, semaphore, max_pending=MAX_PENDING_MARKETS)
 
-    data = []
-    for event in events:
-        data.extend(polymarket_get_market_ids(event))
-    
-    tasks = [polymarket_price_history(datum, client.clob, semaphore) for datum in data]
+    # Per-market writes are pipelined in micro batches and flushed before the status is set to complete
+    writer = repo.buffered_writer()
+
+    async def produce_markets():
+        candidates = []
+
+        # Parse each event as its search page arrives
+        async for event in polymarket_iter_events_from_keyword(keyword, limit, client, semaphore):
+            data = polymarket_get_market_ids(event, config.derive_binary_complement, config.complement_opt_out)
+            selected, deferred = select_top_markets(data, markets_per_event)
+
+            for datum in deferred:
+                await save_metadata_only(writer, task_id, datum)
+
+            if market_budget is None:
+                for datum in selected:
+                    await scheduler.submit(datum)
+            else:
+                candidates.extend(selected)
+
+        if market_budget is not None:
+            selected, deferred = select_top_markets(candidates, market_budget)
+
+            for datum in deferred:
+                await save_metadata_only(writer, task_id, datum)
+
+            for datum in selected:
+                await scheduler.submit(datum)
+
+        await scheduler.close()
 
     # Set loading status to in progress
     await repo.data_loading_status_start(task_id)
 
     try:
-        for index, coroutine in enumerate(asyncio.as_completed(tasks)):
-            
-            result = await coroutine
-            
-            # Append raw market data to list of raw market data for logging
-            await repo.save_raw_market(task_id, result)
-            
-            # Update tree (No longer needed?)
-            #tree = add_market_to_tree(tree, result)
+        fetched = 0
+        last_error = None
+
+        async with scheduler, writer, asyncio.TaskGroup() as pipeline:
+            pipeline.create_task(produce_markets())
+
+            async for result in scheduler.results():
+
+                # One market failing after retries should not discard the others
+                if isinstance(result, PolymarketError):
+                    logger.warning(f"Skipping market after failed history fetch: {result!r}")
+                    last_error = result
+                    continue
+
+                fetched += 1
+
+                # Binary markets fetched alone also yield their derived complement
+                for market in with_derived_complement(result):
+
+                    # Histories are stored once as columnar blobs, records keep a reference
+                    market['history'] = await writer.save_history_blob(task_id, market['history'])
+
+                    # Append raw market data to list of raw market data for logging
+                    await writer.save_raw_market(task_id, market)
 
-            # Create tree update dict
-            tree_delta = market_to_tree_delta(result)
+                    # Create tree update dict
+                    tree_delta = market_to_tree_delta(market)
 
-            logger.debug(tree_delta)
+                    logger.debug(tree_delta)
 
-            await repo.save_tree_delta(task_id, tree_delta)
+                    await writer.save_tree_delta(task_id, tree_delta)
 
-        # Set loading status to complete
+        # Every history fetch failed, report the upstream error instead of an empty result
+        if last_error is not None and not fetched:
+            raise last_error
+
+        # Set loading status to complete once the result tree is in place
+        await materialize_tree(repo, task_id)
         await repo.data_loading_status_end(task_id)
 
     except Exception as e:
+        # Report the stage's own error rather than the task group wrapping it, every error of the group is logged
+        error = e
+        if isinstance(e, ExceptionGroup):
+            logger.error(f"Keyword search of task {task_id} failed with {len(e.exceptions)} errors", exc_info=e)
+            while isinstance(error, ExceptionGroup):
+                error = error.exceptions[0]
+
+        # Error first, a client seeing the FAILED status reads it straight away
+        await repo.set_error(task_id,error)
         await repo.data_loading_status_failed(task_id)
+        if error is not e:
+            raise error from e
+        raise
+
+async def save_metadata_only(repo: AsyncIngestionRepository | BufferedIngestionWriter, task_id: str, market: dict):
+    """
+    Keep a market whose history was not fetched so it can be requested later, and show it metadata only
+    """
+
+    await repo.save_deferred_market(task_id, market)
+
+    for record in metadata_only_markets(market):
+        await repo.save_tree_delta(task_id, market_to_tree_delta(record))
+
+async def materialize_tree(repo: AsyncIngestionRepository, task_id: str):
+    """
+    Compact a task's deltas into the one tree served by GET /ingestion/{task_id}/tree, so readers of a finished
+    task fetch it whole instead of merging every delta. Histories stay blob references.
+
+    The tree response is also stored as compressed json with its histories resolved, which the api sends as is.
+    It is the one copy of the histories kept per task, delta responses are built from the blobs
+    """
+
+    deltas = await repo.load_tree_deltas(task_id)
+    if not deltas:
+        return
+
+    tree = merge_tree_deltas({}, deltas)
+
+    wire = {}
+    if wire_encodings():
+        resolved = await repo.resolve_histories(tree)
+        wire["tree"] = wire_encode({"status": "success", "data": resolved})
+
+    await repo.save_result_tree(task_id, tree, wire)
+
+async def polymarket_fetch_deferred(parent_task_id: str, token_ids: list[str] | None, client: PolymarketClient, repo: AsyncIngestionRepository, task_id: str):
+    """
+    Fetch the history of markets a keyword search returned metadata only, writing their deltas under task_id
+    """
+
+    semaphore = asyncio.Semaphore(10)
+
+    data = await repo.load_deferred_markets(parent_task_id, token_ids)
+
+    await repo.data_loading_status_start(task_id)
+
+    try:
+        fetched = 0
+        last_error = None
+        async with history_scheduler(client, semaphore) as scheduler, repo.buffered_writer() as writer:
+            for datum in data:
+                await scheduler.submit(datum)
+            await scheduler.close()
+
+            async for result in scheduler.results():
+                # One market failing after retries should not discard the others
+                if isinstance(result, PolymarketError):
+                    logger.warning(f"Skipping market after failed history fetch: {result!r}")
+                    last_error = result
+                    continue
+                fetched += 1
+
+                for market in with_derived_complement(result):
+                    market['history'] = await writer.save_history_blob(task_id, market['history'])
+                    await writer.save_raw_market(task_id, market)
+                    await writer.save_tree_delta(task_id, market_to_tree_delta(market))
+
+        # Every history fetch failed, report the upstream error instead of an empty result
+        if last_error is not None and not fetched:
+            raise last_error
+
+        await materialize_tree(repo, task_id)
+        await repo.data_loading_status_end(task_id)
+
+    except Exception as e:
+        # Error first, a client seeing the FAILED status reads it straight away
         await repo.set_error(task_id,e)
+        await repo.data_loading_status_failed(task_id)
         raise
@@ -1,10 +1,14 @@
+import heapq
 import json
 from collections import defaultdict
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List
 
-def polymarket_get_market_ids(event: Dict[str, Any]) -> List[Dict]:
+def polymarket_get_market_ids(event: Dict[str, Any], derive_complement: bool = False, complement_opt_out: Iterable[str] = ()) -> List[Dict]:
     """
     Takes events slug query response and extracts relevant data to query price history
+
+    With derive_complement binary markets only emit their first outcome, carrying the second under 'complement'
+    so its history can be derived instead of fetched
     """
 
     data = []
@@ -25,6 +29,7 @@ def polymarket_get_market_ids(event: Dict[str, Any]) -> List[Dict]:
         market_closed = market["closed"]
         market_active = market["active"]
         volume = float(market.get('volume',0))
+        liquidity = float(market.get('liquidity') or 0)
 
         # Check if the the market has a CLOB orderbook, otherwise price history not available
         if clobTokenIds and volume and market_active and not market_closed:
@@ -33,7 +38,9 @@ def polymarket_get_market_ids(event: Dict[str, Any]) -> List[Dict]:
             if not volume:
                 print(market)
 
-            for i in range(len(outcomes)):
+            derive = derive_complement and len(outcomes) == 2 and market_id not in complement_opt_out
+
+            for i in range(1 if derive else len(outcomes)):
                 next_market = {
                         'provider':'polymarket',
                         'event_id':event_id,
@@ -44,58 +51,77 @@ def polymarket_get_market_ids(event: Dict[str, Any]) -> List[Dict]:
                         'volume':volume,
                         'outcome':outcomes[i], 
                         'tokenId':tokenIds[i],
-                        'volume':volume
+                        'volume':volume,
+                        'liquidity':liquidity
                         }
-                
+
+                if derive:
+                    next_market['complement'] = {'outcome':outcomes[1], 'tokenId':tokenIds[1]}
+
                 data.append(next_market)
 
     return data
 
-def create_tree():
+def market_priority(market: Dict) -> tuple:
+    # Higher volume first, liquidity breaks ties
+    return (market['volume'], market.get('liquidity', 0.0))
 
-    tree = defaultdict(
-        lambda: {
-            "event_title": None,
-            "event_image":None,
-            "markets": defaultdict(
-                lambda: {
-                    "market_question": None,
-                    "volume":None,
-                    "outcomes": []
-                }
-            )
-        }
-    )
+def select_top_markets(records: List[Dict], k: int | None) -> tuple[List[Dict], List[Dict]]:
+    """
+    Split outcome records into those of the k highest priority markets, in priority order, and the rest.
+    Outcomes of the same market stay together
+    """
 
-    return tree
+    markets: Dict[str, List[Dict]] = {}
+    for record in records:
+        markets.setdefault(record['market_id'], []).append(record)
 
-def add_market_to_tree(tree: Dict, market: Dict) -> Dict:
-    event_id = market['event_id']
-    market_id = market['market_id']
+    if k is None:
+        top = sorted(markets.values(), key=lambda outcomes: market_priority(outcomes[0]), reverse=True)
+    else:
+        top = heapq.nlargest(k, markets.values(), key=lambda outcomes: market_priority(outcomes[0]))
 
-    # Define event node
-    event = tree[event_id]
-
-    # Populate event node
-    event["event_title"] = market["event_title"]
-    event["event_image"] = market["event_image"]
-
-    # Define market node
-    market_node = event["markets"][market_id]  # type: ignore[index]
-
-    #Populate market node
-    market_node["market_question"] = market["market_question"]
-    market_node["volume"] = market["volume"]
-    market_node["outcomes"].append(  # type: ignore[index]
-        {
-            'provider':market['provider'],
-            'tokenId':market['tokenId'],
-            'outcome':market['outcome'],
-            'history':market['history']
-        }
-    )
+    top_ids = {outcomes[0]['market_id'] for outcomes in top}
 
-    return tree
+    selected = [record for outcomes in top for record in outcomes]
+    deferred = [record for market_id, outcomes in markets.items() if market_id not in top_ids for record in outcomes]
+
+    return selected, deferred
+
+def metadata_only_markets(market: Dict) -> List[Dict]:
+    """
+    Return the outcome records of a market whose history was not fetched, flagged as deferred
+    """
+
+    records = with_derived_complement({**market, 'history':[]})
+    for record in records:
+        record['deferred'] = True
+
+    return records
+
+def with_derived_complement(market: Dict) -> List[Dict]:
+    """
+    Return the fetched market plus, for binary markets fetched alone, its complement with history 1 - p
+    """
+
+    complement = market.pop('complement', None)
+    if complement is None:
+        return [market]
+
+    history = market['history']
+    if history:
+        history = {'t': list(history['t']), 'p': [round(1 - p, 6) for p in history['p']]}
+
+    derived_market = {
+        **market,
+        'outcome':complement['outcome'],
+        'tokenId':complement['tokenId'],
+        'history':history,
+        'derived':True,
+        'derived_from':market['tokenId'],
+    }
+
+    return [market, derived_market]
 
 def materialize_polymarket(flat_rows: List[Dict]) -> Dict: 
     
@@ -147,6 +173,21 @@ def market_to_tree_delta(market: dict) -> dict:
     event_id = market['event_id']
     market_id = market['market_id']
 
+    outcome_node = {
+                    "provider": market['provider'],
+                    "tokenId": market['tokenId'],
+                    "history":market["history"]
+                    }
+
+    # Flag series synthesized from the other outcome of a binary market
+    if market.get('derived'):
+        outcome_node["derived"] = True
+        outcome_node["derived_from"] = market['derived_from']
+
+    # Metadata only, history can be requested later
+    if market.get('deferred'):
+        outcome_node["history_deferred"] = True
+
     delta = {
             event_id: {
                 "event_title": market["event_title"],
@@ -156,15 +197,11 @@ def market_to_tree_delta(market: dict) -> dict:
                         "market_question": market["market_question"],
                         "volume": market["volume"],
                         "outcomes": {
-                            market["outcome"]: {
-                                                "provider": market['provider'],
-                                                "tokenId": market['tokenId'],
-                                                "history":market["history"]
-                                                }
+                            market["outcome"]: outcome_node
                         }
                     }
                 }
             }
         }
     
-    return delta
\ No newline at end of file
+    return delta
@@ -0,0 +1,124 @@
+"""
+This module creates a fetch scheduler for price history requests. Items wait in a priority queue and a fixed window
+of workers fetches them highest priority first, so only the in-flight requests exist as coroutines no matter how many
+outcomes a search returns, and the most important markets finish first.
+"""
+
+import asyncio
+import heapq
+import itertools
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+class _Done:
+    pass
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def _descending(priority):
+    # heapq pops the smallest entry, negate so the highest priority comes out first
+    if isinstance(priority, tuple):
+        return tuple(-p for p in priority)
+    return -priority
+
+class FetchScheduler:
+    def __init__(
+        self,
+        fetch: Callable[[Any], Awaitable[Any]],
+        window: int = 10,
+        priority: Callable[[Any], Any] | None = None,
+        max_pending: int | None = None,
+        tolerate: tuple[type[BaseException], ...] = (),
+    ):
+        """
+        fetch: coroutine function run for every submitted item
+        window: maximum number of fetches in flight
+        priority: key of an item, higher is fetched first, items of equal priority go in submission order
+        max_pending: submit waits while this many items are queued
+        tolerate: exceptions yielded from results() in place of a result instead of being raised
+        """
+        self.fetch = fetch
+        self.window = window
+        self.priority = priority or (lambda item: 0)
+        self.max_pending = max_pending
+        self.tolerate = tolerate
+
+        self._pending: list = []
+        self._sequence = itertools.count()
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._results: asyncio.Queue = asyncio.Queue(maxsize=window)
+        self._workers: list[asyncio.Task] = []
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.cancel()
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.window)]
+
+    async def submit(self, item: Any):
+        async with self._changed:
+            if self.max_pending is not None:
+                await self._changed.wait_for(lambda: len(self._pending) < self.max_pending) #type: ignore
+            heapq.heappush(self._pending, (_descending(self.priority(item)), next(self._sequence), item))
+            self._changed.notify_all()
+
+    async def close(self):
+        # No more items, workers exit once the queue is drained
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    async def cancel(self):
+        # Drop queued items and cancel fetches in flight
+        self._pending.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def results(self) -> AsyncIterator[Any]:
+        """
+        Yield fetch results in completion order until every submitted item is done
+        """
+
+        finished_workers = 0
+        while finished_workers < len(self._workers):
+            result = await self._results.get()
+
+            if isinstance(result, _Done):
+                finished_workers += 1
+                continue
+
+            if isinstance(result, _Failed):
+                raise result.error
+
+            yield result
+
+    async def _work(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: bool(self._pending) or self._closed)
+                if not self._pending:
+                    break
+                _, _, item = heapq.heappop(self._pending)
+                self._changed.notify_all()
+
+            try:
+                result = await self.fetch(item)
+            except self.tolerate as e:
+                result = e
+            except Exception as e:
+                await self._results.put(_Failed(e))
+                break
+
+            await self._results.put(result)
+
+        await self._results.put(_Done())
@@ -0,0 +1,58 @@
+"""
+This module deduplicates ingestion requests. A request's fingerprint is the hash of its canonical json, identical
+requests submitted within the freshness window get the task of the first one back instead of starting a new upstream
+fan-out, unless that task failed or its data is gone.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Awaitable, Callable
+
+from fastapi_app.core.metrics import metrics
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+
+# 0 disables deduplication
+INGESTION_DEDUP_SECONDS = int(os.getenv("INGESTION_DEDUP_SECONDS", 300))
+
+def request_fingerprint(payload: dict) -> str:
+    # Defaults are filled in by the model, so requests differing only in omitted fields hash the same
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+async def reusable(repo: AsyncIngestionRepository, task_id: str) -> bool:
+    load_status, celery_state = await repo.get_task_state(task_id)
+    if load_status == "FAILED" or celery_state == "FAILURE":
+        return False
+    # Neither state means the task's keys were evicted
+    return load_status != "PENDING" or celery_state is not None
+
+async def submit_deduplicated(repo: AsyncIngestionRepository, payload: dict, enqueue: Callable[[str], Awaitable[None]], window: int = INGESTION_DEDUP_SECONDS) -> tuple[str, bool]:
+    """
+    Return the task id serving payload and whether it was an existing task. enqueue(task_id) starts a new task
+    """
+
+    task_id = str(uuid.uuid4())
+
+    # Mirrored before the request is claimed, so a duplicate arriving meanwhile already sees a live task
+    await repo.set_celery_state(task_id, "QUEUED", only_new=True)
+
+    if window > 0:
+        fingerprint = request_fingerprint(payload)
+        existing = await repo.claim_request(fingerprint, task_id, window)
+
+        # A failed or evicted task is replaced, unless a concurrent duplicate replaced it first
+        while existing is not None:
+            if await reusable(repo, existing):
+                await repo.discard_celery_state(task_id)
+                metrics.incr("ingestion:deduplicated")
+                return existing, True
+            existing = await repo.replace_request(fingerprint, existing, task_id, window)
+
+    try:
+        await enqueue(task_id)
+    except Exception as e:
+        await repo.set_celery_state(task_id, "FAILURE", str(e))
+        raise
+    return task_id, False
@@ -0,0 +1,174 @@
+"""
+This module creates the retention sweeper. Per task keys and history blobs already expire on their own, the sweeper
+additionally keeps ingestion data under a memory budget by evicting finished ingestion tasks, least recently read
+first, together with the history blobs no remaining task references, so ingestion data never pushes redis into
+evicting broker keys.
+
+The budget covers only what the sweeper can free, the ingestion keys and history blobs. The broker and result
+backend, news keys and the Polymarket caches share the instance but are bounded by their own ttls.
+"""
+
+import asyncio
+import fnmatch
+import logging
+import os
+import time
+import uuid
+
+from fastapi_app.core.metrics import metrics
+from fastapi_app.repositories.ingestion_repository import INGESTION_TTL_SECONDS
+from fastapi_app.repositories.retention_repository import AsyncRetentionRepository
+
+logger = logging.getLogger(__name__)
+
+# Bytes of ingestion keys and history blobs, 0 disables eviction, ttls still apply
+REDIS_MEMORY_BUDGET_BYTES = int(os.getenv("REDIS_MEMORY_BUDGET_BYTES", 512 * 1024 * 1024))
+# Blobs written or referenced this recently are kept, a running task may not have recorded its reference yet
+RETENTION_BLOB_MIN_AGE_SECONDS = int(os.getenv("RETENTION_BLOB_MIN_AGE_SECONDS", 600))
+RETENTION_SWEEP_SECONDS = float(os.getenv("RETENTION_SWEEP_SECONDS", 60))
+RETENTION_EVICT_BATCH = int(os.getenv("RETENTION_EVICT_BATCH", 20))
+
+# First match names the family of a key
+KEY_FAMILIES = [
+    "ingestion:finished",
+    "ingestion:jobs",
+    "ingestion:*:raw",
+    "ingestion:*:tree",
+    "ingestion:*:tree_delta",
+    "ingestion:*:result",
+    "ingestion:*:stream",
+    "ingestion:*:deferred",
+    "ingestion:*:load",
+    "ingestion:*:celery",
+    "ingestion:*:error",
+    "ingestion:*:blobs",
+    "ingestion_request:*",
+    "history:blob:*",
+    "polymarket:history:*",
+    "polymarket:metadata:*",
+    "singleflight:*",
+    "ratelimit:*",
+    "metrics:*",
+    "retention:*",
+    "headlines:*",
+    "topic:*",
+    "keywords:*",
+]
+
+def key_family(key: str) -> str:
+    for family in KEY_FAMILIES:
+        if fnmatch.fnmatchcase(key, family):
+            return family
+    return "other"
+
+async def ingestion_usage(repo: AsyncRetentionRepository) -> tuple[int, dict[str, int]]:
+    # Bytes of the ingestion keys and the size of each history blob
+    ingestion_bytes = sum(size for _, size in await repo.key_usage("ingestion*"))
+    blob_sizes = dict(await repo.key_usage(repo._history_blob_key("*")))
+    return ingestion_bytes, blob_sizes
+
+async def sweep_once(repo: AsyncRetentionRepository, budget: int = REDIS_MEMORY_BUDGET_BYTES) -> dict:
+    """
+    Evict least recently read finished tasks, and the history blobs only they referenced, until ingestion data is
+    under budget
+    """
+
+    await repo.prune_finished(time.time() - INGESTION_TTL_SECONDS)
+
+    used_memory = await repo.used_memory()
+    metrics.set_gauge("retention:used_memory", used_memory)
+
+    # Ingestion data is part of used_memory, it only needs sizing when the whole instance is over budget
+    if not budget or used_memory <= budget:
+        return {"used_memory": used_memory, "ingestion_bytes": None, "budget": budget, "evicted_tasks": 0, "evicted_blobs": 0, "freed_bytes": 0}
+
+    ingestion_bytes, blob_sizes = await ingestion_usage(repo)
+    used = ingestion_bytes + sum(blob_sizes.values())
+    metrics.set_gauge("retention:ingestion_bytes", used)
+
+    # Blobs are shared between tasks, count the live tasks referencing each one
+    references = await repo.blob_references()
+    refcounts: dict[str, int] = {}
+    for blob_keys in references.values():
+        for blob_key in blob_keys:
+            refcounts[blob_key] = refcounts.get(blob_key, 0) + 1
+
+    evicted_blobs = 0
+    async def free_blobs(blob_keys: list[str]) -> int:
+        nonlocal evicted_blobs
+        deleted = await repo.delete_blobs([key for key in blob_keys if key in blob_sizes], RETENTION_BLOB_MIN_AGE_SECONDS)
+        evicted_blobs += len(deleted)
+        return sum(blob_sizes.pop(key) for key in deleted)
+
+    # Blobs left behind by tasks whose keys expired go first
+    freed = await free_blobs([blob_key for blob_key in blob_sizes if blob_key not in refcounts])
+    used -= freed
+
+    evicted = 0
+    while used > budget:
+        task_ids = await repo.least_recently_read(RETENTION_EVICT_BATCH)
+        if not task_ids:
+            break
+
+        for task_id in task_ids:
+            # Lazily freed memory is not reflected in used_memory right away, count what the keys held instead
+            task_bytes = await repo.delete_task(task_id)
+
+            unreferenced = []
+            for blob_key in references.pop(task_id, ()):
+                refcounts[blob_key] -= 1
+                if not refcounts[blob_key]:
+                    unreferenced.append(blob_key)
+            task_bytes += await free_blobs(unreferenced)
+
+            used -= task_bytes
+            freed += task_bytes
+            evicted += 1
+            if used <= budget:
+                break
+
+    if evicted or evicted_blobs:
+        metrics.incr("retention:evicted_tasks", evicted)
+        metrics.incr("retention:evicted_blobs", evicted_blobs)
+        metrics.incr("retention:evicted_bytes", freed)
+        logger.info(f"Evicted {evicted} finished tasks and {evicted_blobs} history blobs, {freed} bytes, to keep ingestion data under {budget} bytes")
+
+    return {"used_memory": used_memory, "ingestion_bytes": used, "budget": budget, "evicted_tasks": evicted, "evicted_blobs": evicted_blobs, "freed_bytes": freed}
+
+async def run_sweeper(repo: AsyncRetentionRepository, interval: float = RETENTION_SWEEP_SECONDS):
+    token = uuid.uuid4().hex
+    while True:
+        try:
+            if await repo.acquire_sweep_lock(token, int(interval * 1000)):
+                await sweep_once(repo)
+        except Exception as e:
+            # A failed sweep is retried next interval rather than stopping the sweeper
+            logger.warning(f"Retention sweep failed: {e!r}")
+        await asyncio.sleep(interval)
+
+async def storage_stats(repo: AsyncRetentionRepository, top_tasks: int = 50) -> dict:
+    """
+    Bytes and key counts per key family, and bytes per task for the largest tasks
+    """
+
+    families: dict[str, dict] = {}
+    tasks: dict[str, int] = {}
+
+    for key, size in await repo.key_usage():
+        family = families.setdefault(key_family(key), {"keys": 0, "bytes": 0})
+        family["keys"] += 1
+        family["bytes"] += size
+
+        parts = key.split(":")
+        if parts[0] == "ingestion" and len(parts) == 3:
+            tasks[parts[1]] = tasks.get(parts[1], 0) + size
+
+    largest = sorted(tasks.items(), key=lambda item: item[1], reverse=True)[:top_tasks]
+
+    return {
+        "used_memory": await repo.used_memory(),
+        "budget": REDIS_MEMORY_BUDGET_BYTES,
+        "families": dict(sorted(families.items(), key=lambda item: item[1]["bytes"], reverse=True)),
+        "tasks": [{"task_id": task_id, "bytes": size} for task_id, size in largest],
+        "task_count": len(tasks),
+    }
@@ -0,0 +1,82 @@
+"""
+This module streams an ingestion task's deltas and status transitions from its redis stream to the SSE and websocket
+endpoints. Every event carries its stream id, so a client that reconnects resumes after the last event it received.
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from utils.history_codec import history_to_lists, map_histories
+
+TASK_STREAM_BLOCK_MS = int(os.getenv("TASK_STREAM_BLOCK_MS", 15000))
+# Open streams per api process, each holds a redis connection while it waits for events
+TASK_STREAM_MAX_SUBSCRIBERS = int(os.getenv("TASK_STREAM_MAX_SUBSCRIBERS", 100))
+
+# Streams read on a pool of their own, one connection per subscriber, so their blocking reads never take the
+# connections of the other routes
+stream_repository = AsyncIngestionRepository(build_async_client(max_connections=TASK_STREAM_MAX_SUBSCRIBERS, blocking=True))
+stream_subscribers = asyncio.Semaphore(TASK_STREAM_MAX_SUBSCRIBERS)
+
+# Loading statuses as check_request reports them
+STATUS_NAMES = {"IN_PROGRESS": "in_progress", "COMPLETE": "success", "FAILED": "failure"}
+FINAL_STATUSES = {"COMPLETE", "FAILED"}
+
+async def status_event(repo: AsyncIngestionRepository, task_id: str, event_id: str, status: str) -> dict:
+    data = {"status": STATUS_NAMES.get(status, status.lower())}
+    if status == "FAILED":
+        data["error"] = await repo.get_error(task_id)
+    return {"id": event_id, "event": "status", "data": data}
+
+async def final_event(repo: AsyncIngestionRepository, task_id: str, event_id: str) -> dict | None:
+    """
+    Closing status event of a task that has finished without one read from its stream, None while it runs. A task
+    that failed or ended before loading started only has its mirrored celery state
+    """
+
+    status, celery_state = await repo.get_task_state(task_id)
+    if status in FINAL_STATUSES:
+        return await status_event(repo, task_id, event_id, status)
+    if celery_state == "FAILURE":
+        return {"id": event_id, "event": "status", "data": {"status": "failure", "error": await repo.get_error(task_id)}}
+    if celery_state == "SUCCESS":
+        return {"id": event_id, "event": "status", "data": {"status": "success"}}
+    return None
+
+async def task_events(repo: AsyncIngestionRepository, task_id: str, last_id: str = "0", history: str = "columnar", follow: bool = True) -> AsyncIterator[dict | None]:
+    """
+    Yield {"id", "event", "data"} for every delta and status change after last_id until the task finishes.
+    While following, None is yielded when nothing happened for TASK_STREAM_BLOCK_MS so the caller can keep the
+    connection alive. Without follow the generator ends once it has caught up
+    """
+
+    while True:
+        entries = await repo.read_stream(task_id, last_id, block_ms=TASK_STREAM_BLOCK_MS if follow else None)
+
+        if not entries:
+            # Tasks whose stream expired, or that ended before writing to it, still report how they ended
+            event = await final_event(repo, task_id, last_id)
+            if event is not None:
+                yield event
+                return
+            if not follow:
+                return
+            yield None
+            continue
+
+        # Histories of the whole batch are resolved in one round trip
+        deltas = await repo.resolve_histories([data for _, kind, data in entries if kind == "delta"])
+        if history == "json":
+            deltas = map_histories(deltas, history_to_lists)
+        deltas = iter(deltas)
+
+        for entry_id, kind, data in entries:
+            last_id = entry_id
+            if kind == "delta":
+                yield {"id": entry_id, "event": "delta", "data": next(deltas)}
+            else:
+                yield await status_event(repo, task_id, entry_id, data) #type: ignore
+                if data in FINAL_STATUSES:
+                    return
@@ -2,25 +2,61 @@
 This module creates a celery task to begin the query. One query per task.
 """
 
-import asyncio
-import json
-import zlib
-
+from celery.signals import task_failure, task_prerun, task_success
 from pydantic import TypeAdapter
 
 from fastapi_app.core.celery_app import celery_app
+from fastapi_app.core.celery_logging_config import get_logger
+from fastapi_app.core.worker_runtime import get_runtime
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
 from fastapi_app.schemas.ingestion import IngestionRequest
 from fastapi_app.services.dispatcher import dispatcher
+from fastapi_app.services.polymarket.handler import polymarket_fetch_deferred
+
+logger = get_logger(__name__)
 
 @celery_app.task(bind=True)
 def start_ingestion(self, req_dict):
-    
-    # Repopulate model at process boundary for type security, 
+
+    # Repopulate model at process boundary for type security,
     adapter = TypeAdapter(IngestionRequest)
     req = adapter.validate_python(req_dict)
-    
-    # Start event loop and run query
-    asyncio.run(dispatcher(api_request = req, task_id = self.request.id))
 
-    
+    # Run query on the worker's long-lived event loop, reusing its pooled clients
+    runtime = get_runtime()
+    repo = AsyncIngestionRepository(runtime.redis)
+    runtime.run(dispatcher(api_request = req, task_id = self.request.id, client = runtime.polymarket, repo = repo))
+
+@celery_app.task(bind=True)
+def fetch_deferred_histories(self, parent_task_id, token_ids=None):
+
+    # Histories of markets a keyword search returned metadata only, results are written under this task's id
+    runtime = get_runtime()
+    repo = AsyncIngestionRepository(runtime.redis)
+    runtime.run(polymarket_fetch_deferred(parent_task_id = parent_task_id, token_ids = token_ids, client = runtime.polymarket, repo = repo, task_id = self.request.id))
+
+# Celery states are mirrored into the ingestion db, so status polls read them without the result backend
+MIRRORED_TASKS = (start_ingestion.name, fetch_deferred_histories.name)
+
+def mirror_celery_state(task_id: str, state: str, error: str | None = None):
+    runtime = get_runtime()
+    try:
+        runtime.loop.run_until_complete(AsyncIngestionRepository(runtime.redis).set_celery_state(task_id, state, error))
+    except Exception as e:
+        # Polls fall back to the result backend without a mirrored state
+        logger.warning(f"Error mirroring celery state {state} of {task_id}: {e!r}")
+
+@task_prerun.connect
+def mirror_started(sender=None, task_id=None, **kwargs):
+    if sender is not None and sender.name in MIRRORED_TASKS:
+        mirror_celery_state(task_id, "STARTED") #type: ignore
+
+@task_success.connect
+def mirror_success(sender=None, **kwargs):
+    if sender is not None and sender.name in MIRRORED_TASKS:
+        mirror_celery_state(sender.request.id, "SUCCESS")
 
+@task_failure.connect
+def mirror_failure(sender=None, task_id=None, exception=None, **kwargs):
+    if sender is not None and sender.name in MIRRORED_TASKS:
+        mirror_celery_state(task_id, "FAILURE", str(exception)) #type: ignore
@@ -1,9 +1,13 @@
-import json 
-import zlib
+import os
 
 from redis import Redis
 
 from news_procesor.redis.redis_client import build_client
+from utils.codecs import decode, get_codec
+
+# Headlines are rewritten every fetch, keyword keys expire once no keyword has been added or updated for a while
+HEADLINES_TTL_SECONDS = int(os.getenv("HEADLINES_TTL_SECONDS", 24 * 3600))
+KEYWORDS_TTL_SECONDS = int(os.getenv("KEYWORDS_TTL_SECONDS", 7 * 24 * 3600))
 
 class HeadlineRepository():
 
@@ -11,10 +15,10 @@ class HeadlineRepository():
         self.redis = build_client()
     
     def _serialize(self, data: dict | list) -> bytes:
-        return zlib.compress(json.dumps(data).encode())
+        return get_codec().encode(data)
     
     def _deserialize(self, payload: bytes) -> dict:
-        return json.loads(zlib.decompress(payload))
+        return decode(payload)
 
     def _deserialize_many(self, payloads) -> list[dict]:
         return [self._deserialize(p) for p in payloads]
@@ -40,19 +44,26 @@ class HeadlineRepository():
     def _keyword_in_progress_key(self) -> str:
         return f"keywords:in_progress"
     
+    def _json_set(self, key: str, path: str, value):
+        # The keyword document's ttl is refreshed in the same MULTI as every update
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.json().set(key, path, value)
+            pipe.expire(key, KEYWORDS_TTL_SECONDS)
+            pipe.execute()
+
     def _check_headlines_exist(self):
         key = self._new_headlines_key()
         if self.redis.exists(key):
             return
         blank_headlines = self._serialize([])
-        self.redis.set(key, blank_headlines)
+        self.redis.set(key, blank_headlines, ex=HEADLINES_TTL_SECONDS)
 
     def _check_topics_headlines_exist(self, topic: str):
         key = self._new_topic_key(topic)
         if self.redis.exists(key):
             return
         blank_headlines = self._serialize([])
-        self.redis.set(key,blank_headlines)
+        self.redis.set(key, blank_headlines, ex=HEADLINES_TTL_SECONDS)
 
     def shift_current_headlines(self):
         self._check_headlines_exist()
@@ -60,12 +71,12 @@ class HeadlineRepository():
         key = self._current_display_headlines_key()
         headlines = self.retrieve_new_headlines()
         serialized_headlines = self._serialize(headlines)
-        self.redis.set(key, serialized_headlines)
+        self.redis.set(key, serialized_headlines, ex=HEADLINES_TTL_SECONDS)
 
     def store_new_headlines(self, headlines: list[dict]):
         key = self._new_headlines_key()
         serialized_headlines = self._serialize(headlines)
-        self.redis.set(key, serialized_headlines)
+        self.redis.set(key, serialized_headlines, ex=HEADLINES_TTL_SECONDS)
 
     def retrieve_new_headlines(self):
         key = self._new_headlines_key()
@@ -85,12 +96,12 @@ class HeadlineRepository():
         key = self._current_display_topic_key(topic)
         headlines = self.retrieve_new_topic_headlines(topic)
         serialized_headlines = self._serialize(headlines)
-        self.redis.set(key, serialized_headlines)
+        self.redis.set(key, serialized_headlines, ex=HEADLINES_TTL_SECONDS)
 
     def store_new_topic_headlines(self, topic:str, headlines: list[dict]):
         key = self._new_topic_key(topic)
         serialized_headlines = self._serialize(headlines)
-        self.redis.set(key,serialized_headlines)
+        self.redis.set(key, serialized_headlines, ex=HEADLINES_TTL_SECONDS)
     
     def retrieve_new_topic_headlines(self, topic:str):
         key = self._new_topic_key(topic)
@@ -112,13 +123,17 @@ class HeadlineRepository():
         if is_member:
             return True
         else:
-            self.redis.sadd(active_key, keyword)
-            self.redis.sadd(in_progress_key, keyword)
+            with self.redis.pipeline(transaction=True) as pipe:
+                pipe.sadd(active_key, keyword)
+                pipe.sadd(in_progress_key, keyword)
+                pipe.expire(active_key, KEYWORDS_TTL_SECONDS)
+                pipe.expire(in_progress_key, KEYWORDS_TTL_SECONDS)
+                pipe.execute()
             return False
         
     def add_keyword_data(self, keyword: str, data: dict):
         key = self._keyword_data_key()
-        self.redis.json().set(key,f"$.{keyword}",data)
+        self._json_set(key,f"$.{keyword}",data)
 
     def get_task_id_from_keyword(self, keyword: str):
         key = self._keyword_data_key()
@@ -136,15 +151,19 @@ class HeadlineRepository():
         
     def keyword_data_set_status(self, keyword: str, status: str):
         key = self._keyword_data_key()
-        self.redis.json().set(key,f"$.{keyword}.status",status)
+        self._json_set(key,f"$.{keyword}.status",status)
 
     def keyword_data_set_show_keyword(self, keyword: str, show_keyword: bool):
         key = self._keyword_data_key()
-        self.redis.json().set(key,f"$.{keyword}.show_keyword",show_keyword)
+        self._json_set(key,f"$.{keyword}.show_keyword",show_keyword)
 
     def keyword_data_set_data(self, keyword: str, data: dict):
         key = self._keyword_data_key()
-        self.redis.json().set(key,f"$.{keyword}.show_keyword",data)
+        self._json_set(key,f"$.{keyword}.data",data)
+
+    def keyword_data_set_cursor(self, keyword: str, cursor: int):
+        key = self._keyword_data_key()
+        self._json_set(key,f"$.{keyword}.cursor",cursor)
 
     def keyword_data_get_data(self, keyword: str, data: dict):
         key = self._keyword_data_key()
@@ -9,8 +9,8 @@ from news_procesor.utils.ingestion_request import ingestion_request
 from news_procesor.core.keywords import KeywordExtractor
 from news_procesor.core.news_fetcher import NewsFetcher
 from news_procesor.redis.repository import HeadlineRepository
-from news_procesor.utils.merge_tree_deltas import merge_tree_deltas
-from news_procesor.utils.result_query import result_query 
+from news_procesor.utils.result_query import result_tree, status_batch
+from utils.merge_tree_deltas import merge_tree_deltas
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,37 +22,50 @@ logger = logging.getLogger(__name__)
 def poll_query_updates(self):
     repo = HeadlineRepository()
 
+    # Get each keyword's task_id, the tree so far and the delta cursor of the last poll
+    tracked = {}
     for keyword in repo.retrieve_in_progress_iterator():
-        
-        # Get corresponding task_id
-        task_id = repo.get_task_id_from_keyword(keyword)
+        keyword_data = repo.retrieve_keyword_data(keyword) or {}
+        task_id = keyword_data.get("task_id")
+        if task_id:
+            tracked[keyword] = (str(task_id), keyword_data.get("data") or {}, keyword_data.get("cursor", 0))
 
-        # Check for updates from fast api
-        result = result_query(str(task_id)) 
+    if not tracked:
+        return
+
+    # One request for every keyword, only deltas since the last run are sent by fast api
+    results = status_batch([(task_id, cursor) for task_id, _, cursor in tracked.values()])
+
+    for keyword, (task_id, tree, cursor) in tracked.items():
+        result = results.get(task_id, {"status": "pending"})
         status = result["status"]
+        deltas = result.get("data") or []
+
+        if status == "success":
+            # One read of the tree materialized on completion instead of merging the remaining deltas
+            materialized = result_tree(task_id)
+            if materialized.get("status") == "success":
+                tree = materialized["data"]
+                repo.keyword_data_set_data(keyword,tree)
+                repo.keyword_data_set_show_keyword(keyword,True)
+                deltas = []
+
+        if deltas:
+            logger.info(f"Keyword: {keyword} data loading")
+            tree = merge_tree_deltas(tree, deltas)
+            repo.keyword_data_set_data(keyword,tree)
+            repo.keyword_data_set_show_keyword(keyword,True)
+
+        if result.get("next_cursor", cursor) != cursor:
+            repo.keyword_data_set_cursor(keyword, result["next_cursor"])
 
         if status == "failure":
             logger.info(f"Keyword: {keyword} API query failed")
             repo.remove_keyword_from_in_progress(keyword)
-            continue
 
-        elif status == "complete":
-            logger.info(f"Keyword: {keyword} has no markets")
-            repo.remove_keyword_from_in_progress(keyword)
-            continue
-        
-        elif status == "in_progress":
-            data = result["data"]
-            if data:
-                logger.info(f"Keyword: {keyword} data loading")
-                repo.keyword_data_set_show_keyword(keyword,True)
-        
-        elif status == 'success':
-            data = result["data"]
-            if data:
+        elif status in ("success", "complete"):
+            if tree:
                 logger.info(f"Keyword: {keyword} successfully queried")
-                repo.keyword_data_set_show_keyword(keyword,True)
-
-                tree = merge_tree_deltas({},data)
-                repo.keyword_data_set_data(keyword,tree)
-
+            else:
+                logger.info(f"Keyword: {keyword} has no markets")
+            repo.remove_keyword_from_in_progress(keyword)
@@ -1,5 +1,5 @@
 import requests
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 
 from utils.config import FASTAPI_BASE_URL
 
@@ -12,3 +12,25 @@ def result_query(task_id: str) -> Dict:
     results = results.json()
     
     return results
+
+def result_tree(task_id: str) -> Dict:
+
+    # The tree materialized when the task completed, a 404 body carries the status of a task that has not
+    results = requests.get(f"{FASTAPI_BASE_URL}/ingestion/{task_id}/tree")
+
+    if results.status_code != 404:
+        results.raise_for_status()
+
+    return results.json()
+
+def status_batch(cursors: List[Tuple[str, int]]) -> Dict:
+
+    # Statuses and new deltas of every (task_id, since) in one request, keyed by task_id
+    results = requests.post(
+        f"{FASTAPI_BASE_URL}/ingestion/status:batch",
+        json={"tasks": [{"task_id": task_id, "since": since} for task_id, since in cursors]},
+    )
+
+    results.raise_for_status()
+
+    return results.json()["tasks"]
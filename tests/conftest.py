@@ -0,0 +1,8 @@
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+@pytest.fixture
+def redis():
+    # In-memory redis with lua scripting, a fresh server per test. Tests drive coroutines with asyncio.run
+    return fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ResponseError
+
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.repositories.ingestion_repository import INGESTION_RAW_TTL_SECONDS, INGESTION_TTL_SECONDS
+
+def market(token_id: str) -> dict:
+    return {
+        "provider": "polymarket",
+        "event_id": "e1",
+        "event_title": "Event",
+        "event_image": "image",
+        "market_id": "m1",
+        "market_question": "Question?",
+        "volume": 10.0,
+        "outcome": "Yes",
+        "tokenId": token_id,
+        "history": [],
+    }
+
+def test_flushes_once_max_batch_writes_are_queued(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        writer = repo.buffered_writer(max_batch=3, flush_interval=60)
+
+        await writer.save_raw_market("t", market("a"))
+        await writer.save_raw_market("t", market("b"))
+        assert await redis.llen("ingestion:t:raw") == 0
+
+        await writer.save_raw_market("t", market("c"))
+        assert await redis.llen("ingestion:t:raw") == 3
+        await writer.flush()
+
+    asyncio.run(main())
+
+def test_flushes_after_flush_interval(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        writer = repo.buffered_writer(max_batch=100, flush_interval=0.01)
+
+        await writer.save_raw_market("t", market("a"))
+        assert await redis.llen("ingestion:t:raw") == 0
+        await asyncio.sleep(0.05)
+        assert await redis.llen("ingestion:t:raw") == 1
+
+    asyncio.run(main())
+
+def test_exit_flushes_writes_with_their_ttls(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        async with repo.buffered_writer(max_batch=100, flush_interval=60) as writer:
+            await writer.save_raw_market("t", market("a"))
+            await writer.save_tree_delta("t", {"e1": {"markets": {}}})
+            await writer.save_deferred_market("t", market("b"))
+
+        assert [m["tokenId"] for m in await repo.get_raw_markets("t")] == ["a"]
+        assert await repo.load_tree_deltas("t") == [{"e1": {"markets": {}}}]
+        assert [m["tokenId"] for m in await repo.load_deferred_markets("t")] == ["b"]
+
+        assert 0 < await redis.ttl("ingestion:t:raw") <= INGESTION_RAW_TTL_SECONDS
+        for key in ["ingestion:t:tree_delta", "ingestion:t:stream", "ingestion:t:deferred"]:
+            assert 0 < await redis.ttl(key) <= INGESTION_TTL_SECONDS
+
+    asyncio.run(main())
+
+def test_history_blobs_are_written_once_and_referenced_by_the_task(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        history = {"t": [1, 2, 3], "p": [0.1, 0.2, 0.3]}
+
+        async with repo.buffered_writer() as writer:
+            ref = await writer.save_history_blob("t", history)
+            assert await writer.save_history_blob("t", dict(history)) == ref
+            assert await writer.save_history_blob("t", ref) == ref
+
+        blob_keys = await redis.smembers("ingestion:t:blobs")
+        assert len(blob_keys) == 1
+        assert await redis.exists(*blob_keys) == 1
+
+    asyncio.run(main())
+
+def test_failed_background_flush_is_raised_by_the_next_flush(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        # A key of the wrong type makes the batch fail in redis
+        await redis.set("ingestion:t:raw", "not a list")
+
+        writer = repo.buffered_writer(max_batch=100, flush_interval=0.01)
+        await writer.save_raw_market("t", market("a"))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(ResponseError):
+            await writer.flush()
+
+    asyncio.run(main())
+
+def test_failed_background_flush_fails_the_writer_on_exit(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await redis.set("ingestion:t:raw", "not a list")
+
+        with pytest.raises(ResponseError):
+            async with repo.buffered_writer(max_batch=100, flush_interval=0.01) as writer:
+                await writer.save_raw_market("t", market("a"))
+                await asyncio.sleep(0.05)
+                await writer.save_tree_delta("t", {"e1": {}})
+
+    asyncio.run(main())
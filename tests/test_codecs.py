@@ -0,0 +1,98 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from utils import codecs
+
+PAYLOAD = {"markets": [{"id": 1, "question": "Will it rain?", "history": {"t": [1, 2], "p": [0.5, 0.25]}}], "done": True}
+
+@pytest.mark.parametrize("name", codecs.available_codecs())
+def test_available_codecs_round_trip(name):
+    format, compression = name.split("+")
+    codec = codecs.Codec(format, compression)
+    payload = codec.encode(PAYLOAD)
+
+    assert payload[0] & codecs.HEADER_PREFIX == codecs.HEADER_PREFIX
+    assert codecs.decode(payload) == PAYLOAD
+
+def test_legacy_zlib_payloads_decode():
+    payload = zlib.compress(json.dumps(PAYLOAD).encode())
+
+    assert payload[0] == codecs.LEGACY_ZLIB_HEADER
+    assert codecs.decode(payload) == PAYLOAD
+
+def test_any_codec_decodes_payloads_of_another():
+    payload = codecs.Codec("json", "zlib").encode(PAYLOAD)
+    assert codecs.Codec("json", "none").decode(payload) == PAYLOAD
+
+def test_unknown_header_raises():
+    with pytest.raises(ValueError):
+        codecs.decode(b"\x01" + json.dumps(PAYLOAD).encode())
+
+    # Compression id 7 is never registered
+    with pytest.raises(ValueError):
+        codecs.decode(bytes([codecs.HEADER_PREFIX | 0x07]) + b"{}")
+
+def test_unknown_codec_names_raise():
+    with pytest.raises(ValueError):
+        codecs.Codec("yaml", "zlib")
+    with pytest.raises(ValueError):
+        codecs.Codec("json", "brotli")
+
+def test_unavailable_codec_raises():
+    # zstd-dict is only available once a dictionary is loaded
+    if codecs.PAYLOAD_ZSTD_DICT_PATH:
+        pytest.skip("a zstd dictionary is configured")
+
+    with pytest.raises(codecs.CodecUnavailable):
+        codecs.Codec("json", "zstd-dict")
+    with pytest.raises(codecs.CodecUnavailable):
+        codecs.decode(bytes([codecs.HEADER_PREFIX | 4]) + b"{}")
+
+def test_unavailable_codecs_match_missing_packages():
+    missing = codecs.unavailable_codecs()
+
+    assert any(name.startswith("msgpack") for name in missing) == (codecs.msgpack is None)
+    assert any(name.startswith("zstandard") for name in missing) == (codecs.zstandard is None)
+    assert any(name.startswith("lz4") for name in missing) == (codecs.lz4_frame is None)
+
+def test_log_codec_availability_warns_on_skipped_wire_encodings(monkeypatch, caplog):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", ["brotli", "gzip"])
+
+    codecs.log_codec_availability()
+
+    assert any("WIRE_ENCODINGS brotli unavailable" in record.message for record in caplog.records)
+
+def test_wire_encode_gzip(monkeypatch):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", ["gzip"])
+
+    encoded = codecs.wire_encode(PAYLOAD)
+
+    assert list(encoded) == ["gzip"]
+    assert json.loads(gzip.decompress(encoded["gzip"])) == PAYLOAD
+    # mtime=0 keeps the bytes stable for etags
+    assert codecs.wire_encode(PAYLOAD) == encoded
+
+def test_only_the_first_available_wire_encoding_is_stored(monkeypatch):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", ["brotli", "gzip", "zstd"])
+    assert codecs.wire_encodings() == ["gzip"]
+
+def test_wire_encode_without_encodings(monkeypatch):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", [])
+    assert codecs.wire_encode(PAYLOAD) == {}
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("br, GZIP;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=x", None),
+    ("*", "gzip"),
+    ("br, deflate", None),
+])
+def test_negotiate_wire_encoding(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", ["gzip"])
+    assert codecs.negotiate_wire_encoding(accept_encoding) == expected
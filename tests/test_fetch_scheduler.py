@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from fastapi_app.services.polymarket.scheduler import FetchScheduler
+
+class Upstream:
+    """
+    Fake fetch recording how many calls are in flight, each call waits until released
+    """
+
+    def __init__(self, fail: dict | None = None):
+        self.in_flight = 0
+        self.peak = 0
+        self.started = []
+        self.cancelled = []
+        self.release = asyncio.Event()
+        self.fail = fail or {}
+
+    async def fetch(self, item):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        self.started.append(item)
+        try:
+            await self.release.wait()
+            if item in self.fail:
+                raise self.fail[item]
+            return item
+        except asyncio.CancelledError:
+            self.cancelled.append(item)
+            raise
+        finally:
+            self.in_flight -= 1
+
+async def collect(scheduler: FetchScheduler) -> list:
+    return [result async for result in scheduler.results()]
+
+def test_fetches_at_most_window_at_a_time():
+    async def main():
+        upstream = Upstream()
+        async with FetchScheduler(upstream.fetch, window=3) as scheduler:
+            for item in range(20):
+                await scheduler.submit(item)
+            await scheduler.close()
+
+            await asyncio.sleep(0.01)
+            assert upstream.in_flight == 3
+            upstream.release.set()
+            results = await collect(scheduler)
+
+        assert sorted(results) == list(range(20))
+        assert upstream.peak == 3
+
+    asyncio.run(main())
+
+def test_highest_priority_is_fetched_first():
+    async def main():
+        upstream = Upstream()
+        upstream.release.set()
+        scheduler = FetchScheduler(upstream.fetch, window=1, priority=lambda item: item[0])
+
+        # Queued before any worker runs, so the order is decided by priority, ties in submission order
+        for seq, volume in enumerate([5, 50, 1, 20, 50]):
+            await scheduler.submit((volume, seq))
+        await scheduler.close()
+
+        async with scheduler:
+            results = await collect(scheduler)
+
+        assert results == [(50, 1), (50, 4), (20, 3), (5, 0), (1, 2)]
+
+    asyncio.run(main())
+
+def test_tuple_priorities_sort_descending_per_field():
+    async def main():
+        upstream = Upstream()
+        upstream.release.set()
+        scheduler = FetchScheduler(upstream.fetch, window=1, priority=lambda item: item)
+        for item in [(1.0, 5.0), (2.0, 0.0), (1.0, 9.0)]:
+            await scheduler.submit(item)
+        await scheduler.close()
+
+        async with scheduler:
+            assert await collect(scheduler) == [(2.0, 0.0), (1.0, 9.0), (1.0, 5.0)]
+
+    asyncio.run(main())
+
+def test_tolerated_errors_are_yielded_and_others_raised():
+    async def main():
+        upstream = Upstream(fail={1: LookupError("skip me"), 3: RuntimeError("fatal")})
+        upstream.release.set()
+
+        async with FetchScheduler(upstream.fetch, window=1, tolerate=(LookupError,)) as scheduler:
+            for item in range(5):
+                await scheduler.submit(item)
+            await scheduler.close()
+
+            seen = []
+            with pytest.raises(RuntimeError, match="fatal"):
+                async for result in scheduler.results():
+                    seen.append(result)
+
+        assert seen[0] == 0
+        assert isinstance(seen[1], LookupError)
+        assert seen[2] == 2
+
+    asyncio.run(main())
+
+def test_submit_waits_while_max_pending_are_queued():
+    async def main():
+        upstream = Upstream()
+        async with FetchScheduler(upstream.fetch, window=1, max_pending=2) as scheduler:
+            # One in flight and two queued
+            for item in range(3):
+                await scheduler.submit(item)
+                await asyncio.sleep(0)
+            assert scheduler.pending() == 2
+
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(scheduler.submit(3), timeout=0.05)
+
+            upstream.release.set()
+            await asyncio.wait_for(scheduler.submit(4), timeout=1)
+            await scheduler.close()
+            assert sorted(await collect(scheduler)) == [0, 1, 2, 4]
+
+    asyncio.run(main())
+
+def test_exit_cancels_fetches_in_flight_and_drops_queued_items():
+    async def main():
+        upstream = Upstream()
+        async with FetchScheduler(upstream.fetch, window=2) as scheduler:
+            for item in range(10):
+                await scheduler.submit(item)
+            await asyncio.sleep(0.01)
+
+        assert sorted(upstream.cancelled) == [0, 1]
+        assert upstream.started == [0, 1]
+        assert scheduler.pending() == 0
+        assert upstream.in_flight == 0
+
+    asyncio.run(main())
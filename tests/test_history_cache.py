@@ -0,0 +1,137 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.repositories.polymarket_cache_repository import AsyncPolymarketCacheRepository
+from fastapi_app.services.polymarket import client as polymarket
+
+STEP = polymarket.HISTORY_FIDELITY * 60
+NOW = 1_800_000_000 - 1_800_000_000 % STEP + 120
+
+class Upstream:
+    """
+    Serves /prices-history from points, only those within the requested startTs and endTs
+    """
+
+    def __init__(self, points: list[tuple[int, float]]):
+        self.points = points
+        self.params: list[dict] = []
+
+    async def get(self, **kwargs):
+        params = kwargs["params"]
+        self.params.append(params)
+        start, end = params.get("startTs", 0), params.get("endTs", NOW)
+        return {"history": [{"t": t, "p": p} for t, p in self.points if start <= t <= end]}
+
+@pytest.fixture
+def cache(redis):
+    return AsyncPolymarketCacheRepository(redis)
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream([])
+    monkeypatch.setattr(polymarket, "polymarket_get", upstream.get)
+    monkeypatch.setattr(polymarket.time, "time", lambda: NOW)
+    return upstream
+
+def fetch(cache: AsyncPolymarketCacheRepository) -> dict:
+    client = SimpleNamespace(cache=cache, clob=None, clob_limiter=None, single_flight=None)
+    async def main():
+        return await polymarket.polymarket_price_history({"tokenId": "tok"}, client, asyncio.Semaphore(1)) #type: ignore
+    return asyncio.run(main())["history"]
+
+def seed(cache: AsyncPolymarketCacheRepository, history: dict):
+    asyncio.run(cache.save_history("tok", polymarket.HISTORY_FIDELITY, history, ttl=polymarket.HISTORY_WINDOW_SECONDS))
+
+def load(cache: AsyncPolymarketCacheRepository) -> dict | None:
+    return asyncio.run(cache.load_history("tok", polymarket.HISTORY_FIDELITY))
+
+def test_miss_fetches_the_full_window_and_caches_it(cache, upstream):
+    upstream.points = [(NOW - 2 * STEP, 0.25), (NOW - STEP, 0.5)]
+
+    history = fetch(cache)
+
+    assert history == {"t": [NOW - 2 * STEP, NOW - STEP], "p": [0.25, 0.5]}
+    assert upstream.params[0]["interval"] == polymarket.HISTORY_INTERVAL
+    assert load(cache) == history
+
+def test_cache_is_kept_for_the_window(cache, upstream, redis):
+    upstream.points = [(NOW - STEP, 0.5)]
+
+    fetch(cache)
+
+    ttl = asyncio.run(redis.ttl(cache._history_key("tok", polymarket.HISTORY_FIDELITY)))
+    assert 0 < ttl <= polymarket.HISTORY_WINDOW_SECONDS
+
+def test_fresh_cache_is_served_without_a_request(cache, upstream):
+    seed(cache, {"t": [NOW - 60], "p": [0.5]})
+
+    assert fetch(cache) == {"t": [NOW - 60], "p": [0.5]}
+    assert upstream.params == []
+
+def test_only_the_tail_since_the_last_cached_point_is_fetched(cache, upstream):
+    last_ts = NOW - 3 * STEP
+    seed(cache, {"t": [last_ts - STEP, last_ts], "p": [0.25, 0.5]})
+    upstream.points = [(last_ts + STEP, 0.75), (NOW - NOW % STEP, 1.0)]
+
+    history = fetch(cache)
+
+    assert len(upstream.params) == 1
+    assert upstream.params[0]["startTs"] == last_ts + 1
+    assert upstream.params[0]["endTs"] == NOW - NOW % STEP
+    assert "interval" not in upstream.params[0]
+    assert history == {"t": [last_ts - STEP, last_ts, last_ts + STEP, NOW - NOW % STEP], "p": [0.25, 0.5, 0.75, 1.0]}
+    assert load(cache) == history
+
+def test_tail_overlapping_the_last_cached_point_is_not_appended_twice(cache, upstream, monkeypatch):
+    last_ts = NOW - 3 * STEP
+    seed(cache, {"t": [last_ts], "p": [0.5]})
+
+    # The upstream answers from the start of the step that holds startTs, repeating points already cached
+    async def overlapping(**kwargs):
+        upstream.params.append(kwargs["params"])
+        return {"history": [{"t": last_ts - STEP, "p": 0.1}, {"t": last_ts, "p": 0.9}, {"t": last_ts + STEP, "p": 0.75}]}
+    monkeypatch.setattr(polymarket, "polymarket_get", overlapping)
+
+    history = fetch(cache)
+
+    assert history == {"t": [last_ts, last_ts + STEP], "p": [0.5, 0.75]}
+
+def test_points_aged_out_of_the_window_are_trimmed(cache, upstream):
+    window_start = NOW - polymarket.HISTORY_WINDOW_SECONDS
+    last_ts = NOW - 2 * STEP
+    seed(cache, {"t": [window_start - STEP, window_start - 1, window_start, last_ts], "p": [0.1, 0.2, 0.3, 0.4]})
+    upstream.points = [(NOW - STEP, 0.5)]
+
+    history = fetch(cache)
+
+    assert history == {"t": [window_start, last_ts, NOW - STEP], "p": [0.3, 0.4, 0.5]}
+    assert load(cache) == history
+
+def test_cache_older_than_the_window_is_fetched_in_full(cache, upstream):
+    stale = NOW - polymarket.HISTORY_WINDOW_SECONDS - STEP
+    seed(cache, {"t": [stale], "p": [0.5]})
+    upstream.points = [(NOW - STEP, 0.75)]
+
+    history = fetch(cache)
+
+    assert upstream.params[0]["interval"] == polymarket.HISTORY_INTERVAL
+    assert "startTs" not in upstream.params[0]
+    assert history == {"t": [NOW - STEP], "p": [0.75]}
+
+def test_expired_cache_is_fetched_in_full(cache, upstream, monkeypatch):
+    # Saved a window ago, redis expires it on the same patched clock
+    saved_at = NOW - polymarket.HISTORY_WINDOW_SECONDS - 1
+    monkeypatch.setattr(polymarket.time, "time", lambda: saved_at)
+    seed(cache, {"t": [saved_at - 60], "p": [0.5]})
+    monkeypatch.setattr(polymarket.time, "time", lambda: NOW)
+    assert load(cache) is None
+    upstream.points = [(NOW - STEP, 0.75)]
+
+    assert fetch(cache) == {"t": [NOW - STEP], "p": [0.75]}
+    assert upstream.params[0]["interval"] == polymarket.HISTORY_INTERVAL
+
+def test_empty_history_is_not_cached(cache, upstream):
+    assert fetch(cache) == []
+    assert load(cache) is None
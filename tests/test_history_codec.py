@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from utils import history_codec
+
+STEP = 60
+
+def regular_history(count: int = 50, t0: int = 1_700_000_000) -> dict:
+    return {'t': [t0 + i * STEP for i in range(count)], 'p': [round(0.3 + i * 0.01, 4) for i in range(count)]}
+
+@pytest.mark.parametrize("price_encoding", ["bp", "f32"])
+def test_round_trip(price_encoding):
+    history = regular_history()
+
+    t, p = history_codec.decode_history(history_codec.encode_history(history, price_encoding))
+
+    assert t.tolist() == history['t']
+    assert p == pytest.approx(history['p'], abs=1e-6)
+
+def test_regular_series_stores_zero_residuals():
+    data = history_codec.encode_history(regular_history(), "bp")
+    header_size = history_codec._HEADER.size
+
+    _, _, count, _, step = history_codec._HEADER.unpack_from(data)
+    residuals = np.frombuffer(data, dtype="<i4", count=count, offset=header_size)
+
+    assert step == STEP
+    assert not residuals.any()
+    # 4 byte residuals and 2 byte basis points per point
+    assert len(data) == header_size + count * 6
+
+def test_irregular_gaps_round_trip():
+    history = {'t': [100, 160, 220, 400, 460, 461, 1000], 'p': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]}
+
+    t, _ = history_codec.decode_history(history_codec.encode_history(history))
+
+    assert t.tolist() == history['t']
+
+def test_basis_points_quantize_and_clip():
+    history = {'t': [0, 60, 120, 180], 'p': [0.12344, 0.12346, -0.5, 1.5]}
+
+    _, p = history_codec.decode_history(history_codec.encode_history(history, "bp"))
+
+    assert p.tolist() == [0.1234, 0.1235, 0.0, 1.0]
+
+def test_empty_and_single_point_histories():
+    t, p = history_codec.decode_history(history_codec.encode_history({'t': [], 'p': []}))
+    assert len(t) == len(p) == 0
+
+    t, p = history_codec.decode_history(history_codec.encode_history({'t': [42], 'p': [0.5]}))
+    assert t.tolist() == [42]
+    assert p.tolist() == [0.5]
+
+def test_unknown_version_raises():
+    data = bytearray(history_codec.encode_history(regular_history()))
+    data[0] = 99
+
+    with pytest.raises(ValueError):
+        history_codec.decode_history(bytes(data))
+
+def test_pack_and_unpack():
+    history = regular_history()
+    packed = history_codec.pack_history(history)
+
+    assert history_codec.is_packed(packed)
+    assert history_codec.pack_history(packed) is packed
+    assert history_codec.pack_history([]) == []
+
+    t, p = history_codec.unpack_history(packed)
+    assert t.tolist() == history['t']
+    assert p == pytest.approx(history['p'])
+
+    t, p = history_codec.unpack_history(history)
+    assert t.tolist() == history['t']
+
+    t, p = history_codec.unpack_history([])
+    assert len(t) == len(p) == 0
+
+def test_history_to_lists():
+    history = regular_history(5)
+
+    assert history_codec.history_to_lists(history_codec.pack_history(history)) == history
+    assert history_codec.history_to_lists(history) is history
+
+def test_history_ref_is_not_packed():
+    ref = history_codec.history_ref("abc")
+
+    assert history_codec.is_history_ref(ref)
+    assert not history_codec.is_packed(ref)
+    assert not history_codec.is_history_ref(history_codec.pack_history(regular_history(3)))
+
+def test_map_histories_reaches_every_history():
+    tree = {
+        'history': 1,
+        'markets': [{'history': 2, 'children': [{'history': 3}]}, {'question': 'q'}],
+    }
+
+    mapped = history_codec.map_histories(tree, lambda history: history * 10)
+
+    assert mapped == {
+        'history': 10,
+        'markets': [{'history': 20, 'children': [{'history': 30}]}, {'question': 'q'}],
+    }
+    # A new structure, the tree itself is untouched
+    assert tree['markets'][0]['history'] == 2
+    assert history_codec.map_histories([tree, 'x'], lambda history: 0)[1] == 'x'
@@ -0,0 +1,270 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis.aioredis import FakeAsyncRedisConnection
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from fastapi_app.core.async_redis import build_async_client
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.repositories.job_repository import AsyncJobRepository
+from fastapi_app.services import job_runner as jr
+
+REQUEST = {"provider": "polymarket", "search_term": "election", "search": {"kind": "keyword", "limit": 10}}
+
+class Dispatcher:
+    """
+    Stands in for the ingestion dispatcher, writing one delta per run of a task
+    """
+
+    def __init__(self, delay: float = 0.0, error: Exception | None = None):
+        self.runs: list[str] = []
+        self.cancelled: list[str] = []
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self, api_request, task_id, client, repo):
+        self.runs.append(task_id)
+        await repo.data_loading_status_start(task_id)
+        await repo.save_tree_delta(task_id, {"run": len(self.runs)})
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(task_id)
+            raise
+        if self.error is not None:
+            await repo.data_loading_status_failed(task_id)
+            raise self.error
+        await repo.data_loading_status_end(task_id)
+
+@pytest.fixture(autouse=True)
+def fast_runner(monkeypatch):
+    monkeypatch.setattr(jr, "JOB_READ_BLOCK_MS", 50)
+    monkeypatch.setattr(jr, "JOB_CLAIM_IDLE_MS", 200)
+    monkeypatch.setattr(jr, "JOB_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(jr, "JOB_SHUTDOWN_SECONDS", 0.1)
+
+def use_dispatcher(monkeypatch, dispatcher: Dispatcher) -> Dispatcher:
+    monkeypatch.setattr(jr, "dispatcher", dispatcher)
+    return dispatcher
+
+async def run_until(runner: jr.JobRunner, redis, condition, timeout: float = 3.0, job_redis=None):
+    # The runner is stopped before the test reads the stream itself, blocking reads of two clients can hang fakeredis
+    task = asyncio.create_task(runner.run(redis, job_redis if job_redis is not None else redis))
+    try:
+        async with asyncio.timeout(timeout):
+            while not await condition():
+                await asyncio.sleep(0.02)
+    finally:
+        runner.stop()
+        await task
+
+async def pending(redis) -> list[dict]:
+    return await redis.xpending_range("ingestion:jobs", "ingestion-runners", "-", "+", 10)
+
+async def state_is(repo: AsyncIngestionRepository, task_id: str, state: str) -> bool:
+    _, celery_state = await repo.get_task_state(task_id)
+    return celery_state == state
+
+async def setup(redis) -> tuple[AsyncJobRepository, AsyncIngestionRepository]:
+    jobs = AsyncJobRepository(redis)
+    await jobs.ensure_group()
+    return jobs, AsyncIngestionRepository(redis)
+
+def test_finished_job_is_acked(redis, monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher())
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("t", REQUEST))
+
+        await run_until(jr.JobRunner(consumer="a"), redis, lambda: state_is(repo, "t", "SUCCESS"))
+
+        assert dispatcher.runs == ["t"]
+        assert await repo.get_task_state("t") == ("COMPLETE", "SUCCESS")
+        assert await pending(redis) == []
+        assert await redis.xlen("ingestion:jobs") == 0
+
+    asyncio.run(main())
+
+def test_failed_job_is_recorded_and_acked(redis, monkeypatch):
+    use_dispatcher(monkeypatch, Dispatcher(error=RuntimeError("upstream down")))
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("t", REQUEST))
+        await jobs.enqueue({"kind": "unknown", "task_id": "u"})
+
+        async def both_failed():
+            return await state_is(repo, "t", "FAILURE") and await state_is(repo, "u", "FAILURE")
+        await run_until(jr.JobRunner(consumer="a"), redis, both_failed)
+
+        assert await repo.get_error("t") == "upstream down"
+        assert await repo.get_error("u") == "Unknown job kind: unknown"
+        assert await pending(redis) == []
+
+    asyncio.run(main())
+
+def test_deferred_job_runs_the_deferred_fetch(redis, monkeypatch):
+    calls = []
+    async def fetch_deferred(parent_task_id, token_ids, client, repo, task_id):
+        calls.append((parent_task_id, token_ids, task_id))
+    monkeypatch.setattr(jr, "polymarket_fetch_deferred", fetch_deferred)
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.deferred_job("d", "parent", ["1", "2"]))
+
+        await run_until(jr.JobRunner(consumer="a"), redis, lambda: state_is(repo, "d", "SUCCESS"))
+
+        assert calls == [("parent", ["1", "2"], "d")]
+
+    asyncio.run(main())
+
+def test_job_of_a_dead_runner_is_reclaimed_without_its_partial_deltas(redis, monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher())
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("half", REQUEST))
+        # The dead runner read the job and wrote part of it
+        await jobs.read("dead", 1, 10)
+        await repo.data_loading_status_start("half")
+        await repo.save_tree_delta("half", {"run": "dead"})
+        await asyncio.sleep(0.25)
+
+        await run_until(jr.JobRunner(consumer="b"), redis, lambda: state_is(repo, "half", "SUCCESS"))
+
+        assert dispatcher.runs == ["half"]
+        assert await repo.load_tree_deltas("half") == [{"run": 1}]
+        assert await pending(redis) == []
+
+    asyncio.run(main())
+
+def test_finished_unacked_job_is_acked_without_running_again(redis, monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher())
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("done", REQUEST))
+        await jobs.enqueue(jr.ingestion_job("failed", REQUEST))
+        await jobs.read("dead", 2, 10)
+        await repo.data_loading_status_start("done")
+        await repo.save_tree_delta("done", {"run": "dead"})
+        await repo.data_loading_status_end("done")
+        await repo.data_loading_status_failed("failed")
+        await asyncio.sleep(0.25)
+
+        async def acked():
+            return await pending(redis) == []
+        await run_until(jr.JobRunner(consumer="b"), redis, acked)
+
+        assert dispatcher.runs == []
+        assert await repo.load_tree_deltas("done") == [{"run": "dead"}]
+        assert await repo.get_task_state("done") == ("COMPLETE", "SUCCESS")
+        assert await repo.get_task_state("failed") == ("FAILED", "FAILURE")
+
+    asyncio.run(main())
+
+def test_poison_job_is_failed_after_max_deliveries(redis, monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher())
+    monkeypatch.setattr(jr, "JOB_MAX_DELIVERIES", 1)
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("poison", REQUEST))
+        await jobs.read("dead", 1, 10)
+        await asyncio.sleep(0.25)
+
+        await run_until(jr.JobRunner(consumer="b"), redis, lambda: state_is(repo, "poison", "FAILURE"))
+
+        assert dispatcher.runs == []
+        assert await repo.get_error("poison") == "Job abandoned after 2 deliveries"
+        assert await pending(redis) == []
+
+    asyncio.run(main())
+
+def test_heartbeat_only_claims_owned_entries(redis):
+    async def main():
+        jobs, _ = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("t", REQUEST))
+        [(entry_id, _)] = await jobs.read("a", 1, 10)
+
+        assert await jobs.heartbeat("a", [entry_id]) == {entry_id}
+        assert await jobs.heartbeat("b", [entry_id]) == set()
+        assert [entry["consumer"] for entry in await pending(redis)] == [b"a"]
+        assert await jobs.heartbeat("a", []) == set()
+
+        await jobs.ack(entry_id)
+        assert await jobs.heartbeat("a", [entry_id]) == set()
+
+    asyncio.run(main())
+
+def test_heartbeat_keeps_running_jobs_from_being_reclaimed(redis, monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher(delay=0.6))
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("long", REQUEST))
+
+        # Runs three times the claim idle time, a second runner never takes it over
+        first, second = jr.JobRunner(consumer="a"), jr.JobRunner(consumer="b")
+        other = asyncio.create_task(second.run(redis, redis))
+        try:
+            await run_until(first, redis, lambda: state_is(repo, "long", "SUCCESS"))
+        finally:
+            second.stop()
+            await other
+
+        assert dispatcher.runs == ["long"]
+        assert dispatcher.cancelled == []
+
+    asyncio.run(main())
+
+def test_job_claimed_by_another_runner_is_cancelled(redis, monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher(delay=5))
+
+    async def main():
+        jobs, repo = await setup(redis)
+        await jobs.enqueue(jr.ingestion_job("long", REQUEST))
+        runner = jr.JobRunner(consumer="a")
+
+        async def taken_over():
+            entries = await pending(redis)
+            if entries and entries[0]["consumer"] == b"a" and "long" in dispatcher.runs:
+                await redis.xclaim("ingestion:jobs", "ingestion-runners", "z", 0, [entries[0]["message_id"]], justid=True)
+            return dispatcher.cancelled == ["long"]
+        await run_until(runner, redis, taken_over)
+
+        assert runner._running == {}
+        # Not acked, the job stays with the runner that took it
+        assert [entry["consumer"] for entry in await pending(redis)] == [b"z"]
+
+    asyncio.run(main())
+
+def test_runner_pools_wait_for_a_free_connection():
+    assert isinstance(build_async_client(max_connections=3, blocking=True).connection_pool, BlockingConnectionPool)
+
+def test_jobs_share_a_pool_smaller_than_concurrency(monkeypatch):
+    dispatcher = use_dispatcher(monkeypatch, Dispatcher(delay=0.05))
+    server = fakeredis.FakeServer()
+
+    def client(max_connections: int) -> Redis:
+        return Redis(connection_pool=BlockingConnectionPool(connection_class=FakeAsyncRedisConnection, server=server, max_connections=max_connections, timeout=5))
+
+    async def main():
+        redis = client(2)
+        jobs, repo = await setup(redis)
+        task_ids = [f"t{n}" for n in range(8)]
+        for task_id in task_ids:
+            await jobs.enqueue(jr.ingestion_job(task_id, REQUEST))
+
+        async def all_succeeded():
+            return all([await state_is(repo, task_id, "SUCCESS") for task_id in task_ids])
+        # The job stream's pool is held by the blocking read most of the time, acks wait for it
+        await run_until(jr.JobRunner(concurrency=8, consumer="a"), redis, all_succeeded, job_redis=client(2))
+
+        assert sorted(dispatcher.runs) == task_ids
+        assert await pending(redis) == []
+
+    asyncio.run(main())
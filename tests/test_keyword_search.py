@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from fastapi_app.schemas.intent import KeywordSearch
+from fastapi_app.services.polymarket import client as polymarket
+
+class Search:
+    """
+    Serves /public-search pages of total events, without pagination metadata
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.params: list[dict] = []
+
+    async def get_cached(self, client, semaphore, endpoint, *, params, **kwargs):
+        self.params.append(params)
+        start = (params['page'] - 1) * params['limit_per_type']
+        end = min(start + params['limit_per_type'], self.total)
+        return {'events': [{'id': i} for i in range(start, end)]}
+
+async def collect(limit: int | None) -> list[dict]:
+    client = type("Client", (), {"gamma": None, "gamma_limiter": None, "metadata_cache": None, "single_flight": None})()
+    return [event async for event in polymarket.polymarket_iter_events_from_keyword("election", limit, client, asyncio.Semaphore(1))] #type: ignore
+
+@pytest.fixture
+def search(monkeypatch):
+    search = Search(total=25)
+    monkeypatch.setattr(polymarket, "SEARCH_PAGE_SIZE", 10)
+    monkeypatch.setattr(polymarket, "polymarket_get_cached", search.get_cached)
+    return search
+
+def test_stops_at_limit(search):
+    events = asyncio.run(collect(12))
+
+    assert [event['id'] for event in events] == list(range(12))
+    assert [params['page'] for params in search.params] == [1, 2]
+
+def test_small_limit_requests_a_small_page(search):
+    events = asyncio.run(collect(3))
+
+    assert len(events) == 3
+    assert [params['limit_per_type'] for params in search.params] == [3]
+
+def test_no_limit_reads_every_page(search):
+    events = asyncio.run(collect(None))
+
+    assert [event['id'] for event in events] == list(range(25))
+    assert [params['page'] for params in search.params] == [1, 2, 3]
+
+def test_null_limit_is_a_valid_request():
+    assert KeywordSearch.model_validate({'kind': 'keyword', 'limit': None}).limit is None
@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from fastapi_app.core import circuit_breaker
+from fastapi_app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from fastapi_app.core.polymarket_client import PolymarketCircuitOpen, PolymarketRateLimit, PolymarketUnavailable
+from fastapi_app.services.polymarket import client as polymarket
+
+class Upstream:
+    """
+    Answers each request with the next of responses, an exception in the list is raised instead
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url="https://upstream.test", transport=httpx.MockTransport(self.handle))
+
+@pytest.fixture
+def delays(monkeypatch):
+    # Backoff delays as computed, without sleeping through them
+    delays = []
+    backoff_delay = polymarket._backoff_delay
+    def record(attempt, retry_after):
+        delays.append(backoff_delay(attempt, retry_after))
+        return 0
+    monkeypatch.setattr(polymarket, "_backoff_delay", record)
+    monkeypatch.setattr(polymarket, "POLYMARKET_MAX_RETRIES", 3)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setenv("POLYMARKET_BREAKER_FAILURES", "2")
+    return delays
+
+def get(upstream: Upstream):
+    async def main():
+        async with upstream.client() as client:
+            return await polymarket.polymarket_get_response(client, asyncio.Semaphore(1), "/prices-history")
+    return asyncio.run(main())
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=60)
+
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    # A success in between starts the count over
+    breaker.before_request()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(PolymarketCircuitOpen):
+        breaker.before_request()
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.05)
+    breaker.before_request()
+    breaker.record_failure()
+
+    time.sleep(0.06)
+    breaker.before_request()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(PolymarketCircuitOpen):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_request()
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=5, recovery_timeout=0.05)
+    for _ in range(5):
+        breaker.before_request()
+        breaker.record_failure()
+
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    with pytest.raises(PolymarketCircuitOpen):
+        breaker.before_request()
+
+def test_trial_that_never_reports_stops_blocking():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.05)
+    breaker.before_request()
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_request()
+
+    # The trial was cancelled without recording a result
+    time.sleep(0.06)
+    breaker.before_request()
+    assert breaker.state == HALF_OPEN
+
+def test_server_errors_and_timeouts_are_retried(delays):
+    upstream = Upstream(httpx.Response(503), httpx.ReadTimeout("slow"), httpx.Response(200, json={"ok": True}))
+
+    resp = get(upstream)
+
+    assert resp.json() == {"ok": True}
+    assert upstream.requests == 3
+    assert len(delays) == 2
+    # Full jitter under the exponential cap
+    assert all(0 <= delay <= polymarket.POLYMARKET_BACKOFF_BASE * 2 ** attempt for attempt, delay in enumerate(delays))
+
+def test_retry_after_is_honored(delays):
+    upstream = Upstream(httpx.Response(429, headers={"Retry-After": "7"}), httpx.Response(200))
+
+    assert get(upstream).status_code == 200
+    assert delays[0] >= 7
+
+def test_retry_after_is_capped(delays, monkeypatch):
+    monkeypatch.setattr(polymarket, "POLYMARKET_RETRY_AFTER_MAX", 5)
+    upstream = Upstream(httpx.Response(503, headers={"Retry-After": "3600"}), httpx.Response(200))
+
+    get(upstream)
+
+    assert 5 <= delays[0] <= max(5, polymarket.POLYMARKET_BACKOFF_BASE)
+
+def test_client_errors_are_not_retried(delays):
+    upstream = Upstream(httpx.Response(404))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        get(upstream)
+
+    assert upstream.requests == 1
+    assert delays == []
+    assert circuit_breaker.get_breaker("/prices-history").failures == 0
+
+def test_exhausted_retries_count_one_breaker_failure(delays):
+    upstream = Upstream(httpx.Response(503))
+
+    with pytest.raises(PolymarketUnavailable):
+        get(upstream)
+
+    breaker = circuit_breaker.get_breaker("/prices-history")
+    assert upstream.requests == 4
+    assert breaker.failures == 1
+    assert breaker.state == CLOSED
+
+    # The second failed call reaches the threshold of 2, the third is rejected without a request
+    with pytest.raises(PolymarketUnavailable):
+        get(upstream)
+    assert breaker.state == OPEN
+
+    with pytest.raises(PolymarketCircuitOpen):
+        get(upstream)
+    assert upstream.requests == 8
+
+def test_rate_limits_do_not_trip_the_breaker(delays):
+    upstream = Upstream(httpx.Response(429))
+
+    for _ in range(3):
+        with pytest.raises(PolymarketRateLimit):
+            get(upstream)
+
+    breaker = circuit_breaker.get_breaker("/prices-history")
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
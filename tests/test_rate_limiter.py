@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from fastapi_app.core.rate_limiter import AdaptiveRateLimiter
+
+async def reserve(limiter: AdaptiveRateLimiter) -> float:
+    # Seconds acquire() would sleep for its slot, without sleeping
+    wait = await limiter._acquire(
+        keys=[limiter._bucket_key()],
+        args=[limiter.max_rate, limiter.min_rate, limiter.burst, limiter.increase_per_second, limiter.ttl],
+    )
+    return float(wait)
+
+def test_burst_is_free_and_later_slots_are_spaced_at_the_rate(redis):
+    async def main():
+        limiter = AdaptiveRateLimiter(redis, "test", max_rate=10, burst=5, increase_per_second=0)
+
+        waits = [await reserve(limiter) for _ in range(8)]
+
+        assert waits[:5] == [0, 0, 0, 0, 0]
+        assert waits[5:] == pytest.approx([0.1, 0.2, 0.3], abs=0.02)
+        assert (await limiter.stats())["queue_depth"] == pytest.approx(3, abs=0.2)
+
+    asyncio.run(main())
+
+def test_limiters_sharing_a_bucket_share_its_rate(redis):
+    async def main():
+        first = AdaptiveRateLimiter(redis, "shared", max_rate=10, burst=1, increase_per_second=0)
+        second = AdaptiveRateLimiter(redis, "shared", max_rate=10, burst=1, increase_per_second=0)
+
+        waits = [await reserve(first), await reserve(second), await reserve(first)]
+
+        assert waits == pytest.approx([0, 0.1, 0.2], abs=0.02)
+
+    asyncio.run(main())
+
+def test_backoff_cuts_the_rate_once_per_cooldown(redis):
+    async def main():
+        limiter = AdaptiveRateLimiter(redis, "test", max_rate=20, min_rate=1, increase_per_second=0, decrease_factor=0.5, backoff_cooldown=60)
+
+        assert await limiter.on_rate_limited() == pytest.approx(10)
+        # Other workers reporting the same burst of 429s
+        assert await limiter.on_rate_limited() == pytest.approx(10)
+        assert (await limiter.stats())["rate"] == pytest.approx(10)
+
+    asyncio.run(main())
+
+def test_backoff_never_goes_below_min_rate(redis):
+    async def main():
+        limiter = AdaptiveRateLimiter(redis, "test", max_rate=8, min_rate=3, increase_per_second=0, decrease_factor=0.5, backoff_cooldown=0)
+
+        rates = [await limiter.on_rate_limited() for _ in range(4)]
+
+        assert rates == pytest.approx([4, 3, 3, 3])
+
+    asyncio.run(main())
+
+def test_rate_recovers_additively_up_to_max_rate(redis):
+    async def main():
+        limiter = AdaptiveRateLimiter(redis, "test", max_rate=10, min_rate=1, increase_per_second=20, decrease_factor=0.5, backoff_cooldown=0)
+
+        loop = asyncio.get_running_loop()
+        backing_off = loop.time()
+        await limiter.on_rate_limited()
+        await asyncio.sleep(0.1)
+        rate = (await limiter.stats())["rate"]
+        # Halved to 5, then 20 per second back up
+        assert 7 - 0.2 <= rate <= 5 + 20 * (loop.time() - backing_off) + 0.2
+
+        await asyncio.sleep(0.2)
+        assert (await limiter.stats())["rate"] == 10
+
+    asyncio.run(main())
+
+def test_backoff_settles_tokens_earned_at_the_old_rate(redis):
+    async def main():
+        limiter = AdaptiveRateLimiter(redis, "test", max_rate=20, burst=20, increase_per_second=0, decrease_factor=0.25, backoff_cooldown=0)
+
+        # Empty the bucket, then let 0.2 s of refill accrue at 20 per second
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(20):
+            await reserve(limiter)
+        await asyncio.sleep(0.2)
+        await limiter.on_rate_limited()
+        backed_off = loop.time()
+        tokens = (await limiter.stats())["available_tokens"]
+
+        # Recomputed at the new rate of 5 the refill would be about 1 token. Bounds follow the measured time, so a
+        # slow run does not fail it
+        assert 20 * 0.2 - 0.3 <= tokens <= 20 * (backed_off - started) + 5 * (loop.time() - backed_off) + 0.3
+
+    asyncio.run(main())
+
+def test_acquire_sleeps_until_its_slot(redis):
+    async def main():
+        limiter = AdaptiveRateLimiter(redis, "test", max_rate=20, burst=1, increase_per_second=0)
+        loop = asyncio.get_running_loop()
+
+        started = loop.time()
+        for _ in range(3):
+            await limiter.acquire()
+
+        assert loop.time() - started == pytest.approx(0.1, abs=0.03)
+
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.services.request_dedup import request_fingerprint, submit_deduplicated
+
+PAYLOAD = {"keywords": ["election"], "limit": 10}
+
+class Queue:
+    """
+    Records enqueued task ids, failing with error when one is given
+    """
+
+    def __init__(self, delay: float = 0.01, error: Exception | None = None):
+        self.task_ids: list[str] = []
+        self.delay = delay
+        self.error = error
+
+    async def enqueue(self, task_id: str):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.task_ids.append(task_id)
+
+async def celery_state_keys(redis) -> list[bytes]:
+    return [key async for key in redis.scan_iter(match="ingestion:*:celery")]
+
+def test_fingerprint_is_canonical():
+    assert request_fingerprint({"a": 1, "b": [1, 2]}) == request_fingerprint({"b": [1, 2], "a": 1})
+    assert request_fingerprint({"a": 1}) != request_fingerprint({"a": 2})
+
+def test_concurrent_duplicates_enqueue_once(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        queue = Queue()
+
+        results = await asyncio.gather(*[submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60) for _ in range(20)])
+
+        assert len(queue.task_ids) == 1
+        assert {task_id for task_id, _ in results} == set(queue.task_ids)
+        assert sorted(deduplicated for _, deduplicated in results) == [False] + [True] * 19
+        # Duplicates drop the state they mirrored before claiming
+        assert len(await celery_state_keys(redis)) == 1
+
+    asyncio.run(main())
+
+def test_different_requests_are_not_deduplicated(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        queue = Queue()
+
+        await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60)
+        await submit_deduplicated(repo, {**PAYLOAD, "limit": 20}, queue.enqueue, window=60)
+
+        assert len(queue.task_ids) == 2
+
+    asyncio.run(main())
+
+def test_window_zero_disables_dedup(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        queue = Queue()
+
+        first, _ = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=0)
+        second, deduplicated = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=0)
+
+        assert first != second
+        assert not deduplicated
+        assert queue.task_ids == [first, second]
+
+    asyncio.run(main())
+
+@pytest.mark.parametrize("fail", ["celery", "loading"])
+def test_failed_task_is_replaced_once(redis, fail):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        queue = Queue()
+        failed, _ = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60)
+        if fail == "celery":
+            await repo.set_celery_state(failed, "FAILURE", error="worker lost")
+        else:
+            await repo.data_loading_status_failed(failed)
+
+        results = await asyncio.gather(*[submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60) for _ in range(5)])
+
+        assert len(queue.task_ids) == 2
+        replacement = queue.task_ids[1]
+        assert replacement != failed
+        assert {task_id for task_id, _ in results} == {replacement}
+
+    asyncio.run(main())
+
+def test_evicted_task_is_replaced(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        queue = Queue()
+        evicted, _ = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60)
+        await repo.discard_celery_state(evicted)
+
+        task_id, deduplicated = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60)
+
+        assert task_id != evicted
+        assert not deduplicated
+
+    asyncio.run(main())
+
+def test_running_and_completed_tasks_are_reused(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        queue = Queue()
+        task_id, _ = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60)
+
+        await repo.data_loading_status_start(task_id)
+        assert await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60) == (task_id, True)
+
+        await repo.data_loading_status_end(task_id)
+        assert await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60) == (task_id, True)
+        assert queue.task_ids == [task_id]
+
+    asyncio.run(main())
+
+def test_enqueue_failure_marks_the_task_failed(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        broken = Queue(error=ConnectionError("broker down"))
+
+        with pytest.raises(ConnectionError):
+            await submit_deduplicated(repo, PAYLOAD, broken.enqueue, window=60)
+
+        [key] = await celery_state_keys(redis)
+        failed = key.decode("utf-8").split(":")[1]
+        assert await repo.get_task_state(failed) == ("PENDING", "FAILURE")
+        assert await repo.get_error(failed) == "broker down"
+
+        # The next submission does not get the task that was never enqueued
+        queue = Queue()
+        task_id, deduplicated = await submit_deduplicated(repo, PAYLOAD, queue.enqueue, window=60)
+        assert task_id != failed
+        assert not deduplicated
+        assert queue.task_ids == [task_id]
+
+    asyncio.run(main())
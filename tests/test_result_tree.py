@@ -0,0 +1,110 @@
+import asyncio
+import gzip
+import json
+
+import fakeredis.aioredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fastapi_app.api.routes import ingestion as routes
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.services.polymarket.handler import materialize_tree
+from utils import codecs
+from utils.history_codec import is_history_ref, is_packed
+
+HISTORY = {'t': [0, 60, 120], 'p': [0.25, 0.5, 0.75]}
+
+def market_delta(event_id: str, market_id: str, history) -> dict:
+    return {event_id: {"title": event_id, "markets": {market_id: {"question": market_id, "history": history}}}}
+
+async def finished_task(repo: AsyncIngestionRepository, task_id: str):
+    ref = await repo.save_history_blob(task_id, HISTORY)
+    await repo.save_tree_delta(task_id, market_delta("e1", "m1", ref))
+    await repo.save_tree_delta(task_id, market_delta("e1", "m2", ref))
+    await repo.save_tree_delta(task_id, market_delta("e2", "m3", ref))
+    await materialize_tree(repo, task_id)
+
+def test_result_tree_keeps_history_refs(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await finished_task(repo, "t")
+
+        _, tree = await repo.load_result_tree("t")
+
+        assert sorted(tree) == ["e1", "e2"]
+        assert sorted(tree["e1"]["markets"]) == ["m1", "m2"]
+        assert is_history_ref(tree["e1"]["markets"]["m1"]["history"])
+
+    asyncio.run(main())
+
+def test_only_the_tree_is_stored_in_one_encoding(redis, monkeypatch):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", ["brotli", "gzip", "zstd"])
+
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await finished_task(repo, "t")
+
+        fields = await redis.hkeys("ingestion:t:result")
+        assert sorted(fields) == [b"etag", b"tree", b"wire:tree:gzip"]
+
+        _, body = await repo.load_wire_payload("t", "tree", "gzip")
+        tree = json.loads(gzip.decompress(body))["data"]
+        assert is_packed(tree["e2"]["markets"]["m3"]["history"])
+
+    asyncio.run(main())
+
+def test_no_wire_payload_without_encodings(redis, monkeypatch):
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", [])
+
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await finished_task(repo, "t")
+
+        assert sorted(await redis.hkeys("ingestion:t:result")) == [b"etag", b"tree"]
+
+    asyncio.run(main())
+
+@pytest.fixture
+def client(redis, monkeypatch):
+    # The app runs on the test client's own event loop, so it gets a client of its own on the same server
+    server = redis.connection_pool.connection_kwargs["server"]
+    monkeypatch.setattr(routes, "redis_repository", AsyncIngestionRepository(fakeredis.aioredis.FakeRedis(server=server)))
+    monkeypatch.setattr(codecs, "WIRE_ENCODINGS", ["gzip"])
+    routes.response_cache.clear()
+
+    app = FastAPI()
+    app.include_router(routes.router)
+    yield TestClient(app)
+    routes.response_cache.clear()
+
+def test_each_content_coding_has_its_own_etag(redis, client):
+    asyncio.run(finished_task(AsyncIngestionRepository(redis), "t"))
+
+    gzipped = client.get("/ingestion/t/tree", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/ingestion/t/tree", headers={"Accept-Encoding": "identity"})
+
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in identity.headers
+    assert gzipped.json() == identity.json()
+    assert gzipped.headers["etag"] != identity.headers["etag"]
+    assert gzipped.headers["etag"].endswith('-gzip"')
+    assert identity.headers["vary"] == "Accept-Encoding"
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_revalidation_matches_the_representation(redis, client, cached):
+    asyncio.run(finished_task(AsyncIngestionRepository(redis), "t"))
+    gzip_etag = client.get("/ingestion/t/tree", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    identity_etag = client.get("/ingestion/t/tree", headers={"Accept-Encoding": "identity"}).headers["etag"]
+    if not cached:
+        routes.response_cache.clear()
+
+    revalidated = client.get("/ingestion/t/tree", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == gzip_etag
+
+    revalidated = client.get("/ingestion/t/tree", headers={"Accept-Encoding": "identity", "If-None-Match": identity_etag})
+    assert revalidated.status_code == 304
+
+    # A gzip etag does not validate the identity representation
+    assert client.get("/ingestion/t/tree", headers={"Accept-Encoding": "identity", "If-None-Match": gzip_etag}).status_code == 200
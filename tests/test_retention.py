@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import pytest
+
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.repositories.ingestion_repository import HISTORY_BLOB_TTL_SECONDS
+from fastapi_app.repositories.retention_repository import AsyncRetentionRepository
+from fastapi_app.services import retention
+
+class SizedRetentionRepository(AsyncRetentionRepository):
+    """
+    fakeredis has neither MEMORY USAGE nor INFO, keys are sized by their DUMP and used memory is the sum of every key
+    """
+
+    async def memory_usage(self, keys: list) -> list[int]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.dump(key)
+            return [len(dump) if dump else 0 for dump in await pipe.execute()]
+
+    async def used_memory(self) -> int:
+        return sum(size for _, size in await self.key_usage())
+
+def history(seed: int) -> dict:
+    return {'t': [0, 60, 120], 'p': [seed / 10, seed / 10 + 0.01, seed / 10 + 0.02]}
+
+@pytest.fixture
+def repos(redis, monkeypatch):
+    # Blobs are freed as soon as they are unreferenced unless a test restores the guard
+    monkeypatch.setattr(retention, "RETENTION_BLOB_MIN_AGE_SECONDS", 0)
+    return AsyncIngestionRepository(redis), SizedRetentionRepository(redis)
+
+async def write_task(repo: AsyncIngestionRepository, task_id: str, *histories: dict, finished: bool = True) -> list[str]:
+    # Returns the blob keys the task references
+    await repo.data_loading_status_start(task_id)
+    blob_keys = []
+    for i, market_history in enumerate(histories):
+        ref = await repo.save_history_blob(task_id, market_history)
+        await repo.save_tree_delta(task_id, {task_id: {"markets": {str(i): {"history": ref}}}})
+        blob_keys.append(repo._history_blob(market_history)[0])
+    if finished:
+        await repo.data_loading_status_end(task_id)
+    return blob_keys
+
+async def read_in_order(repo: AsyncIngestionRepository, *task_ids: str):
+    # Scores the finished set so the first task was read longest ago
+    now = time.time()
+    await repo.redis.zadd(repo._finished_key(), {task_id: now - len(task_ids) + i for i, task_id in enumerate(task_ids)})
+
+async def total(retention_repo: SizedRetentionRepository) -> int:
+    ingestion_bytes, blob_sizes = await retention.ingestion_usage(retention_repo)
+    return ingestion_bytes + sum(blob_sizes.values())
+
+async def task_exists(repo: AsyncIngestionRepository, task_id: str) -> bool:
+    return bool(await repo.redis.exists(*repo._task_keys(task_id)))
+
+def test_nothing_is_evicted_under_budget(repos):
+    repo, retention_repo = repos
+
+    async def main():
+        await write_task(repo, "a", history(1))
+
+        result = await retention.sweep_once(retention_repo, budget=await retention_repo.used_memory())
+
+        assert result["evicted_tasks"] == 0
+        assert await task_exists(repo, "a")
+
+    asyncio.run(main())
+
+def test_least_recently_read_task_is_evicted_first(repos):
+    repo, retention_repo = repos
+
+    async def main():
+        blobs = {task_id: await write_task(repo, task_id, history(i)) for i, task_id in enumerate("abc")}
+        await read_in_order(repo, "b", "a", "c")
+
+        result = await retention.sweep_once(retention_repo, budget=await total(retention_repo) - 1)
+
+        assert result["evicted_tasks"] == 1
+        assert not await task_exists(repo, "b")
+        assert not await repo.redis.exists(*blobs["b"])
+        assert await task_exists(repo, "a") and await task_exists(repo, "c")
+        assert await repo.redis.exists(*blobs["a"], *blobs["c"]) == 2
+        assert await retention_repo.least_recently_read(3) == ["a", "c"]
+
+    asyncio.run(main())
+
+def test_eviction_stops_once_under_budget(repos):
+    repo, retention_repo = repos
+
+    async def main():
+        for i, task_id in enumerate("abcd"):
+            await write_task(repo, task_id, history(i))
+        await read_in_order(repo, "a", "b", "c", "d")
+        before = await total(retention_repo)
+        per_task = before // 4
+
+        budget = before - per_task - 1
+        result = await retention.sweep_once(retention_repo, budget=budget)
+
+        assert result["evicted_tasks"] == 2
+        assert await total(retention_repo) <= budget < await total(retention_repo) + per_task
+        assert await retention_repo.least_recently_read(4) == ["c", "d"]
+
+    asyncio.run(main())
+
+def test_in_progress_tasks_are_never_evicted(repos):
+    repo, retention_repo = repos
+
+    async def main():
+        running_blobs = await write_task(repo, "running", history(1), finished=False)
+        await write_task(repo, "done", history(2))
+
+        result = await retention.sweep_once(retention_repo, budget=1)
+
+        assert result["evicted_tasks"] == 1
+        assert not await task_exists(repo, "done")
+        assert await task_exists(repo, "running")
+        assert await repo.redis.exists(*running_blobs) == 1
+
+    asyncio.run(main())
+
+def test_shared_blob_is_kept_until_no_task_references_it(repos):
+    repo, retention_repo = repos
+
+    async def main():
+        shared, own = history(1), history(2)
+        [shared_key] = await write_task(repo, "a", shared)
+        shared_key, own_key = await write_task(repo, "b", shared, own)
+        await read_in_order(repo, "a", "b")
+
+        await retention.sweep_once(retention_repo, budget=await total(retention_repo) - 1)
+
+        assert not await task_exists(repo, "a")
+        assert await repo.redis.exists(shared_key, own_key) == 2
+
+        result = await retention.sweep_once(retention_repo, budget=1)
+
+        assert result["evicted_tasks"] == 1
+        assert result["evicted_blobs"] == 2
+        assert await repo.redis.exists(shared_key, own_key) == 0
+
+    asyncio.run(main())
+
+def test_orphaned_blobs_are_freed_before_any_task(repos):
+    repo, retention_repo = repos
+
+    async def main():
+        [orphan] = await write_task(repo, "expired", history(1))
+        # The task's keys expired, its blob outlives them on a longer ttl
+        await repo.redis.delete(*repo._task_keys("expired"))
+        await repo.redis.zrem(repo._finished_key(), "expired")
+        [kept] = await write_task(repo, "a", history(2))
+
+        result = await retention.sweep_once(retention_repo, budget=await total(retention_repo) - 1)
+
+        assert result["evicted_tasks"] == 0
+        assert result["evicted_blobs"] == 1
+        assert not await repo.redis.exists(orphan)
+        assert await repo.redis.exists(kept)
+        assert await task_exists(repo, "a")
+
+    asyncio.run(main())
+
+def test_recently_written_blobs_are_kept(repos, monkeypatch):
+    repo, retention_repo = repos
+    monkeypatch.setattr(retention, "RETENTION_BLOB_MIN_AGE_SECONDS", 600)
+
+    async def main():
+        [blob_key] = await write_task(repo, "a", history(1))
+
+        result = await retention.sweep_once(retention_repo, budget=1)
+
+        # The task goes, its blob may already be referenced by a task the sweep has not seen
+        assert result["evicted_tasks"] == 1
+        assert result["evicted_blobs"] == 0
+        assert await repo.redis.exists(blob_key)
+
+        # Once the ttl was last refreshed longer ago than the guard, the blob is freed
+        await repo.redis.expire(blob_key, HISTORY_BLOB_TTL_SECONDS - 600)
+        await retention.sweep_once(retention_repo, budget=1)
+        assert not await repo.redis.exists(blob_key)
+
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.core.single_flight import SingleFlight
+from fastapi_app.services.polymarket import client as polymarket
+
+class Upstream:
+    def __init__(self, delay: float = 0.05, error: Exception | None = None):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"history": [1, 2, 3], "call": self.calls}
+
+def test_concurrent_calls_in_a_process_share_one_fetch():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+
+        results = await asyncio.gather(*[flight.do("k", upstream.fetch) for _ in range(10)])
+
+        assert upstream.calls == 1
+        assert all(result == results[0] for result in results)
+
+    asyncio.run(main())
+
+def test_processes_share_one_fetch_through_the_lease(redis):
+    async def main():
+        # Two instances stand in for two worker processes on one redis
+        first, second = SingleFlight(redis), SingleFlight(redis)
+        upstream = Upstream()
+
+        results = await asyncio.gather(first.do("k", upstream.fetch), second.do("k", upstream.fetch))
+
+        assert upstream.calls == 1
+        assert results[0] == results[1]
+        assert not await redis.exists("singleflight:k:lease")
+
+    asyncio.run(main())
+
+def test_waiter_fetches_itself_when_the_lease_holder_fails(redis):
+    async def main():
+        holder, waiter = SingleFlight(redis), SingleFlight(redis)
+        failing = Upstream(error=RuntimeError("upstream down"))
+        working = Upstream()
+
+        holder_call = asyncio.create_task(holder.do("k", failing.fetch))
+        await asyncio.sleep(0.01)
+        result = await waiter.do("k", working.fetch)
+
+        with pytest.raises(RuntimeError):
+            await holder_call
+        assert failing.calls == 1
+        assert working.calls == 1
+        assert result["call"] == 1
+
+    asyncio.run(main())
+
+def test_published_result_is_served_without_fetching(redis):
+    async def main():
+        upstream = Upstream(delay=0)
+        await SingleFlight(redis).do("k", upstream.fetch)
+        await SingleFlight(redis).do("k", upstream.fetch)
+
+        assert upstream.calls == 1
+
+    asyncio.run(main())
+
+def test_lease_is_only_released_by_its_holder(redis):
+    async def main():
+        flight = SingleFlight(redis)
+        await redis.set("singleflight:k:lease", "someone-else")
+
+        assert await flight._release(keys=["singleflight:k:lease"], args=["my-token"]) == 0
+        assert await redis.get("singleflight:k:lease") == b"someone-else"
+
+    asyncio.run(main())
+
+def test_cancelled_caller_does_not_cancel_the_shared_fetch():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+
+        cancelled = asyncio.create_task(flight.do("k", upstream.fetch))
+        other = asyncio.create_task(flight.do("k", upstream.fetch))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+
+        assert (await other)["call"] == 1
+        assert cancelled.cancelled()
+
+    asyncio.run(main())
+
+def test_history_tails_within_a_fidelity_step_send_identical_params(monkeypatch):
+    step = polymarket.HISTORY_FIDELITY * 60
+    start = 1_800_000_000 - 1_800_000_000 % step
+    cached_until = start - step - 10
+    sent = []
+
+    class Cache:
+        async def load_history(self, token_id, fidelity):
+            return {"t": [cached_until], "p": [0.5]}
+
+        async def save_history(self, *args, **kwargs):
+            pass
+
+    async def fake_get(**kwargs):
+        sent.append(kwargs["params"])
+        return {"history": []}
+
+    monkeypatch.setattr(polymarket, "polymarket_get", fake_get)
+    client = SimpleNamespace(cache=Cache(), clob=None, clob_limiter=None, single_flight=None)
+
+    async def main():
+        for now in [start + 5, start + step - 1]:
+            monkeypatch.setattr(polymarket.time, "time", lambda now=now: now)
+            await polymarket.polymarket_price_history({"tokenId": "tok"}, client, asyncio.Semaphore(1)) #type: ignore
+
+    asyncio.run(main())
+
+    assert len(sent) == 2
+    assert sent[0] == sent[1]
+    assert sent[0]["endTs"] == start
@@ -0,0 +1,116 @@
+import asyncio
+
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+
+def delta(n: int) -> dict:
+    return {"event_id": f"e{n}", "markets": []}
+
+def test_pending_without_celery_state(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+
+        assert await repo.lookup_task("t") == ("PENDING", None, None, [])
+
+    asyncio.run(main())
+
+def test_pending_returns_the_mirrored_celery_state(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.set_celery_state("t", "STARTED")
+
+        assert await repo.lookup_task("t") == ("PENDING", "STARTED", None, [])
+
+    asyncio.run(main())
+
+def test_celery_failure_before_loading_returns_the_error(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.set_celery_state("t", "FAILURE", error="worker lost")
+
+        assert await repo.lookup_task("t") == ("PENDING", "FAILURE", "worker lost", [])
+
+    asyncio.run(main())
+
+def test_in_progress_returns_deltas_from_since(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.set_celery_state("t", "STARTED")
+        await repo.data_loading_status_start("t")
+        for n in range(3):
+            await repo.save_tree_delta("t", delta(n))
+
+        status, celery_state, error, deltas = await repo.lookup_task("t", since=1)
+
+        # The celery state is only read while loading has not started
+        assert (status, celery_state, error) == ("IN_PROGRESS", None, None)
+        assert deltas == [delta(1), delta(2)]
+        # In progress tasks are not in the finished set yet
+        assert await redis.zscore("ingestion:finished", "t") is None
+
+    asyncio.run(main())
+
+def test_complete_returns_deltas_and_marks_the_task_read(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.data_loading_status_start("t")
+        await repo.save_tree_delta("t", delta(0))
+        await repo.data_loading_status_end("t")
+        await redis.zadd("ingestion:finished", {"t": 1})
+
+        assert await repo.lookup_task("t") == ("COMPLETE", None, None, [delta(0)])
+        assert await redis.zscore("ingestion:finished", "t") > 1
+
+    asyncio.run(main())
+
+def test_failed_returns_the_error_without_deltas(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.data_loading_status_start("t")
+        await repo.save_tree_delta("t", delta(0))
+        await repo.set_error("t", RuntimeError("upstream down"))
+        await repo.data_loading_status_failed("t")
+        await redis.zadd("ingestion:finished", {"t": 1})
+
+        assert await repo.lookup_task("t") == ("FAILED", None, "upstream down", [])
+        assert await redis.zscore("ingestion:finished", "t") > 1
+
+    asyncio.run(main())
+
+def test_lookup_does_not_add_evicted_tasks_back(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.data_loading_status_end("t")
+        await redis.zrem("ingestion:finished", "t")
+
+        await repo.lookup_task("t")
+        await repo.batch_status([("t", 0)])
+
+        assert await redis.zscore("ingestion:finished", "t") is None
+
+    asyncio.run(main())
+
+def test_batch_status_matches_lookup(redis):
+    async def main():
+        repo = AsyncIngestionRepository(redis)
+        await repo.set_celery_state("queued", "QUEUED")
+        await repo.data_loading_status_start("running")
+        for n in range(2):
+            await repo.save_tree_delta("running", delta(n))
+        await repo.set_error("failed", RuntimeError("boom"))
+        await repo.data_loading_status_failed("failed")
+        await redis.zadd("ingestion:finished", {"failed": 1})
+
+        cursors = [("missing", 0), ("queued", 0), ("running", 1), ("failed", 0)]
+        results = await repo.batch_status(cursors)
+
+        assert results == [
+            ("PENDING", None, None, []),
+            ("PENDING", "QUEUED", None, []),
+            ("IN_PROGRESS", None, None, [delta(1)]),
+            ("FAILED", None, "boom", []),
+        ]
+        assert await redis.zscore("ingestion:finished", "failed") > 1
+        assert [await repo.lookup_task(task_id, since) for task_id, since in cursors] == results
+        assert await repo.batch_status([]) == []
+
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from fastapi_app.api.routes import ingestion as routes
+from fastapi_app.repositories.async_repository import AsyncIngestionRepository
+from fastapi_app.services import task_stream
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def client(server, monkeypatch):
+    # The app runs on the test client's own event loop, so it gets a client of its own on the shared server
+    monkeypatch.setattr(routes, "stream_repository", AsyncIngestionRepository(fakeredis.aioredis.FakeRedis(server=server)))
+    monkeypatch.setattr(routes, "stream_subscribers", asyncio.Semaphore(2))
+    monkeypatch.setattr(task_stream, "TASK_STREAM_BLOCK_MS", 50)
+
+    app = FastAPI()
+    app.include_router(routes.router)
+    return TestClient(app)
+
+def write(server, write_task):
+    async def main():
+        await write_task(AsyncIngestionRepository(fakeredis.aioredis.FakeRedis(server=server)))
+    asyncio.run(main())
+
+async def finished_task(repo: AsyncIngestionRepository):
+    await repo.data_loading_status_start("t")
+    await repo.save_tree_delta("t", {"event_id": "e0", "markets": []})
+    await repo.save_tree_delta("t", {"event_id": "e1", "markets": []})
+    await repo.data_loading_status_end("t")
+
+def sse_events(body: str) -> list[dict]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append({"id": fields["id"], "event": fields["event"], "data": json.loads(fields["data"])})
+    return events
+
+def test_sse_streams_deltas_then_the_final_status(server, client):
+    write(server, finished_task)
+
+    response = client.get("/ingestion/t/stream")
+    events = sse_events(response.text)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [event["event"] for event in events] == ["status", "delta", "delta", "status"]
+    assert [event["data"]["event_id"] for event in events[1:3]] == ["e0", "e1"]
+    assert events[-1]["data"] == {"status": "success"}
+
+def test_sse_resumes_after_the_last_event_id(server, client):
+    write(server, finished_task)
+    first = sse_events(client.get("/ingestion/t/stream").text)
+
+    resumed = sse_events(client.get("/ingestion/t/stream", headers={"Last-Event-ID": first[1]["id"]}).text)
+
+    assert resumed == first[2:]
+
+def test_sse_without_follow_ends_once_caught_up(server, client):
+    async def running_task(repo: AsyncIngestionRepository):
+        await repo.data_loading_status_start("t")
+        await repo.save_tree_delta("t", {"event_id": "e0", "markets": []})
+    write(server, running_task)
+
+    events = sse_events(client.get("/ingestion/t/stream", params={"follow": "false"}).text)
+
+    assert [event["event"] for event in events] == ["status", "delta"]
+
+def test_sse_reports_a_task_that_failed_before_loading(server, client):
+    async def failed_task(repo: AsyncIngestionRepository):
+        await repo.set_celery_state("t", "FAILURE", error="worker lost")
+    write(server, failed_task)
+
+    events = sse_events(client.get("/ingestion/t/stream").text)
+
+    assert [event["data"] for event in events] == [{"status": "failure", "error": "worker lost"}]
+
+def test_sse_is_refused_once_every_subscriber_slot_is_taken(client, monkeypatch):
+    monkeypatch.setattr(routes, "stream_subscribers", asyncio.Semaphore(0))
+
+    response = client.get("/ingestion/t/stream")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+def test_websocket_streams_the_same_events(server, client):
+    write(server, finished_task)
+    expected = sse_events(client.get("/ingestion/t/stream").text)
+
+    with client.websocket_connect("/ingestion/t/stream") as websocket:
+        received = [websocket.receive_json() for _ in expected]
+        with pytest.raises(WebSocketDisconnect):
+            websocket.receive_json()
+
+    assert received == expected
+
+def test_websocket_is_closed_once_every_subscriber_slot_is_taken(client, monkeypatch):
+    monkeypatch.setattr(routes, "stream_subscribers", asyncio.Semaphore(0))
+
+    with client.websocket_connect("/ingestion/t/stream") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert closed.value.code == 1013
@@ -0,0 +1,121 @@
+"""
+Benchmark the payload codecs on tree deltas, and train the zstd dictionary used by the zstd-dict compression.
+
+    python -m utils.codec_benchmark                       synthetic deltas
+    python -m utils.codec_benchmark --task-id <id>        deltas of an ingestion task stored in redis
+    python -m utils.codec_benchmark --train-dict out.dict train a dictionary on part of the samples, then benchmark
+                                                          every codec on the held out rest
+
+Point PAYLOAD_ZSTD_DICT_PATH at the trained dictionary in every app to use zstd-dict.
+"""
+
+import argparse
+import os
+import random
+import time
+
+from utils import codecs
+
+def synthetic_deltas(count: int, points: int = 168) -> list[dict]:
+    # Shaped like market_to_tree_delta output, one week of hourly prices per outcome
+    deltas = []
+    now = int(time.time())
+    for i in range(count):
+        price = random.random()
+        history = {"t": [], "p": []}
+        for j in range(points):
+            price = min(1.0, max(0.0, price + random.uniform(-0.01, 0.01)))
+            history["t"].append(now - (points - j) * 3600)
+            history["p"].append(round(price, 4))
+
+        deltas.append({
+            str(1000 + i // 20): {
+                "event_title": f"Event {i // 20}",
+                "event_image": f"https://polymarket-upload.s3.us-east-2.amazonaws.com/event-{i // 20}.png",
+                "markets": {
+                    str(50000 + i // 2): {
+                        "market_question": f"Will outcome {i // 2} happen by the end of the year?",
+                        "volume": random.uniform(1000, 1000000),
+                        "outcomes": {
+                            "Yes" if i % 2 == 0 else "No": {
+                                "provider": "polymarket",
+                                "tokenId": str(random.getrandbits(250)),
+                                "history": history,
+                            }
+                        }
+                    }
+                }
+            }
+        })
+    return deltas
+
+def redis_deltas(task_id: str) -> list[dict]:
+    import redis
+
+    client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/2"))
+    payloads = client.lrange(f"ingestion:{task_id}:tree_delta", 0, -1)
+    return [codecs.decode(payload) for payload in payloads] #type: ignore
+
+def benchmark(codec: codecs.Codec, samples: list[dict], rounds: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        payloads = [codec.encode(sample) for sample in samples]
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for payload in payloads:
+            codecs.decode(payload)
+    decode_seconds = time.perf_counter() - start
+
+    raw_bytes = sum(len(codecs.Codec("json", "none").encode(sample)) for sample in samples)
+    stored_bytes = sum(len(payload) for payload in payloads)
+    megabytes = raw_bytes * rounds / 1e6
+
+    return {
+        "encode_mb_s": megabytes / encode_seconds,
+        "decode_mb_s": megabytes / decode_seconds,
+        "bytes": stored_bytes,
+        "ratio": raw_bytes / stored_bytes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--task-id", help="benchmark the tree deltas of this ingestion task")
+    parser.add_argument("--samples", type=int, default=500, help="number of synthetic deltas")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--train-dict", help="write a zstd dictionary trained on the samples to this path")
+    parser.add_argument("--dict-size", type=int, default=16384)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of the samples kept out of training to benchmark on")
+    args = parser.parse_args()
+
+    samples = redis_deltas(args.task_id) if args.task_id else synthetic_deltas(args.samples)
+    if not samples:
+        raise SystemExit("No samples to benchmark")
+
+    if args.train_dict:
+        # A dictionary compresses the samples it was trained on better than new ones, only held out samples are benchmarked
+        samples = samples[:]
+        random.Random(0).shuffle(samples)
+        split = len(samples) - max(1, int(len(samples) * args.holdout))
+        training, samples = samples[:split], samples[split:]
+        if not training:
+            raise SystemExit("Too few samples to hold some out of training")
+
+        # Trained on the uncompressed encoding that will be compressed
+        format = codecs.Codec(codecs.PAYLOAD_FORMAT, "none")
+        dictionary = codecs.train_zstd_dictionary([format.encode(sample)[1:] for sample in training], args.dict_size)
+        with open(args.train_dict, "wb") as f:
+            f.write(dictionary)
+        codecs.load_zstd_dictionary(dictionary)
+        print(f"Wrote {len(dictionary)} byte dictionary trained on {len(training)} samples to {args.train_dict}")
+
+    print(f"{len(samples)} samples, {args.rounds} rounds")
+    print(f"{'codec':<20}{'encode MB/s':>14}{'decode MB/s':>14}{'bytes':>12}{'ratio':>8}")
+    for name in codecs.available_codecs():
+        format, compression = name.split("+")
+        result = benchmark(codecs.Codec(format, compression), samples, args.rounds)
+        print(f"{name:<20}{result['encode_mb_s']:>14.1f}{result['decode_mb_s']:>14.1f}{result['bytes']:>12}{result['ratio']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
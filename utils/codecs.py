@@ -0,0 +1,273 @@
+"""
+This module creates the payload codecs used for everything the apps store in redis. A payload is one header byte
+naming its serialization format and compression, followed by the body, so stored payloads stay readable when the
+configured codec changes. Payloads written before the header existed are zlib compressed json and start with 0x78.
+
+Faster encoders (orjson, msgpack) and compressors (zstd, lz4) are used when installed. Small payloads such as single
+tree deltas barely compress on their own, a zstd dictionary trained on typical payloads fixes most of that.
+
+Wire payloads are plain compressed json for http responses, stored ready to send with a matching Content-Encoding.
+"""
+
+import gzip
+import json
+import logging
+import os
+import zlib
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Header byte is 0b11FFFCCC: format id in bits 3-5, compression id in bits 0-2. The 0b11 prefix never collides
+# with a legacy zlib payload
+HEADER_PREFIX = 0xC0
+LEGACY_ZLIB_HEADER = 0x78
+
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "json")
+PAYLOAD_COMPRESSION = os.getenv("PAYLOAD_COMPRESSION", "zlib")
+PAYLOAD_ZSTD_LEVEL = int(os.getenv("PAYLOAD_ZSTD_LEVEL", 3))
+PAYLOAD_ZSTD_DICT_PATH = os.getenv("PAYLOAD_ZSTD_DICT_PATH")
+
+# Content encodings wire payloads may be stored in, in order of preference. Empty stores none
+WIRE_ENCODINGS = [e.strip() for e in os.getenv("WIRE_ENCODINGS", "zstd,gzip").split(",") if e.strip()]
+
+class CodecUnavailable(Exception):
+    pass
+
+class _Entry:
+    def __init__(self, id: int, name: str, dump: Callable, load: Callable, available: bool = True):
+        self.id = id
+        self.name = name
+        self.dump = dump
+        self.load = load
+        self.available = available
+
+_formats_by_id: dict[int, _Entry] = {}
+_formats_by_name: dict[str, _Entry] = {}
+_compressions_by_id: dict[int, _Entry] = {}
+_compressions_by_name: dict[str, _Entry] = {}
+
+def register_format(id: int, name: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any], available: bool = True):
+    """
+    Ids are written into every payload, never reuse one for a different format
+    """
+    if not 0 <= id < 8:
+        raise ValueError("format id must be between 0 and 7")
+    entry = _Entry(id, name, dumps, loads, available)
+    _formats_by_id[id] = entry
+    _formats_by_name[name] = entry
+
+def register_compression(id: int, name: str, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes], available: bool = True):
+    """
+    Ids are written into every payload, never reuse one for a different compression
+    """
+    if not 0 <= id < 8:
+        raise ValueError("compression id must be between 0 and 7")
+    entry = _Entry(id, name, compress, decompress, available)
+    _compressions_by_id[id] = entry
+    _compressions_by_name[name] = entry
+
+def _unavailable(name: str) -> Callable:
+    def fail(*args, **kwargs):
+        raise CodecUnavailable(f"{name} is not installed")
+    return fail
+
+# Formats. orjson writes the same json, so it only changes speed, not the format id
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    register_format(0, "json", lambda data: orjson.dumps(data, option=_ORJSON_OPTIONS), orjson.loads)
+else:
+    register_format(0, "json", lambda data: json.dumps(data).encode(), json.loads)
+
+if msgpack is not None:
+    register_format(1, "msgpack", lambda data: msgpack.packb(data, use_bin_type=True), lambda body: msgpack.unpackb(body, raw=False, strict_map_key=False))
+else:
+    register_format(1, "msgpack", _unavailable("msgpack"), _unavailable("msgpack"), available=False)
+
+# Compressions
+register_compression(0, "none", lambda body: body, lambda body: body)
+register_compression(1, "zlib", zlib.compress, zlib.decompress)
+
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    register_compression(2, "zstd", _zstd_compressor.compress, _zstd_decompressor.decompress)
+else:
+    register_compression(2, "zstd", _unavailable("zstandard"), _unavailable("zstandard"), available=False)
+
+if lz4_frame is not None:
+    register_compression(3, "lz4", lz4_frame.compress, lz4_frame.decompress)
+else:
+    register_compression(3, "lz4", _unavailable("lz4"), _unavailable("lz4"), available=False)
+
+def load_zstd_dictionary(dictionary: bytes):
+    """
+    Register zstd-dict, compressing with a dictionary trained by train_zstd_dictionary. Every process reading these
+    payloads must load the same dictionary
+    """
+    if zstandard is None:
+        raise CodecUnavailable("zstandard is not installed")
+
+    zstd_dict = zstandard.ZstdCompressionDict(dictionary)
+    compressor = zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL, dict_data=zstd_dict)
+    decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+    register_compression(4, "zstd-dict", compressor.compress, decompressor.decompress)
+
+def train_zstd_dictionary(samples: list[bytes], size: int = 16384) -> bytes:
+    """
+    Train a zstd dictionary on encoded but uncompressed sample payloads
+    """
+    if zstandard is None:
+        raise CodecUnavailable("zstandard is not installed")
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+if PAYLOAD_ZSTD_DICT_PATH and zstandard is not None:
+    with open(PAYLOAD_ZSTD_DICT_PATH, "rb") as f:
+        load_zstd_dictionary(f.read())
+else:
+    register_compression(4, "zstd-dict", _unavailable("zstd dictionary"), _unavailable("zstd dictionary"), available=False)
+
+class Codec:
+    def __init__(self, format: str = PAYLOAD_FORMAT, compression: str = PAYLOAD_COMPRESSION):
+        if format not in _formats_by_name:
+            raise ValueError(f"Unknown payload format: {format}")
+        if compression not in _compressions_by_name:
+            raise ValueError(f"Unknown payload compression: {compression}")
+
+        self.format = _formats_by_name[format]
+        self.compression = _compressions_by_name[compression]
+        if not self.format.available or not self.compression.available:
+            raise CodecUnavailable(f"Payload codec {format}+{compression} is not installed")
+
+        self.header = bytes([HEADER_PREFIX | self.format.id << 3 | self.compression.id])
+
+    def encode(self, data: Any) -> bytes:
+        return self.header + self.compression.dump(self.format.dump(data))
+
+    def decode(self, payload: bytes) -> Any:
+        # Any registered codec can be read, not only this one
+        return decode(payload)
+
+def decode(payload: bytes) -> Any:
+    header = payload[0]
+
+    if header == LEGACY_ZLIB_HEADER:
+        return _formats_by_id[0].load(zlib.decompress(payload))
+
+    if header & HEADER_PREFIX != HEADER_PREFIX:
+        raise ValueError(f"Unknown payload header: {header:#x}")
+
+    format = _formats_by_id.get(header >> 3 & 0x07)
+    compression = _compressions_by_id.get(header & 0x07)
+    if format is None or compression is None:
+        raise ValueError(f"Unknown payload header: {header:#x}")
+    return format.load(compression.load(payload[1:]))
+
+def available_codecs() -> list[str]:
+    return [
+        f"{format.name}+{compression.name}"
+        for format in _formats_by_name.values() if format.available
+        for compression in _compressions_by_name.values() if compression.available
+    ]
+
+_default_codec: Codec | None = None
+
+def get_codec() -> Codec:
+    # Configured once per process from PAYLOAD_FORMAT and PAYLOAD_COMPRESSION
+    global _default_codec
+    if _default_codec is None:
+        _default_codec = Codec()
+    return _default_codec
+
+# Wire encodings. No header byte and no dictionary, http clients decode these themselves
+_wire_compressors: dict[str, Callable[[bytes], bytes]] = {
+    # mtime=0 keeps the bytes, and so etags of them, stable
+    "gzip": lambda body: gzip.compress(body, mtime=0),
+}
+if zstandard is not None:
+    _wire_compressors["zstd"] = zstandard.ZstdCompressor(level=PAYLOAD_ZSTD_LEVEL).compress
+
+def wire_encodings() -> list[str]:
+    # Only the first available one is stored, every wire payload is another full copy of the result's histories
+    return [encoding for encoding in WIRE_ENCODINGS if encoding in _wire_compressors][:1]
+
+def wire_encode(data: Any) -> dict[str, bytes]:
+    """
+    Serialize data to json once and compress it in every available wire encoding
+    """
+
+    encodings = wire_encodings()
+    if not encodings:
+        return {}
+    body = _formats_by_name["json"].dump(data)
+    return {encoding: _wire_compressors[encoding](body) for encoding in encodings}
+
+def unavailable_codecs() -> list[str]:
+    """
+    Optional codec packages that are not installed, with what falls back without them
+    """
+
+    missing = []
+    if orjson is None:
+        missing.append("orjson (json payloads use the stdlib encoder)")
+    if msgpack is None:
+        missing.append("msgpack (PAYLOAD_FORMAT=msgpack fails)")
+    if zstandard is None:
+        missing.append("zstandard (PAYLOAD_COMPRESSION=zstd fails, no zstd wire payloads)")
+    if lz4_frame is None:
+        missing.append("lz4 (PAYLOAD_COMPRESSION=lz4 fails)")
+    return missing
+
+def log_codec_availability():
+    # Called once at process startup, so a missing optional package shows up in the logs instead of silently
+    for name in unavailable_codecs():
+        logger.warning(f"Codec unavailable, install the codecs extra: {name}")
+
+    skipped = [encoding for encoding in WIRE_ENCODINGS if encoding not in _wire_compressors]
+    if skipped:
+        logger.warning(f"WIRE_ENCODINGS {', '.join(skipped)} unavailable, wire payloads are stored as {', '.join(wire_encodings()) or 'none'}")
+
+def negotiate_wire_encoding(accept_encoding: str | None) -> str | None:
+    """
+    Preferred wire encoding the client accepts, None when it accepts none of them
+    """
+
+    if not accept_encoding:
+        return None
+
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+
+    for encoding in wire_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
@@ -0,0 +1,126 @@
+"""
+This module creates the compact columnar encoding of price histories used in storage and transport.
+
+A history is a 20 byte header (version, price encoding, point count, first timestamp, fidelity step) followed by two
+columns: int32 timestamp deltas minus the step, all zeros at a regular fidelity, and prices as uint16 basis points or
+float32. Columns decode straight from the buffer into numpy arrays. In json payloads the bytes travel base64 encoded
+as {"encoding": "columnar-v1", "data": "..."}, or as {"encoding": "columnar-v1", "ref": "..."} naming a blob stored
+once by its content hash.
+"""
+
+import base64
+import os
+import struct
+
+import numpy as np
+
+HISTORY_ENCODING = "columnar-v1"
+HISTORY_PRICE_ENCODING = os.getenv("HISTORY_PRICE_ENCODING", "bp")
+
+_VERSION = 1
+_HEADER = struct.Struct("<BBxxIqi")
+_PRICE_DTYPES = {0: np.dtype("<u2"), 1: np.dtype("<f4")}
+_PRICE_IDS = {"bp": 0, "f32": 1}
+
+def encode_history(history: dict, price_encoding: str = HISTORY_PRICE_ENCODING) -> bytes:
+    """
+    Encode a wide {'t': [...], 'p': [...]} history. price_encoding is bp, uint16 basis points, or f32
+    """
+
+    t = np.asarray(history['t'], dtype=np.int64)
+    p = np.asarray(history['p'], dtype=np.float64)
+    price_id = _PRICE_IDS[price_encoding]
+
+    if len(t):
+        gaps = np.diff(t)
+        # The most common gap is the fidelity step, so a regular series stores only zeros
+        if len(gaps):
+            values, counts = np.unique(gaps, return_counts=True)
+            step = int(values[counts.argmax()])
+        else:
+            step = 0
+        residuals = np.concatenate(([0], gaps - step)).astype("<i4")
+        t0 = int(t[0])
+    else:
+        step = 0
+        residuals = np.empty(0, dtype="<i4")
+        t0 = 0
+
+    if price_id == 0:
+        prices = np.rint(np.clip(p, 0.0, 1.0) * 10000).astype(_PRICE_DTYPES[0])
+    else:
+        prices = p.astype(_PRICE_DTYPES[1])
+
+    header = _HEADER.pack(_VERSION, price_id, len(t), t0, step)
+    return header + residuals.tobytes() + prices.tobytes()
+
+def decode_history(data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (timestamps, prices) arrays. float32 prices are a view on data, basis points are scaled to float64
+    """
+
+    version, price_id, count, t0, step = _HEADER.unpack_from(data)
+    if version != _VERSION:
+        raise ValueError(f"Unknown history encoding version: {version}")
+
+    residuals = np.frombuffer(data, dtype="<i4", count=count, offset=_HEADER.size)
+    prices = np.frombuffer(data, dtype=_PRICE_DTYPES[price_id], count=count, offset=_HEADER.size + 4 * count)
+
+    t = t0 + np.arange(count, dtype=np.int64) * step + np.cumsum(residuals, dtype=np.int64)
+    if price_id == 0:
+        prices = prices / 10000
+
+    return t, prices
+
+def pack_history(history: dict | list) -> dict | list:
+    """
+    Wrap a wide history for json payloads. Empty and already packed histories are returned as is
+    """
+
+    if not history or is_packed(history):
+        return history
+    return packed_from_bytes(encode_history(history)) #type: ignore
+
+def is_packed(history) -> bool:
+    return isinstance(history, dict) and history.get("encoding") == HISTORY_ENCODING and "data" in history
+
+def history_ref(digest: str) -> dict:
+    return {"encoding": HISTORY_ENCODING, "ref": digest}
+
+def is_history_ref(history) -> bool:
+    return isinstance(history, dict) and history.get("encoding") == HISTORY_ENCODING and "ref" in history
+
+def packed_from_bytes(data: bytes) -> dict:
+    return {"encoding": HISTORY_ENCODING, "data": base64.b64encode(data).decode()}
+
+def unpack_history(history: dict | list) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (timestamps, prices) arrays of a packed or wide history
+    """
+
+    if not history:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    if is_packed(history):
+        return decode_history(base64.b64decode(history["data"])) #type: ignore
+    return np.asarray(history["t"], dtype=np.int64), np.asarray(history["p"], dtype=np.float64) #type: ignore
+
+def history_to_lists(history: dict | list) -> dict | list:
+    """
+    Wide {'t': [...], 'p': [...]} form of a packed history, for clients that do not decode the columnar form
+    """
+
+    if not is_packed(history):
+        return history
+    t, p = unpack_history(history)
+    return {'t': t.tolist(), 'p': p.tolist()}
+
+def map_histories(tree, fn):
+    """
+    Apply fn to every 'history' in a tree, tree delta or list of them, returning a new structure
+    """
+
+    if isinstance(tree, list):
+        return [map_histories(item, fn) for item in tree]
+    if isinstance(tree, dict):
+        return {k: fn(v) if k == 'history' else map_histories(v, fn) for k, v in tree.items()}
+    return tree
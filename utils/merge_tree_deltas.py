@@ -0,0 +1,19 @@
+def merge_tree_deltas(tree: dict, patch: dict | list) -> dict:
+    """
+    Merge a delta, or a list of them in order, into tree in place. Nested dicts of the deltas are adopted rather
+    than copied, so merged deltas must not be reused
+    """
+
+    if isinstance(patch, list):
+        for single_patch in patch:
+            merge_tree_deltas(tree, single_patch)
+        return tree
+
+    for key, patch_value in patch.items():
+        tree_value = tree.get(key)
+        if isinstance(tree_value, dict) and isinstance(patch_value, dict):
+            merge_tree_deltas(tree_value, patch_value)
+        else:
+            tree[key] = patch_value
+
+    return tree